@@ -0,0 +1,79 @@
+"""
+ann_recall.py
+Recall-vs-latency comparison of the ANN index types against the flat (exact) baseline
+
+Uses synthetic clustered vectors with the embedding model's dimension, so no model is loaded.
+
+Usage:
+    python -m benchmarks.ann_recall --vectors 200000 --queries 500 --k 10
+"""
+import argparse
+import time
+import numpy as np
+from src.data import index_factory
+
+def clustered_vectors(count: int, dimension: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Gaussian blobs around random centers, closer to real embeddings than uniform noise"""
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    noise = 0.3 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return centers[labels] + noise
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def timed_search(index, queries: np.ndarray, k: int):
+    """Search one query at a time, as VectorStore.search does; returns (ids, mean latency ms)"""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        _, ids[i] = index.search(query.reshape(1, -1), k)
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(0)
+    data = clustered_vectors(args.vectors, args.dimension, clusters=args.nlist, rng=rng)
+    queries = clustered_vectors(args.queries, args.dimension, clusters=args.nlist, rng=rng)
+    
+    flat = index_factory.create_index(args.dimension, "flat")
+    flat.add(data)
+    truth, flat_latency = timed_search(flat, queries, args.k)
+    
+    print(f"{'index':<12}{'param':<14}{'build s':>10}{f'recall@{args.k}':>12}{'ms/query':>10}{'speedup':>10}")
+    print(f"{'flat':<12}{'-':<14}{0.0:>10.2f}{1.0:>12.3f}{flat_latency:>10.3f}{1.0:>10.2f}")
+    
+    sweeps = [
+        ("ivf_flat", "nprobe", args.nprobe),
+        ("ivf_pq", "nprobe", args.nprobe),
+        ("hnsw", "efSearch", args.ef_search),
+    ]
+    for index_type, param, values in sweeps:
+        start = time.perf_counter()
+        index = index_factory.create_index(args.dimension, index_type, nlist=args.nlist)
+        if index_factory.requires_training(index_type):
+            index.train(data)
+        index.add(data)
+        build_time = time.perf_counter() - start
+        
+        for value in values:
+            if param == "nprobe":
+                index_factory.configure_search(index, nprobe=value)
+            else:
+                index_factory.configure_search(index, ef_search=value)
+            ids, latency = timed_search(index, queries, args.k)
+            print(f"{index_type:<12}{f'{param}={value}':<14}{build_time:>10.2f}"
+                  f"{recall_at_k(ids, truth):>12.3f}{latency:>10.3f}{flat_latency / latency:>10.2f}")
+
+if __name__ == "__main__":
+    main()
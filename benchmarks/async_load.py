@@ -0,0 +1,77 @@
+"""
+async_load.py
+Load test of QAEngine.aget_answer with many concurrent questions and a local stub LLM
+
+Builds a throwaway vector store from synthetic chunks (the configured store is not touched),
+then compares answering the questions one after another with answering them concurrently.
+Caches are disabled so every question goes through embedding, search and the LLM.
+
+Usage:
+    python -m benchmarks.async_load --questions 200 --concurrency 50 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+# Isolate the benchmark from the real store and API before any src module reads the config
+os.environ["VECTOR_STORE_PATH"] = tempfile.mkdtemp(prefix="documentmentor-load-")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+os.environ.update(QUERY_CACHE_SIZE="0", ANSWER_CACHE_SIZE="0", SEMANTIC_CACHE_ENABLED="False")
+
+from src.core.document_processor import ProcessedDocument
+from src.core.qa_engine import QAEngine
+from src.core.stub_llm import StubChatModel
+from src.data.vector_store import VectorStore
+from benchmarks.corpus import synthetic_chunks
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+async def timed_answer(engine: QAEngine, question: str, latencies: list) -> None:
+    start = time.perf_counter()
+    response = await engine.aget_answer(question)
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    latencies.append(time.perf_counter() - start)
+
+async def run(engine: QAEngine, questions: list, concurrency: int) -> tuple:
+    """Answer all questions keeping at most `concurrency` in flight"""
+    latencies = []
+    pending = set()
+    start = time.perf_counter()
+    for question in questions:
+        if len(pending) >= concurrency:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        pending.add(asyncio.ensure_future(timed_answer(engine, question, latencies)))
+    await asyncio.gather(*pending)
+    return time.perf_counter() - start, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stub LLM seconds to first token")
+    args = parser.parse_args()
+    
+    vector_store = VectorStore()
+    vector_store.add_document(ProcessedDocument(
+        id="load-test", title="load-test", content="",
+        chunks=synthetic_chunks(args.chunks, 1000), total_pages=0, source_path=Path("load-test")
+    ))
+    engine = QAEngine(vector_store, llm=StubChatModel(latency=args.llm_latency, token_latency=0.0))
+    questions = [f"pregunta {i} " + chunk[:80] for i, chunk in enumerate(synthetic_chunks(args.questions, 100, seed=1))]
+    
+    print(f"{'concurrency':>12}{'wall s':>10}{'q/sec':>10}{'p50 s':>10}{'p95 s':>10}")
+    for concurrency in args.concurrency:
+        wall, latencies = asyncio.run(run(engine, questions, concurrency))
+        print(f"{concurrency:>12}{wall:>10.2f}{len(questions) / wall:>10.1f}"
+              f"{statistics.median(latencies):>10.3f}{percentile(latencies, 0.95):>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+compact_vectors.py
+Memory per chunk, ingest throughput and recall of the compact vector modes and embedding backends
+
+Each configuration (embedding backend x VECTOR_PRECISION, plus the quantized precisions without
+re-ranking) ingests the same synthetic chunks into its own throwaway store, in a fresh interpreter,
+then runs dense searches:
+
+  chunks/s   ingest throughput (embedding + indexing + saving)
+  B/chunk    serialized size of the in-memory FAISS index per chunk (the float32 vectors on disk
+             used for re-ranking are memory-mapped, not held in RAM)
+  recall@k   against exact float32 search over the same embeddings: what the compact index loses
+  vs base    overlap with the results of the float32 / torch run: also counts the embedding drift
+             of a quantized or ONNX model
+  p50 ms     median latency of VectorStore.search in dense mode
+
+The configured store and API are not touched. The onnx backend needs optimum[onnxruntime];
+without it the child falls back to torch, as the app does, and the row says so.
+
+Usage:
+    python -m benchmarks.compact_vectors --chunks 20000 --queries 200 --k 5
+    python -m benchmarks.compact_vectors --backends torch torch-int8 onnx --precisions float32 int8
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from benchmarks.shared_sessions import isolate
+
+def run_child(chunks: int, chunk_size: int, queries: int, k: int) -> None:
+    """Ingest, measure and search in this interpreter; prints the results as JSON"""
+    import faiss
+    from src.core.document_processor import ProcessedDocument
+    from src.data.vector_store import VectorStore
+    from benchmarks.corpus import synthetic_chunks
+
+    store = VectorStore()
+    store.embeddings.load()
+    texts = synthetic_chunks(chunks, chunk_size)
+    start = time.perf_counter()
+    store.add_document(ProcessedDocument(
+        id="compact", title="compact", content="",
+        chunks=texts, total_pages=0, source_path=Path("compact")
+    ))
+    ingest = time.perf_counter() - start
+
+    vectors = store.store.get_vectors(np.arange(store.store.next_id))
+    latencies, found, recalls = [], [], []
+    for question in synthetic_chunks(queries, 100, seed=1):
+        start = time.perf_counter()
+        results = store.search(question, k=k, mode="dense")
+        latencies.append(time.perf_counter() - start)
+        ids = [result["id"] for result in results]
+        query = store.embed_query(question)
+        truth = np.argsort(((vectors - query) ** 2).sum(axis=1), kind='stable')[:k]
+        recalls.append(len(set(ids) & set(truth.tolist())) / k)
+        found.append(ids)
+
+    print(json.dumps({
+        "backend": store.embeddings.backend,
+        "chunks_per_s": chunks / ingest,
+        "bytes_per_chunk": len(faiss.serialize_index(store.index)) / store.index.ntotal,
+        "recall": statistics.mean(recalls),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "ids": found
+    }))
+
+def overlap(found: list, baseline: list) -> float:
+    return statistics.mean(len(set(f) & set(b)) / max(len(b), 1) for f, b in zip(found, baseline))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000, help="Synthetic chunks ingested per configuration")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Characters per chunk")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"])
+    parser.add_argument("--precisions", nargs="+", default=["float32", "float16", "int8"])
+    parser.add_argument("--rerank-factor", type=int, default=4, help="RERANK_FACTOR of the compact rows")
+    parser.add_argument("--index-type", default="flat", help="FAISS_INDEX_TYPE of every configuration")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.chunks, args.chunk_size, args.queries, args.k)
+        return
+
+    # (backend, precision, rerank factor); the first one is the baseline
+    configs = [("torch", "float32", args.rerank_factor)]
+    configs += [(backend, precision, args.rerank_factor) for backend in args.backends
+                for precision in args.precisions if (backend, precision) != ("torch", "float32")]
+    configs += [("torch", precision, 0) for precision in args.precisions if precision != "float32"]
+
+    rows = []
+    for backend, precision, rerank in configs:
+        with tempfile.TemporaryDirectory(prefix="documentmentor-compact-") as workdir:
+            isolate(Path(workdir))
+            env = dict(os.environ, EMBEDDING_BACKEND=backend, VECTOR_PRECISION=precision,
+                       RERANK_FACTOR=str(rerank), FAISS_INDEX_TYPE=args.index_type,
+                       EMBEDDING_CACHE_ENABLED="False")
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.compact_vectors", "--child",
+                 "--chunks", str(args.chunks), "--chunk-size", str(args.chunk_size),
+                 "--queries", str(args.queries), "--k", str(args.k)],
+                check=True, capture_output=True, text=True, env=env
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        loaded = backend if result["backend"] == backend else f"{backend}->torch"
+        rows.append((loaded, precision, rerank if precision != "float32" else "-", result))
+
+    baseline = rows[0][3]
+    print(f"{'backend':<18}{'precision':<11}{'rerank':>7}{'chunks/s':>10}{'x':>6}{'B/chunk':>9}{'x':>6}"
+          f"{f'recall@{args.k}':>10}{'vs base':>9}{'p50 ms':>8}")
+    for backend, precision, rerank, result in rows:
+        print(f"{backend:<18}{precision:<11}{rerank:>7}"
+              f"{result['chunks_per_s']:>10.1f}{result['chunks_per_s'] / baseline['chunks_per_s']:>6.2f}"
+              f"{result['bytes_per_chunk']:>9.0f}{result['bytes_per_chunk'] / baseline['bytes_per_chunk']:>6.2f}"
+              f"{result['recall']:>10.3f}{overlap(result['ids'], baseline['ids']):>9.3f}{result['p50_ms']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
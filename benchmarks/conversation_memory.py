@@ -0,0 +1,81 @@
+"""
+conversation_memory.py
+Prompt size and answer latency as a conversation grows: unbounded buffer versus window + summary
+
+  buffer   every earlier message goes into the prompt, as ConversationBufferMemory would do
+  summary  MemoryManager: the last MEMORY_WINDOW_MESSAGES messages within MEMORY_TOKEN_BUDGET,
+           plus a rolling summary updated in the background every MEMORY_SUMMARY_BATCH messages
+
+For each turn it records the history tokens sent to the LLM and the latency of
+QAEngine.get_answer with the stub LLM, and prints them at a few turn counts (latency averaged
+over the preceding turns). The stub's latency does not depend on the prompt, so history tokens
+stand in for the LLM's cost and time to first token. Runs over a throwaway store and database;
+the configured ones are not touched.
+
+Usage:
+    python -m benchmarks.conversation_memory --turns 200 --chunks 2000
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.shared_sessions import build_store, isolate
+
+CHECKPOINTS = (1, 10, 25, 50, 100, 200, 500, 1000)
+
+def run(engine, memory, conversation_id: str, questions: list) -> tuple:
+    """Ask every question in one conversation; returns history tokens and latency per turn"""
+    from src.core.context_builder import count_tokens
+    tokens, latencies = [], []
+    for question in questions:
+        tokens.append(count_tokens(memory.load(conversation_id).render()))
+        start = time.perf_counter()
+        response = engine.get_answer(question, conversation_id)
+        latencies.append(time.perf_counter() - start)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+    memory.wait_idle()
+    return tokens, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200, help="Questions per conversation")
+    parser.add_argument("--chunks", type=int, default=2000, help="Synthetic chunks in the throwaway store")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Stub LLM seconds to first token")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="documentmentor-memory-") as workdir:
+        isolate(Path(workdir))
+        build_store(args.chunks)
+
+        from src.core.memory_manager import MemoryManager
+        from src.core.qa_engine import QAEngine
+        from src.core.stub_llm import StubChatModel
+        from src.data.database import Database
+        from src.data.vector_store import VectorStore
+        from benchmarks.corpus import synthetic_chunks
+
+        llm = StubChatModel(latency=args.llm_latency, token_latency=0.0)
+        database = Database()
+        vector_store = VectorStore()
+        questions = synthetic_chunks(args.turns, 100, seed=1)
+        memories = {
+            "buffer": MemoryManager(database, llm, window=10 ** 9, token_budget=10 ** 9),
+            "summary": MemoryManager(database, llm),
+        }
+        results = {}
+        for mode, memory in memories.items():
+            engine = QAEngine(vector_store, llm=llm, memory=memory)
+            results[mode] = run(engine, memory, mode, questions)
+
+        print(f"{'turn':>6}" + "".join(f"{f'{mode} tokens':>16}{f'{mode} ms':>12}" for mode in results))
+        for turn in [t for t in CHECKPOINTS if t <= args.turns]:
+            row = f"{turn:>6}"
+            for tokens, latencies in results.values():
+                window = latencies[max(0, turn - 10):turn]
+                row += f"{tokens[turn - 1]:>16}{statistics.mean(window) * 1000:>12.2f}"
+            print(row)
+
+if __name__ == "__main__":
+    main()
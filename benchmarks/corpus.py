@@ -0,0 +1,25 @@
+"""
+corpus.py
+Synthetic text shared by the benchmarks
+"""
+import random
+
+WORDS = (
+    "python funcion clase objeto indice vector base datos consulta servidor cliente "
+    "memoria proceso hilo red protocolo archivo modulo paquete prueba error excepcion "
+    "algoritmo estructura lista diccionario cadena entero flotante compilador interprete"
+).split()
+
+def synthetic_chunks(count: int, chunk_size: int, seed: int = 0) -> list:
+    """Generate pseudo-technical text chunks of roughly chunk_size characters"""
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        words = []
+        length = 0
+        while length < chunk_size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        chunks.append(" ".join(words))
+    return chunks
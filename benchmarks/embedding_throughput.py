@@ -0,0 +1,50 @@
+"""
+embedding_throughput.py
+Compares chunk embedding throughput of the per-chunk loop against batched ingestion
+
+Usage:
+    python -m benchmarks.embedding_throughput --chunks 512 --batch-sizes 16 32 64 128
+"""
+import argparse
+import time
+import numpy as np
+from src.data.local_embeddings import LocalEmbeddings
+from benchmarks.corpus import synthetic_chunks
+
+def bench_per_chunk(embeddings: LocalEmbeddings, chunks: list) -> float:
+    """Baseline: one forward pass per chunk, list round-trip into numpy"""
+    start = time.perf_counter()
+    vectors = [embeddings.embed_query(chunk) for chunk in chunks]
+    np.array(vectors, dtype='float32')
+    return time.perf_counter() - start
+
+def bench_batched(embeddings: LocalEmbeddings, chunks: list, batch_size: int) -> float:
+    """Batched path used by VectorStore.add_document"""
+    start = time.perf_counter()
+    for i in range(0, len(chunks), batch_size):
+        embeddings.embed_documents_array(chunks[i:i + batch_size], batch_size)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=512, help="Number of synthetic chunks")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Characters per chunk")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 32, 64, 128])
+    args = parser.parse_args()
+    
+    chunks = synthetic_chunks(args.chunks, args.chunk_size)
+    embeddings = LocalEmbeddings()
+    embeddings.embed_documents_array(chunks[:8])  # warm-up
+    
+    elapsed = bench_per_chunk(embeddings, chunks)
+    baseline = len(chunks) / elapsed
+    print(f"{'mode':<16}{'seconds':>10}{'chunks/sec':>14}{'speedup':>10}")
+    print(f"{'per-chunk':<16}{elapsed:>10.2f}{baseline:>14.1f}{1.0:>10.2f}")
+    
+    for batch_size in args.batch_sizes:
+        elapsed = bench_batched(embeddings, chunks, batch_size)
+        rate = len(chunks) / elapsed
+        print(f"{f'batch={batch_size}':<16}{elapsed:>10.2f}{rate:>14.1f}{rate / baseline:>10.2f}")
+
+if __name__ == "__main__":
+    main()
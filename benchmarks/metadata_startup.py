@@ -0,0 +1,123 @@
+"""
+metadata_startup.py
+Startup time and RSS of the legacy JSON document_map versus the memory-mapped chunk log
+
+Builds a synthetic corpus in both formats, then loads each one in a fresh subprocess and
+performs random lookups, as VectorStore.search does for its top-k results.
+
+Usage:
+    python -m benchmarks.metadata_startup --chunks 1000000 --chunk-size 800
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from pathlib import Path
+from src.data.segment_store import SegmentStore, ChunkMetadataMap
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB, so memory freed after loading is not counted
+
+    Where /proc is not available, the peak one (what the process needed while loading) is reported.
+    """
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        # ru_maxrss is KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def synthetic_records(start: int, count: int, chunk_size: int):
+    rng = random.Random(start)
+    alphabet = "abcdefghijklmnopqrstuvwxyz      "
+    for i in range(start, start + count):
+        yield {
+            'doc_id': f"doc-{i // 500}",
+            'chunk': "".join(rng.choices(alphabet, k=chunk_size)),
+            'title': f"Manual {i // 500}"
+        }
+
+def build_corpus(path: Path, chunks: int, chunk_size: int, batch: int = 50_000) -> None:
+    """Write the same corpus as document_map.json and as a segment store"""
+    store = SegmentStore(path / "segments_store", compact_threshold=10 ** 9)
+    with open(path / "document_map.json", 'w', encoding='utf-8') as f:
+        f.write("{")
+        for start in range(0, chunks, batch):
+            count = min(batch, chunks - start)
+            records = list(synthetic_records(start, count, chunk_size))
+            # Metadata is what is being measured, so tiny placeholder vectors are enough
+            store.append(np.zeros((count, 1), dtype=np.float32), records)
+            for i, record in enumerate(records, start):
+                f.write(("," if i else "") + json.dumps(str(i)) + ":" + json.dumps(record, ensure_ascii=False))
+        f.write("}")
+
+def run_child(mode: str, path: Path, lookups: int) -> None:
+    """Load one format and print timings as JSON (runs in a fresh interpreter)"""
+    base_rss = rss_mb()
+    start = time.perf_counter()
+    if mode == "json":
+        with open(path / "document_map.json", 'r', encoding='utf-8') as f:
+            document_map = json.load(f)
+    else:
+        document_map = ChunkMetadataMap(SegmentStore(path / "segments_store"))
+    startup = time.perf_counter() - start
+
+    ids = random.Random(1).sample(range(len(document_map)), lookups)
+    start = time.perf_counter()
+    for i in ids:
+        document_map[str(i)]['chunk']
+    lookup_us = (time.perf_counter() - start) * 1e6 / lookups
+
+    print(json.dumps({
+        "mode": mode,
+        "startup_s": startup,
+        "rss_mb": rss_mb() - base_rss,
+        "lookup_us": lookup_us
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--path", type=Path, help="Reuse/keep the corpus in this directory")
+    parser.add_argument("--child", choices=["json", "mmap"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.path, args.lookups)
+        return
+
+    tmp = None
+    path = args.path
+    if path is None:
+        tmp = tempfile.TemporaryDirectory()
+        path = Path(tmp.name)
+    path.mkdir(parents=True, exist_ok=True)
+
+    if not (path / "document_map.json").exists():
+        print(f"Building synthetic corpus of {args.chunks} chunks in {path}...")
+        build_corpus(path, args.chunks, args.chunk_size)
+
+    print(f"{'format':<10}{'startup s':>12}{'RSS MB':>10}{'lookup us':>12}")
+    for mode in ("json", "mmap"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.metadata_startup", "--child", mode,
+             "--path", str(path), "--lookups", str(args.lookups)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<10}{result['startup_s']:>12.3f}{result['rss_mb']:>10.1f}{result['lookup_us']:>12.1f}")
+
+    if tmp is not None:
+        tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+pdf_extraction.py
+Compares PDF extraction + chunking strategies on large multi-hundred-page PDFs
+
+  legacy     single thread, `text +=` concatenation, chunking after the full text is built
+  sequential single thread, pages joined once (what process_pdf does below the threshold)
+  streaming  DocumentProcessor.stream_pdf: process pool + incremental chunking
+
+Without --pdf a synthetic text PDF is generated.
+
+Usage:
+    python -m benchmarks.pdf_extraction --pages 400
+    python -m benchmarks.pdf_extraction --pdf manual.pdf
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from pypdf import PdfReader
+from src.core.document_processor import DocumentProcessor, _extract_page_range
+from benchmarks.corpus import WORDS
+
+def write_synthetic_pdf(path: Path, pages: int, lines_per_page: int = 50, seed: int = 0) -> None:
+    """Write a minimal uncompressed PDF with `pages` pages of Helvetica text"""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_numbers = []
+    for _ in range(pages):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        text = "".join(f"({line}) '\n" for line in lines)
+        stream = f"BT /F1 10 Tf 40 800 Td 14 TL\n{text}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_number = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_number
+        )
+        page_numbers.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % n for n in page_numbers)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(output))
+
+def legacy(processor: DocumentProcessor, path: Path) -> tuple:
+    reader = PdfReader(str(path))
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text() + "\n"
+    chunks = processor.text_splitter.split_text(text)
+    return len(reader.pages), len(chunks), None
+
+def sequential(processor: DocumentProcessor, path: Path) -> tuple:
+    total_pages = len(PdfReader(str(path)).pages)
+    text = "".join(_extract_page_range(str(path), 0, total_pages))
+    return total_pages, len(processor.text_splitter.split_text(text)), None
+
+def streaming(processor: DocumentProcessor, path: Path) -> tuple:
+    doc = processor.stream_pdf(path)
+    start = time.perf_counter()
+    first_chunk = None
+    count = 0
+    for _ in doc.chunks:
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - start
+        count += 1
+    return doc.total_pages, count, first_chunk
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", type=Path, help="PDF to benchmark (default: synthetic)")
+    parser.add_argument("--pages", type=int, default=400, help="Pages of the synthetic PDF")
+    args = parser.parse_args()
+
+    tmp = None
+    path = args.pdf
+    if path is None:
+        tmp = tempfile.TemporaryDirectory()
+        path = Path(tmp.name) / "synthetic.pdf"
+        write_synthetic_pdf(path, args.pages)
+
+    processor = DocumentProcessor()
+    print(f"{'mode':<12}{'pages':>7}{'chunks':>8}{'seconds':>10}{'pages/sec':>11}{'1st chunk s':>13}")
+    for name, run in (("legacy", legacy), ("sequential", sequential), ("streaming", streaming)):
+        start = time.perf_counter()
+        pages, chunks, first_chunk = run(processor, path)
+        elapsed = time.perf_counter() - start
+        first = f"{first_chunk:.2f}" if first_chunk is not None else "-"
+        print(f"{name:<12}{pages:>7}{chunks:>8}{elapsed:>10.2f}{pages / elapsed:>11.1f}{first:>13}")
+
+    if tmp is not None:
+        tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+retrieval_eval.py
+Retrieval quality and latency of VectorStore.search and QAEngine over a labelled query set
+
+Builds a throwaway store (the configured store and embedding cache are not touched) and reports:
+
+  ingest     chunks/sec of chunking + embedding + saving, and peak RSS
+  search     recall@k, MRR and p50/p95/p99 latency per search mode (dense, keyword, hybrid)
+  context    prompt context per question: tokens, answer coverage (share of questions whose answer
+             passage is in the context) and build time, for the previous top-3 concatenation and for
+             ContextBuilder (MMR over CONTEXT_CANDIDATES, overlap trimmed, CONTEXT_TOKEN_BUDGET)
+  qa         p50/p95/p99 latency of QAEngine.get_answer with the stub LLM
+
+A query counts as answered at rank r when the r-th chunk contains its labelled answer passage
+(whitespace-insensitive); recall@k is the share of queries answered within the top k. Queries
+whose passage was split across chunks by the chunker can never be answered and are reported as
+"unanswerable", which is what a CHUNK_SIZE / CHUNK_OVERLAP change usually moves.
+
+Without --pdf a synthetic corpus with planted facts (function names, error codes, settings) and
+one question per fact is generated. With --pdf, --queries is a JSONL file of
+{"question": ..., "answer": ...} lines whose answer is a passage copied from the PDFs.
+
+Usage:
+    python -m benchmarks.retrieval_eval --docs 50 --k 1 3 10 --json results.json
+    python -m benchmarks.retrieval_eval --chunk-size 500 --chunk-overlap 100 --index-type hnsw
+    python -m benchmarks.retrieval_eval --pdf manuals/ --queries manuals/queries.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.corpus import WORDS, synthetic_chunks
+
+MODES = ("dense", "keyword", "hybrid")
+
+FACTS = (
+    ("La funcion {ident} del modulo {module} devuelve un {type} con el resultado de la consulta.",
+     "¿Qué devuelve la funcion {ident} del modulo {module}?"),
+    ("El codigo de error {code} indica que el servidor {host} agoto la memoria del proceso.",
+     "¿Qué indica el codigo de error {code}?"),
+    ("El parametro {param} controla el numero maximo de hilos del servidor {host} y vale {n} por defecto.",
+     "¿Qué controla el parametro {param}?"),
+)
+
+def rss_mb() -> float:
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def latency_ms(latencies: list) -> dict:
+    return {f"p{int(q * 100)}": percentile(latencies, q) * 1000 for q in (0.5, 0.95, 0.99)}
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+def synthetic_corpus(docs: int, doc_chars: int, facts_per_doc: int, seed: int = 0) -> tuple:
+    """Documents of filler paragraphs with planted facts, and a (question, answer) pair per fact"""
+    rng = random.Random(seed)
+    documents = []
+    queries = []
+    for d in range(docs):
+        paragraphs = synthetic_chunks(max(1, doc_chars // 400), 400, seed=seed * 100_003 + d)
+        for f in range(facts_per_doc):
+            n = d * facts_per_doc + f
+            fact, question = FACTS[n % len(FACTS)]
+            values = {
+                "ident": f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{n}",
+                "module": f"{rng.choice(WORDS)}{n}",
+                "type": rng.choice(("entero", "diccionario", "objeto", "cadena")),
+                "code": f"E{10000 + n}",
+                "host": f"{rng.choice(WORDS)}-{n}",
+                "param": f"{rng.choice(WORDS)}.{rng.choice(WORDS)}_{n}",
+                "n": rng.randint(2, 512),
+            }
+            answer = fact.format(**values)
+            paragraphs.insert(rng.randint(0, len(paragraphs)), answer)
+            queries.append({"question": question.format(**values), "answer": answer})
+        documents.append((f"manual-{d}", "\n\n".join(paragraphs)))
+    return documents, queries
+
+def pdf_corpus(patterns: list) -> list:
+    from src.core.bulk_ingest import find_pdfs
+    from src.core.document_processor import DocumentProcessor
+    processor = DocumentProcessor()
+    documents = []
+    for path in find_pdfs(patterns):
+        doc = processor.process_pdf(path)
+        documents.append((doc.title, doc.content))
+    return documents
+
+def ingest(vector_store, documents: list) -> tuple:
+    """Chunk and index every document, then save once; returns throughput and memory, and the chunks"""
+    from src.core.document_processor import DocumentProcessor, ProcessedDocument
+    splitter = DocumentProcessor().text_splitter
+    all_chunks = []
+    start = time.perf_counter()
+    for title, content in documents:
+        doc = ProcessedDocument(id=title, title=title, content=content, chunks=splitter.split_text(content),
+                                total_pages=0, source_path=Path(title))
+        vector_store.add_document(doc, persist=False)
+        all_chunks.extend(doc.chunks)
+    vector_store.save_index()
+    elapsed = time.perf_counter() - start
+    stats = {"documents": len(documents), "chunks": len(all_chunks), "seconds": elapsed,
+             "chunks_per_sec": len(all_chunks) / elapsed, "peak_rss_mb": rss_mb()}
+    return stats, all_chunks
+
+def evaluate_search(vector_store, queries: list, mode: str, ks: list) -> dict:
+    """Recall@k, MRR (over the top max(k)) and latency of one search mode"""
+    depth = max(ks)
+    ranks = []
+    latencies = []
+    vector_store.search(queries[0]["question"], k=depth, mode=mode)  # warm-up (model, lazy maps)
+    for query in queries:
+        answer = normalize(query["answer"])
+        start = time.perf_counter()
+        results = vector_store.search(query["question"], k=depth, mode=mode)
+        latencies.append(time.perf_counter() - start)
+        rank = next((r for r, result in enumerate(results, 1) if answer in normalize(result["chunk"])), None)
+        ranks.append(rank)
+    found = [rank for rank in ranks if rank is not None]
+    return {
+        "recall": {str(k): sum(rank <= k for rank in found) / len(ranks) for k in ks},
+        "mrr": sum(1 / rank for rank in found) / len(ranks),
+        "latency_ms": latency_ms(latencies),
+    }
+
+def evaluate_context(vector_store, queries: list) -> dict:
+    """Context size and answer coverage of the top-3 concatenation versus ContextBuilder"""
+    from src.core.context_builder import ContextBuilder, count_tokens
+    from src.utils.config import CONTEXT_CANDIDATES
+    builder = ContextBuilder(vector_store)
+    stats = {name: {"tokens": [], "covered": 0, "latency": []} for name in ("top3", "builder")}
+    for query in queries:
+        answer = normalize(query["answer"])
+        for name in stats:
+            start = time.perf_counter()
+            if name == "top3":
+                context = "\n".join(result["chunk"] for result in vector_store.search(query["question"], k=3))
+            else:
+                _, context = builder.build(vector_store.search(query["question"], k=CONTEXT_CANDIDATES))
+            stats[name]["latency"].append(time.perf_counter() - start)
+            stats[name]["tokens"].append(count_tokens(context))
+            stats[name]["covered"] += answer in normalize(context)
+    return {name: {
+        "mean_tokens": sum(values["tokens"]) / len(queries),
+        "coverage": values["covered"] / len(queries),
+        "latency_ms": latency_ms(values["latency"]),
+    } for name, values in stats.items()}
+
+def evaluate_qa(vector_store, queries: list, llm_latency: float) -> dict:
+    from src.core.qa_engine import QAEngine
+    from src.core.stub_llm import StubChatModel
+    engine = QAEngine(vector_store, llm=StubChatModel(latency=llm_latency, token_latency=0.0))
+    engine.get_answer(queries[0]["question"])
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        response = engine.get_answer(query["question"])
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        latencies.append(time.perf_counter() - start)
+    return {"questions": len(queries), "llm_latency_s": llm_latency, "latency_ms": latency_ms(latencies)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50, help="Synthetic documents")
+    parser.add_argument("--doc-chars", type=int, default=20_000, help="Characters per synthetic document")
+    parser.add_argument("--facts", type=int, default=4, help="Labelled facts (queries) per synthetic document")
+    parser.add_argument("--pdf", nargs="+", help="PDF files, directories or globs to use instead")
+    parser.add_argument("--queries", type=Path, help="JSONL of {question, answer} for --pdf")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--chunk-size", type=int, help="Overrides CHUNK_SIZE")
+    parser.add_argument("--chunk-overlap", type=int, help="Overrides CHUNK_OVERLAP")
+    parser.add_argument("--index-type", help="Overrides FAISS_INDEX_TYPE")
+    parser.add_argument("--qa-questions", type=int, default=50, help="Questions sent through QAEngine (0 skips it)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Stub LLM seconds to first token")
+    parser.add_argument("--json", type=Path, help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+    if args.pdf and not args.queries:
+        parser.error("--pdf needs --queries")
+
+    # Isolate the benchmark from the real store, caches and API before any src module reads the config
+    workdir = tempfile.mkdtemp(prefix="documentmentor-eval-")
+    os.environ["VECTOR_STORE_PATH"] = str(Path(workdir) / "vector_store")
+    os.environ["EMBEDDING_CACHE_PATH"] = str(Path(workdir) / "embedding_cache")
+    os.environ.setdefault("LLM_PROVIDER", "stub")
+    os.environ.update(QUERY_CACHE_SIZE="0", ANSWER_CACHE_SIZE="0", SEMANTIC_CACHE_ENABLED="False")
+    for option, name in ((args.chunk_size, "CHUNK_SIZE"), (args.chunk_overlap, "CHUNK_OVERLAP"),
+                         (args.index_type, "FAISS_INDEX_TYPE")):
+        if option is not None:
+            os.environ[name] = str(option)
+
+    from src.data.vector_store import VectorStore
+    from src.utils import config
+
+    if args.pdf:
+        documents = pdf_corpus(args.pdf)
+        with open(args.queries, 'r', encoding='utf-8') as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+    else:
+        documents, queries = synthetic_corpus(args.docs, args.doc_chars, args.facts)
+
+    baseline_rss = rss_mb()
+    vector_store = VectorStore()
+    ingest_stats, chunks = ingest(vector_store, documents)
+    ingest_stats["baseline_rss_mb"] = baseline_rss
+    text = "\0".join(normalize(chunk) for chunk in chunks)
+    unanswerable = sum(normalize(query["answer"]) not in text for query in queries)
+
+    results = {
+        "config": {
+            "chunk_size": config.CHUNK_SIZE,
+            "chunk_overlap": config.CHUNK_OVERLAP,
+            "index_type": vector_store.index_type,
+            "embedding_model": vector_store.embeddings.model_name,
+            "queries": len(queries),
+            "unanswerable": unanswerable,
+        },
+        "ingest": ingest_stats,
+        "search": {mode: evaluate_search(vector_store, queries, mode, args.k) for mode in args.modes},
+    }
+    results["context"] = evaluate_context(vector_store, queries)
+    if args.qa_questions:
+        results["qa"] = evaluate_qa(vector_store, queries[:args.qa_questions], args.llm_latency)
+
+    print(f"{ingest_stats['documents']} documents, {ingest_stats['chunks']} chunks "
+          f"(chunk size {config.CHUNK_SIZE}, overlap {config.CHUNK_OVERLAP}, index {vector_store.index_type}) "
+          f"in {ingest_stats['seconds']:.1f}s: {ingest_stats['chunks_per_sec']:.1f} chunks/sec, "
+          f"peak RSS {ingest_stats['peak_rss_mb']:.0f} MB")
+    print(f"{len(queries)} queries, {unanswerable} unanswerable\n")
+    recall_headers = "".join(f"{f'R@{k}':>8}" for k in args.k)
+    print(f"{'mode':<10}{recall_headers}{'MRR':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for mode, stats in results["search"].items():
+        recalls = "".join(f"{stats['recall'][str(k)]:>8.3f}" for k in args.k)
+        latency = stats["latency_ms"]
+        print(f"{mode:<10}{recalls}{stats['mrr']:>8.3f}"
+              f"{latency['p50']:>10.2f}{latency['p95']:>10.2f}{latency['p99']:>10.2f}")
+    print(f"\n{'context':<10}{'tokens':>8}{'coverage':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, stats in results["context"].items():
+        latency = stats["latency_ms"]
+        print(f"{name:<10}{stats['mean_tokens']:>8.0f}{stats['coverage']:>10.3f}{latency['p50']:>10.2f}{latency['p95']:>10.2f}")
+    if "qa" in results:
+        latency = results["qa"]["latency_ms"]
+        print(f"\nQAEngine.get_answer (stub LLM, {args.llm_latency:.2f}s): p50 {latency['p50']:.2f} ms, "
+              f"p95 {latency['p95']:.2f} ms, p99 {latency['p99']:.2f} ms")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding='utf-8')
+        print(f"\nResults written to {args.json}")
+
+if __name__ == "__main__":
+    main()
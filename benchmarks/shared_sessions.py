@@ -0,0 +1,123 @@
+"""
+shared_sessions.py
+Per-message latency and RSS of N concurrent UI sessions: per-rerun objects versus the shared service
+
+  per-rerun  every message builds Database + VectorStore + QAEngine, as DocumentMentorUI.__init__
+             did on each Streamlit rerun (model load, index load and a copy of both per session)
+  shared     every message uses one DocumentMentorService built once for the process
+
+Each mode runs in a fresh interpreter so peak RSS is measured separately. The store is built once
+from synthetic chunks in a temporary directory; the configured store and API are not touched.
+Answers come from the stub LLM and caches are disabled, so each message embeds, searches and
+prompts the LLM.
+
+Usage:
+    python -m benchmarks.shared_sessions --sessions 1 4 16 --messages 5 --chunks 5000
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+def rss_mb() -> float:
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def isolate(workdir: Path) -> None:
+    """Point the configuration at a throwaway store before any src module is imported"""
+    os.environ.update(
+        VECTOR_STORE_PATH=str(workdir / "vector_store"),
+        EMBEDDING_CACHE_PATH=str(workdir / "embedding_cache"),
+        DATABASE_URL=f"sqlite:///{workdir / 'documentmentor.db'}",
+        LLM_PROVIDER="stub",
+        QUERY_CACHE_SIZE="0", ANSWER_CACHE_SIZE="0", SEMANTIC_CACHE_ENABLED="False"
+    )
+
+def build_store(chunks: int) -> None:
+    from src.core.document_processor import ProcessedDocument
+    from src.data.vector_store import VectorStore
+    from benchmarks.corpus import synthetic_chunks
+    VectorStore().add_document(ProcessedDocument(
+        id="sessions", title="sessions", content="",
+        chunks=synthetic_chunks(chunks, 1000), total_pages=0, source_path=Path("sessions")
+    ))
+
+def run_child(mode: str, sessions: int, messages: int, llm_latency: float) -> None:
+    """Simulate the sessions in threads and print the results as JSON (runs in a fresh interpreter)"""
+    from src.core.service import DocumentMentorService
+    from src.core.stub_llm import StubChatModel
+    from benchmarks.corpus import synthetic_chunks
+
+    llm = StubChatModel(latency=llm_latency, token_latency=0.0)
+    shared = DocumentMentorService(llm=llm) if mode == "shared" else None
+    questions = synthetic_chunks(sessions * messages, 100, seed=1)
+    latencies = []
+    lock = threading.Lock()
+
+    def session(index: int) -> None:
+        for i in range(messages):
+            start = time.perf_counter()
+            # A Streamlit rerun: build (or fetch) the objects, then answer the message
+            service = shared or DocumentMentorService(llm=llm)
+            response = service.qa_engine.get_answer(questions[index * messages + i])
+            if "error" in response:
+                raise RuntimeError(response["error"])
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(json.dumps({
+        "wall": time.perf_counter() - start,
+        "p50": statistics.median(latencies),
+        "p95": percentile(latencies, 0.95),
+        "rss": rss_mb(),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--messages", type=int, default=5, help="Messages sent by each session")
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Stub LLM seconds to first token")
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "SESSIONS", "WORKDIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, sessions, workdir = args.child
+        isolate(Path(workdir))
+        run_child(mode, int(sessions), args.messages, args.llm_latency)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="documentmentor-sessions-") as workdir:
+        isolate(Path(workdir))
+        build_store(args.chunks)
+        print(f"{'mode':<11}{'sessions':>9}{'msg p50 s':>11}{'msg p95 s':>11}{'wall s':>9}{'peak RSS MB':>13}")
+        for sessions in args.sessions:
+            for mode in ("per-rerun", "shared"):
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.shared_sessions", "--messages", str(args.messages),
+                     "--llm-latency", str(args.llm_latency), "--child", mode, str(sessions), workdir],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{mode:<11}{sessions:>9}{result['p50']:>11.3f}{result['p95']:>11.3f}"
+                      f"{result['wall']:>9.2f}{result['rss']:>13.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+startup.py
+Cold-start cost of the UI: import-time breakdown, time to first render and time until ready
+
+  imports    `python -X importtime` of the UI script's imports and of building the service,
+             summed per top-level package (self time), so the heavy ones stand out
+  startup    in a fresh interpreter, time until the UI script can draw its first element and
+             until the shared service (model, index, database, LLM client) is ready:
+               lazy   the current app: warm_up() in the background, first render right away
+               eager  the service is built before anything is drawn, as the app used to do
+
+Every measurement runs in a fresh interpreter (import caches are per process), over a
+throwaway store of synthetic chunks; the configured store and API are not touched. Run it
+twice and keep the second result to exclude a cold disk cache.
+
+Usage:
+    python -m benchmarks.startup --chunks 5000 --top 15
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from benchmarks.shared_sessions import build_store, isolate
+
+UI_MODULE = "src.ui.app"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+def importtime(code: str) -> dict:
+    """Run code under -X importtime; returns wall seconds and self seconds per top-level package"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            check=True, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            packages[match.group(4).split(".")[0]] += int(match.group(1)) / 1e6
+    return {"wall": wall, "imports": sum(packages.values()), "packages": dict(packages)}
+
+def run_child(mode: str) -> None:
+    """Time first render and readiness from interpreter start and print them as JSON"""
+    start = time.perf_counter()
+    from src.core import service
+    if mode == "eager":
+        service.get_service()
+    # The app's imports (streamlit included) are what stands before its first st.title call
+    __import__(UI_MODULE)
+    first_render = time.perf_counter() - start
+    service.warm_up()
+    service.get_service()
+    ready = time.perf_counter() - start
+    print(json.dumps({"first_render": first_render, "ready": ready}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000, help="Synthetic chunks in the throwaway store")
+    parser.add_argument("--top", type=int, default=15, help="Packages listed in the import breakdown")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per startup mode (median kept)")
+    parser.add_argument("--child", metavar="MODE", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="documentmentor-startup-") as workdir:
+        isolate(Path(workdir))
+        build_store(args.chunks)
+
+        breakdowns = {
+            "UI script imports": importtime(f"import {UI_MODULE}"),
+            "service ready": importtime("from src.core.service import get_service; get_service()"),
+        }
+        for name, breakdown in breakdowns.items():
+            print(f"{name}: {breakdown['imports']:.2f}s importing, {breakdown['wall']:.2f}s wall")
+            ranked = sorted(breakdown["packages"].items(), key=lambda item: item[1], reverse=True)
+            for package, seconds in ranked[:args.top]:
+                print(f"  {package:<28}{seconds:>8.3f}s")
+            print()
+
+        print(f"{'mode':<8}{'first render s':>16}{'ready s':>10}")
+        for mode in ("lazy", "eager"):
+            runs = []
+            for _ in range(args.repeat):
+                output = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child", mode],
+                                        check=True, capture_output=True, text=True, env=os.environ).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            first_render = sorted(run["first_render"] for run in runs)[len(runs) // 2]
+            ready = sorted(run["ready"] for run in runs)[len(runs) // 2]
+            print(f"{mode:<8}{first_render:>16.2f}{ready:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import sys
+from pathlib import Path
+from dotenv import load_dotenv
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bulk-ingest PDFs into DocumentMentor without the UI")
+    parser.add_argument("paths", nargs="+", help="PDF files, directories (searched recursively) or glob patterns")
+    parser.add_argument("--workers", type=int, help="Extraction processes (default: PDF_WORKERS)")
+    parser.add_argument("--batch-size", type=int, help="Embedding batch size (default: EMBEDDING_BATCH_SIZE)")
+    parser.add_argument("--checkpoint", type=int, default=0,
+                        help="Commit the index every N files (default: a single commit at the end)")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore the journal of previous runs")
+    return parser.parse_args()
+
+def main():
+    """Entry point for headless bulk ingestion"""
+    load_dotenv()
+    args = parse_args()
+    
+    # Imported after load_dotenv so the configuration sees the .env values
+    from src.core.bulk_ingest import BulkIngestor, find_pdfs
+    from src.data.database import Database
+    from src.data.vector_store import VectorStore
+    from src.utils import config, metrics
+    from src.utils.config import PDF_WORKERS, METRICS_PORT, METRICS_DUMP_INTERVAL
+    
+    config.setup()
+    
+    files = find_pdfs(args.paths)
+    if not files:
+        print("Error: no PDF files found")
+        sys.exit(1)
+    
+    Path("data/processed").mkdir(parents=True, exist_ok=True)
+    metrics.start(METRICS_PORT, METRICS_DUMP_INTERVAL)
+    ingestor = BulkIngestor(
+        VectorStore(),
+        Database(),
+        workers=args.workers or PDF_WORKERS,
+        batch_size=args.batch_size,
+        checkpoint_every=args.checkpoint
+    )
+    stats = ingestor.run(files, resume=not args.no_resume)
+    print(stats.summary())
+    sys.exit(1 if stats.failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ from dotenv import load_dotenv
 
 def check_environment():
     """Check if all required environment variables are set"""
-    if not os.getenv("OPENAI_API_KEY"):
+    if not os.getenv("OPENAI_API_KEY") and os.getenv("LLM_PROVIDER", "openai").lower() == "openai":
         print("Error: OPENAI_API_KEY not found in environment variables")
         sys.exit(1)
 
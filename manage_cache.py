@@ -0,0 +1,51 @@
+import argparse
+import logging
+import sys
+import numpy as np
+from dotenv import load_dotenv
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect and compact the on-disk embedding cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Show the size of the embedding cache")
+    compact = subparsers.add_parser("compact", help="Evict rows and rewrite the cache files")
+    compact.add_argument("--indexed-only", action="store_true",
+                         help="Evict vectors of chunks that are not in the vector store (deleted or replaced)")
+    compact.add_argument("--max-mb", type=int,
+                         help="Evict the oldest vectors until the cache fits (default: EMBEDDING_CACHE_MAX_MB)")
+    return parser.parse_args()
+
+def main():
+    """Entry point for embedding cache maintenance"""
+    load_dotenv()
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    # Imported after load_dotenv so the configuration sees the .env values
+    from src.data.embedding_cache import EmbeddingCache
+    from src.data.segment_store import SegmentStore
+    from src.utils.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB, VECTOR_STORE_PATH
+
+    models = [path.name for path in EMBEDDING_CACHE_PATH.iterdir() if (path / "meta.json").exists()] \
+        if EMBEDDING_CACHE_PATH.exists() else []
+    if not models:
+        print("The embedding cache is empty")
+        sys.exit(0)
+
+    for model in models:
+        cache = EmbeddingCache(EMBEDDING_CACHE_PATH, model, max_bytes=EMBEDDING_CACHE_MAX_MB * 2**20)
+        if args.command == "compact":
+            keep = None
+            if args.indexed_only:
+                # Read-only: the running writer owns the vector store, this only reads it
+                store = SegmentStore(VECTOR_STORE_PATH, read_only=True)
+                deleted = [chunk_id for chunk_id, docs in store.load_refs().items() if not docs]
+                keep = np.delete(store.chunk_hashes(), deleted)
+            max_bytes = args.max_mb * 2**20 if args.max_mb is not None else None
+            evicted = cache.compact(keep=keep, max_bytes=max_bytes)
+            print(f"{model}: {evicted} vectors evicted")
+        stats = cache.stats()
+        print(f"{model}: {stats['rows']} vectors, {stats['size_mb']:.1f} MB (limit {stats['max_mb']:.0f} MB)")
+
+if __name__ == "__main__":
+    main()
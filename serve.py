@@ -0,0 +1,41 @@
+import argparse
+import os
+from dotenv import load_dotenv
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the DocumentMentor HTTP API without the UI")
+    parser.add_argument("--host", help="Interface to listen on (default: API_HOST)")
+    parser.add_argument("--port", type=int, help="Port to listen on (default: API_PORT)")
+    parser.add_argument("--workers", type=int,
+                        help="Worker processes sharing the memory-mapped index; 0 serves from one process "
+                             "(default: API_WORKERS)")
+    parser.add_argument("--reload-interval", type=float,
+                        help="Seconds between checks for a newly published index (default: API_RELOAD_INTERVAL)")
+    parser.add_argument("--stub-llm", action="store_true",
+                        help="Answer with the offline stub LLM instead of OpenAI (local testing)")
+    return parser.parse_args()
+
+def main():
+    """Entry point for the headless API server"""
+    load_dotenv()
+    args = parse_args()
+    if args.stub_llm:
+        # Set before the configuration is imported; worker processes inherit it
+        os.environ["LLM_PROVIDER"] = "stub"
+    
+    # Imported after load_dotenv so the configuration sees the .env values
+    from src.api.server import serve
+    from src.utils import config, metrics
+    from src.utils.config import API_HOST, API_PORT, API_WORKERS, API_RELOAD_INTERVAL, METRICS_DUMP_INTERVAL
+    
+    config.setup()
+    metrics.start(dump_interval=METRICS_DUMP_INTERVAL)
+    serve(
+        args.host or API_HOST,
+        API_PORT if args.port is None else args.port,
+        API_WORKERS if args.workers is None else args.workers,
+        args.reload_interval or API_RELOAD_INTERVAL
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,470 @@
+"""
+server.py
+Headless HTTP API (ingest, search, answer, streaming answer, conversations) around VectorStore and QAEngine
+
+With workers > 0 the parent process is the only writer: it owns the writable service, applies
+ingest and delete requests forwarded by the workers and publishes the index after each burst.
+Workers share the listening socket and serve searches and answers from read-only replicas that
+memory-map the published index, so N workers hold one copy of the vectors in the page cache.
+A replica is rebuilt in the background whenever a new version is published and swapped in
+atomically; requests already running finish on the previous one.
+"""
+import json
+import os
+import queue
+import signal
+import sys
+import socket
+import time
+import itertools
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
+from langchain_core.language_models import BaseChatModel
+from src.core.memory_manager import MemoryManager
+from src.core.qa_engine import QAEngine
+from src.core.semantic_cache import SemanticCache
+from src.core.service import DocumentMentorService, get_service
+from src.data.database import Database
+from src.data.local_embeddings import LocalEmbeddings
+from src.data.vector_store import VectorStore, read_published
+from src.utils import config
+from src.utils.config import (
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE, MEMORY_ENABLED
+)
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class LocalBackend:
+    """Serves every request from the writable process-wide service (single-process mode)"""
+
+    def __init__(self, service: DocumentMentorService):
+        self.service = service
+
+    @contextmanager
+    def engine(self) -> Iterator[QAEngine]:
+        yield self.service.qa_engine
+
+    def ingest(self, filename: str, data: bytes, replace: bool = False) -> dict:
+        return asdict(self.service.add_pdf(filename, data, replace=replace))
+
+    def delete(self, doc_id: str) -> dict:
+        self.service.delete_document(doc_id)
+        return {"doc_id": doc_id, "deleted": True}
+
+    @property
+    def memory(self) -> Optional[MemoryManager]:
+        return self.service.qa_engine.memory
+
+    def health(self) -> dict:
+        vector_store = self.service.vector_store
+        return {"status": "ok", "pid": os.getpid(), "index_version": vector_store.version,
+                "chunks": vector_store.current_id}
+
+class _Replica:
+    """A read-only store and its QA engine, with the number of requests still using them"""
+
+    def __init__(self, qa_engine: QAEngine):
+        self.qa_engine = qa_engine
+        self.version = qa_engine.vector_store.published_version
+        self.active = 0
+        self.retired = False
+
+class ReplicaBackend:
+    """Serves searches and answers from a read-only replica; writes are forwarded to the parent
+
+    The embedding model, LLM, semantic cache and conversation memory are loaded once per worker
+    and shared by every replica, so a reload only re-opens the index and metadata. Conversations
+    are written by the workers directly: they live in the database, not in the index.
+    """
+
+    def __init__(self, worker: int, jobs: "multiprocessing.Queue", results: "multiprocessing.Queue",
+                 llm: Optional[BaseChatModel] = None):
+        self.worker = worker
+        self.jobs = jobs
+        self.results = results
+        self.embeddings = LocalEmbeddings()
+        self.llm = llm or QAEngine._create_llm()
+        # One file per worker: replicas of different processes must not overwrite each other's cache
+        self.semantic_cache = SemanticCache(
+            SEMANTIC_CACHE_PATH.with_name(f"semantic_cache.worker{worker}.npz"),
+            threshold=SEMANTIC_CACHE_THRESHOLD,
+            max_size=SEMANTIC_CACHE_SIZE
+        ) if SEMANTIC_CACHE_ENABLED else None
+        self.memory = MemoryManager(Database(), self.llm) if MEMORY_ENABLED else None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._current = self._open()
+        self._job_ids = itertools.count()
+        self._pending: Dict[int, Future] = {}
+        threading.Thread(target=self._dispatch_results, daemon=True, name="api-results").start()
+
+    @property
+    def version(self) -> int:
+        return self._current.version
+
+    def _open(self) -> _Replica:
+        vector_store = VectorStore(read_only=True, embeddings=self.embeddings)
+        return _Replica(QAEngine(vector_store, llm=self.llm, semantic_cache=self.semantic_cache, memory=self.memory))
+
+    @staticmethod
+    def _close(replica: _Replica) -> None:
+        replica.qa_engine.vector_store.close()
+        logger.debug(f"Closed replica of index version {replica.version}")
+
+    @contextmanager
+    def engine(self) -> Iterator[QAEngine]:
+        """The current replica's QA engine, kept open until the caller is done with it"""
+        with self._lock:
+            replica = self._current
+            replica.active += 1
+        try:
+            yield replica.qa_engine
+        finally:
+            with self._lock:
+                replica.active -= 1
+                idle = replica.retired and not replica.active
+            if idle:
+                self._close(replica)
+
+    def reload(self) -> bool:
+        """Open the latest published index and swap it in; returns whether the version changed"""
+        with self._reload_lock:
+            published = read_published()
+            if published is None or published["version"] == self._current.version:
+                return False
+            replica = self._open()
+            if published["index"] and replica.qa_engine.vector_store.index is None:
+                # The snapshot could not be read (e.g. superseded mid-load); keep serving the old one
+                self._close(replica)
+                logger.warning(f"Could not load index version {published['version']}; will retry")
+                return False
+            with self._lock:
+                old, self._current = self._current, replica
+                old.retired = True
+                idle = not old.active
+            if idle:
+                self._close(old)
+            logger.info(f"Worker {self.worker} serving index version {replica.version}")
+            return True
+
+    def watch(self, interval: float) -> None:
+        """Poll for newly published index versions (runs in a daemon thread)"""
+        while True:
+            time.sleep(interval)
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Error reloading index: {e}")
+
+    def _dispatch_results(self) -> None:
+        while True:
+            job_id, result = self.results.get()
+            future = self._pending.pop(job_id, None)
+            if future is not None:
+                future.set_result(result)
+
+    def _call(self, op: str, **payload) -> dict:
+        """Run a write in the parent process and wait for the index version that contains it"""
+        job_id = next(self._job_ids)
+        future: Future = Future()
+        self._pending[job_id] = future
+        self.jobs.put((self.worker, job_id, op, payload))
+        result = future.result()
+        if "error" not in result:
+            # Read-your-writes on this worker; the others pick the version up on their next poll
+            self.reload()
+        return result
+
+    def ingest(self, filename: str, data: bytes, replace: bool = False) -> dict:
+        return self._call("ingest", filename=filename, data=data, replace=replace)
+
+    def delete(self, doc_id: str) -> dict:
+        return self._call("delete", doc_id=doc_id)
+
+    def health(self) -> dict:
+        with self.engine() as qa_engine:
+            vector_store = qa_engine.vector_store
+            return {"status": "ok", "pid": os.getpid(), "worker": self.worker,
+                    "index_version": vector_store.published_version, "chunks": vector_store.current_id}
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """JSON endpoints; /answer/stream sends the answer as server-sent events, one per token"""
+
+    server_version = "DocumentMentor"
+
+    @property
+    def backend(self):
+        return self.server.backend
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        routes = {
+            "/health": lambda: self._send_json(self.backend.health()),
+            "/metrics": self._metrics,
+        }
+        if path.startswith("/conversations/"):
+            routes[path] = lambda: self._conversation(path[len("/conversations/"):])
+        self._dispatch(routes)
+
+    def do_POST(self):
+        self._dispatch({
+            "/search": self._search,
+            "/answer": self._answer,
+            "/answer/stream": self._stream_answer,
+            "/documents": self._ingest,
+        })
+
+    def do_DELETE(self):
+        path = urlparse(self.path).path
+        if path.startswith("/documents/"):
+            self._dispatch({path: lambda: self._send_json(self.backend.delete(path[len("/documents/"):]))})
+        elif path.startswith("/conversations/"):
+            self._dispatch({path: lambda: self._delete_conversation(path[len("/conversations/"):])})
+        else:
+            self._send_json({"error": "Not found"}, 404)
+
+    def _dispatch(self, routes: dict) -> None:
+        route = routes.get(urlparse(self.path).path)
+        if route is None:
+            self._send_json({"error": "Not found"}, 404)
+            return
+        try:
+            route()
+        except ApiError as e:
+            self._send_json({"error": str(e)}, e.status)
+        except Exception as e:
+            logger.error(f"Error handling {self.command} {self.path}: {e}")
+            self._send_json({"error": str(e)}, 500)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _read_json(self, *required: str) -> dict:
+        try:
+            body = json.loads(self._read_body() or b"{}")
+        except ValueError:
+            raise ApiError(400, "Request body must be JSON")
+        missing = [field for field in required if not body.get(field)]
+        if missing:
+            raise ApiError(400, f"Missing field(s): {', '.join(missing)}")
+        return body
+
+    def _send_json(self, payload, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _metrics(self) -> None:
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _search(self) -> None:
+        body = self._read_json("query")
+        with self.backend.engine() as qa_engine:
+            try:
+                results: List[dict] = qa_engine.vector_store.search(
+                    body["query"], k=int(body.get("k", 3)), mode=body.get("mode")
+                )
+            except ValueError as e:
+                raise ApiError(409, str(e))
+        self._send_json({"results": results})
+
+    def _answer(self) -> None:
+        body = self._read_json("question")
+        with self.backend.engine() as qa_engine:
+            response = qa_engine.get_answer(body["question"], body.get("conversation_id"))
+        if body.get("conversation_id"):
+            response["conversation_id"] = body["conversation_id"]
+        self._send_json(response, 500 if "error" in response else 200)
+
+    def _stream_answer(self) -> None:
+        body = self._read_json("question")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        with self.backend.engine() as qa_engine:
+            try:
+                for token in qa_engine.stream_answer(body["question"], body.get("conversation_id")):
+                    self._send_event({"token": token})
+            except (BrokenPipeError, ConnectionResetError):
+                logger.debug("Client disconnected during a streamed answer")
+                return
+            except Exception as e:
+                self._send_event({"error": str(e)}, "error")
+                return
+        self._send_event({}, "done")
+
+    def _send_event(self, data: dict, event: Optional[str] = None) -> None:
+        message = f"event: {event}\n" if event else ""
+        message += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        self.wfile.write(message.encode('utf-8'))
+        self.wfile.flush()
+
+    def _memory(self) -> MemoryManager:
+        if self.backend.memory is None:
+            raise ApiError(404, "Conversation memory is disabled (MEMORY_ENABLED=False)")
+        return self.backend.memory
+
+    def _conversation(self, conversation_id: str) -> None:
+        memory = self._memory()
+        history = memory.load(conversation_id)
+        messages = memory.get_messages(conversation_id)
+        if not messages:
+            raise ApiError(404, f"Unknown conversation: {conversation_id}")
+        self._send_json({
+            "conversation_id": conversation_id,
+            "summary": history.summary,
+            "messages": [{"role": role, "content": content} for role, content in messages]
+        })
+
+    def _delete_conversation(self, conversation_id: str) -> None:
+        self._send_json({"conversation_id": conversation_id,
+                         "deleted": self._memory().clear_memory(conversation_id)})
+
+    def _ingest(self) -> None:
+        params = parse_qs(urlparse(self.path).query)
+        filename = params.get("filename", [""])[0]
+        # A PDF with the name of an earlier upload is added next to it unless replace=true
+        replace = params.get("replace", ["false"])[0].lower() in ("1", "true", "yes")
+        if not filename.lower().endswith(".pdf"):
+            raise ApiError(400, "The filename query parameter must name a .pdf file")
+        data = self._read_body()
+        if not data:
+            raise ApiError(400, "The request body must be the PDF file")
+        result = self.backend.ingest(filename, data, replace)
+        self._send_json(result, 500 if "error" in result else 200)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+def make_server(sock: socket.socket, backend) -> ThreadingHTTPServer:
+    """An HTTP server accepting on an already bound socket (shared by every worker process)"""
+    server = ThreadingHTTPServer(sock.getsockname()[:2], ApiHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.daemon_threads = True
+    server.backend = backend
+    return server
+
+def run_worker(worker: int, sock: socket.socket, jobs: "multiprocessing.Queue",
+               results: "multiprocessing.Queue", reload_interval: float) -> None:
+    """Entry point of a worker process"""
+    config.setup()
+    backend = ReplicaBackend(worker, jobs, results)
+    threading.Thread(target=backend.watch, args=(reload_interval,), daemon=True, name="api-reload").start()
+    logger.info(f"Worker {worker} (pid {os.getpid()}) ready with index version {backend.version}")
+    try:
+        make_server(sock, backend).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+class IndexWriter:
+    """Applies the ingest and delete requests of all workers, one at a time, in the parent process"""
+
+    def __init__(self, service: DocumentMentorService, jobs: "multiprocessing.Queue",
+                 results: List["multiprocessing.Queue"]):
+        self.service = service
+        self.jobs = jobs
+        self.results = results
+        self._done: list = []
+        self._published_content = service.vector_store.version
+
+    def _apply(self, op: str, payload: dict) -> dict:
+        try:
+            if op == "ingest":
+                return asdict(self.service.add_pdf(payload["filename"], payload["data"],
+                                                   replace=payload.get("replace", False)))
+            if op == "delete":
+                self.service.delete_document(payload["doc_id"])
+                return {"doc_id": payload["doc_id"], "deleted": True}
+            return {"error": f"Unknown operation {op}"}
+        except Exception as e:
+            logger.error(f"Error applying {op}: {e}")
+            return {"error": str(e)}
+
+    def run_once(self, timeout: float = 1.0) -> None:
+        """Apply the next job; once no more are queued, publish the index and reply to the workers
+
+        Replies wait for the publish, so a worker reloading on a reply always sees its write.
+        """
+        try:
+            worker, job_id, op, payload = self.jobs.get(timeout=timeout)
+        except queue.Empty:
+            return
+        self._done.append((worker, job_id, self._apply(op, payload)))
+        if not self.jobs.empty():
+            return
+        vector_store = self.service.vector_store
+        if vector_store.version != self._published_content:
+            vector_store.publish_index()
+            self._published_content = vector_store.version
+        version = vector_store.published_version
+        for worker, job_id, result in self._done:
+            result.setdefault("index_version", version)
+            self.results[worker].put((job_id, result))
+        self._done = []
+
+def serve(host: str, port: int, workers: int, reload_interval: float) -> None:
+    """Serve the API until interrupted; workers=0 serves from this process only"""
+    sock = socket.create_server((host, port), backlog=128)
+    logger.info(f"API listening on http://{host}:{sock.getsockname()[1]}")
+    if workers <= 0:
+        try:
+            make_server(sock, LocalBackend(get_service())).serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    service = DocumentMentorService()
+    service.vector_store.publish_index()
+    # spawn rather than fork: the parent has already loaded the model and started threads
+    context = multiprocessing.get_context("spawn")
+    jobs = context.Queue()
+    results = [context.Queue() for _ in range(workers)]
+    writer = IndexWriter(service, jobs, results)
+
+    def start(worker: int) -> multiprocessing.Process:
+        process = context.Process(target=run_worker, args=(worker, sock, jobs, results[worker], reload_interval),
+                                  name=f"api-worker-{worker}", daemon=True)
+        process.start()
+        return process
+
+    processes = [start(worker) for worker in range(workers)]
+    # Stop the workers too when the server is terminated by a process manager
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            writer.run_once()
+            for worker, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.warning(f"Worker {worker} exited with code {process.exitcode}; restarting it")
+                    processes[worker] = start(worker)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
@@ -0,0 +1,260 @@
+import glob
+import json
+import os
+import time
+import uuid
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from pypdf import PdfReader
+from src.core.document_processor import DocumentProcessor, ProcessedDocument, StreamingDocument
+from src.data.database import Database
+from src.data.vector_store import VectorStore
+from src.utils.config import INGEST_JOURNAL_PATH, PARALLEL_PDF_MIN_PAGES, PDF_WORKERS
+from src.utils.hashing import file_hash
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class IngestStats:
+    """Counters and stage timings of a bulk ingestion run"""
+    files: int = 0
+    skipped: int = 0
+    failed: int = 0
+    pages: int = 0
+    chunks: int = 0
+    embed_seconds: float = 0.0
+    commit_seconds: float = 0.0
+    started: float = field(default_factory=time.perf_counter)
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        return (
+            f"{self.files} files ingested, {self.skipped} skipped, {self.failed} failed in {elapsed:.1f}s\n"
+            f"{self.pages} pages ({self.pages / elapsed:.1f} pages/sec), "
+            f"{self.chunks} chunks ({self.chunks / elapsed:.1f} chunks/sec)\n"
+            f"embedding {self.embed_seconds:.1f}s "
+            f"({self.chunks / self.embed_seconds if self.embed_seconds else 0:.1f} chunks/sec), "
+            f"commit {self.commit_seconds:.1f}s"
+        )
+
+def find_pdfs(patterns: Iterable[str]) -> List[Path]:
+    """Expand directories (recursively) and glob patterns into a sorted, de-duplicated list of PDFs"""
+    files = set()
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            files.update(p for p in path.rglob("*") if p.suffix.lower() == ".pdf")
+        elif glob.has_magic(pattern):
+            files.update(Path(p) for p in glob.glob(pattern, recursive=True) if p.lower().endswith(".pdf"))
+        elif path.is_file():
+            files.add(path)
+        else:
+            logger.warning(f"No PDF found for {pattern}")
+    return sorted(p.resolve() for p in files)
+
+def file_key(path: Path) -> str:
+    """Identify a file version by path, size and modification time"""
+    stat = path.stat()
+    return f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def _page_count(path: Path) -> int:
+    """Pages of a PDF, or 0 when it cannot be read (the worker then reports the error)"""
+    try:
+        return len(PdfReader(str(path)).pages)
+    except Exception:
+        return 0
+
+def _extract(path: str) -> ProcessedDocument:
+    """Extract and chunk one PDF; runs in a worker process, so page extraction stays sequential"""
+    return DocumentProcessor().process_pdf(Path(path), parallel=False)
+
+class BulkIngestor:
+    """Headless ingestion of many PDFs as a staged pipeline
+
+    1. Extraction and chunking run in a process pool, several files at a time. PDFs of at least
+       PARALLEL_PDF_MIN_PAGES pages are streamed in the main process instead, their pages
+       extracted by a pool of their own and embedded as they arrive.
+    2. Chunks are embedded in batches in the main process as documents arrive.
+    3. The index is committed once at the end (or every `checkpoint_every` files).
+
+    Committed files are recorded in an append-only journal, so a rerun after a crash skips them.
+    Document ids are derived from the file version, which makes re-saving a row idempotent.
+    Files whose content hash is already in the database (copies, touched files) are skipped
+    before extraction; a copy of a file still being ingested waits for it, and is ingested
+    in its place if it fails. A changed file replaces the documents previously ingested from its path.
+    """
+
+    def __init__(self, vector_store: VectorStore, database: Database, journal_path: Path = INGEST_JOURNAL_PATH,
+                 workers: int = PDF_WORKERS, batch_size: Optional[int] = None, checkpoint_every: int = 0):
+        self.vector_store = vector_store
+        self.database = database
+        self.journal_path = Path(journal_path)
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
+        self.processor = DocumentProcessor()
+        self._uncommitted: List[dict] = []
+        # Rows of the documents indexed since the last commit; saved once the index is
+        self._rows: List[dict] = []
+        # Content hashes of the files ingested successfully in this run
+        self._seen_hashes: Set[str] = set()
+        # Documents replaced by a newer version; their rows are deleted once the index is committed
+        self._replaced: List[str] = []
+
+    def load_journal(self) -> Set[str]:
+        """Keys of files committed by previous runs"""
+        if not self.journal_path.exists():
+            return set()
+        done = set()
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["key"])
+                except (ValueError, KeyError):
+                    # A torn last line from a crash only means that file is ingested again
+                    continue
+        return done
+
+    def _commit(self, stats: IngestStats) -> None:
+        """Persist the index, then save the rows and journal the files it now contains"""
+        if not self._uncommitted:
+            return
+        start = time.perf_counter()
+        self.vector_store.save_index()
+        # A row with this id may be left over from an interrupted run that never journaled its file
+        for row in self._rows:
+            if self.database.get_document(row["doc_id"]) is None:
+                self.database.save_document(**row)
+        self._rows = []
+        for doc_id in self._replaced:
+            self.database.delete_document(doc_id)
+        self._replaced = []
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for entry in self._uncommitted:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        logger.info(f"Committed {len(self._uncommitted)} files")
+        self._uncommitted = []
+        stats.commit_seconds += time.perf_counter() - start
+
+    def _is_duplicate(self, key: str, content_hash: str) -> bool:
+        """Whether an identical file was already ingested, in this run or a previous one"""
+        if content_hash in self._seen_hashes:
+            return True
+        existing = self.database.get_document_by_hash(content_hash)
+        # A row with this file's own id is left over from an interrupted run that never committed it
+        return existing is not None and existing.id != str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+    
+    def _index(self, path: Path, key: str, doc: Union[ProcessedDocument, StreamingDocument],
+               stats: IngestStats) -> None:
+        doc.id = str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+        # For a streamed document this also counts extraction, which overlaps with embedding
+        start = time.perf_counter()
+        try:
+            if isinstance(doc, StreamingDocument):
+                chunks = self.vector_store.add_document_stream(doc, batch_size=self.batch_size, persist=False)
+            else:
+                self.vector_store.add_document(doc, batch_size=self.batch_size, persist=False)
+                chunks = len(doc.chunks)
+        except Exception:
+            self.vector_store.delete_document(doc.id, persist=False)
+            raise
+        self._rows.append({
+            "doc_id": doc.id,
+            "title": doc.title,
+            "content": doc.content,
+            "file_path": str(path),
+            "content_hash": doc.content_hash
+        })
+        for previous in self.database.get_documents_by_path(str(path)):
+            if previous.id != doc.id:
+                self.vector_store.delete_document(previous.id, persist=False)
+                self._replaced.append(previous.id)
+        stats.embed_seconds += time.perf_counter() - start
+        self._uncommitted.append({"key": key, "doc_id": doc.id, "path": str(path), "chunks": chunks})
+        stats.files += 1
+        stats.pages += doc.total_pages
+        stats.chunks += chunks
+
+    def _skip(self, path: Path, key: str, stats: IngestStats) -> None:
+        stats.skipped += 1
+        self._uncommitted.append({"key": key, "doc_id": None, "path": str(path), "chunks": 0})
+        logger.info(f"Skipping {path.name}: identical content already ingested")
+
+    def _ingest(self, path: Path, key: str, load: Callable[[], Union[ProcessedDocument, StreamingDocument]],
+                stats: IngestStats, total: int) -> bool:
+        """Index one file, counting a failure to load or index it, and checkpoint when due"""
+        try:
+            self._index(path, key, load(), stats)
+            logger.info(f"[{stats.files + stats.failed}/{total}] {path.name}")
+            ingested = True
+        except Exception as e:
+            stats.failed += 1
+            logger.error(f"Error ingesting {path}: {e}")
+            ingested = False
+        if self.checkpoint_every and len(self._uncommitted) >= self.checkpoint_every:
+            self._commit(stats)
+        return ingested
+
+    def run(self, files: List[Path], resume: bool = True) -> IngestStats:
+        stats = IngestStats()
+        done = self.load_journal() if resume else set()
+        todo = []
+        for path in files:
+            key = file_key(path)
+            if key in done:
+                stats.skipped += 1
+            else:
+                todo.append((path, key))
+        logger.info(f"{len(todo)} files to ingest, {stats.skipped} already ingested")
+
+        queue = deque(todo)
+        # Content hash of each file being ingested -> copies of it waiting for the outcome
+        copies: Dict[str, List[Tuple[Path, str]]] = {}
+
+        def finish(content_hash: str, ingested: bool) -> None:
+            """Skip the copies of a file once it is ingested; if it failed, the next copy is tried"""
+            waiting = copies.pop(content_hash)
+            if ingested:
+                self._seen_hashes.add(content_hash)
+                for path, key in waiting:
+                    self._skip(path, key, stats)
+            else:
+                queue.extendleft(reversed(waiting))
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = {}
+            while True:
+                # Bounded window: extraction runs ahead of embedding by at most 2 files per worker
+                while queue and len(in_flight) < 2 * self.workers:
+                    path, key = queue.popleft()
+                    content_hash = file_hash(path)
+                    if content_hash in copies:
+                        copies[content_hash].append((path, key))
+                        continue
+                    if self._is_duplicate(key, content_hash):
+                        self._skip(path, key, stats)
+                        continue
+                    copies[content_hash] = []
+                    if _page_count(path) >= PARALLEL_PDF_MIN_PAGES:
+                        finish(content_hash, self._ingest(
+                            path, key, lambda: self.processor.stream_pdf(path), stats, len(todo)
+                        ))
+                        continue
+                    in_flight[pool.submit(_extract, str(path))] = (path, key, content_hash)
+                if not in_flight:
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path, key, content_hash = in_flight.pop(future)
+                    finish(content_hash, self._ingest(path, key, future.result, stats, len(todo)))
+
+        self._commit(stats)
+        return stats
@@ -0,0 +1,131 @@
+import logging
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import numpy as np
+from src.utils.config import CHUNK_OVERLAP, CONTEXT_MAX_CHUNKS, CONTEXT_TOKEN_BUDGET, MMR_LAMBDA
+from src.utils.metrics import metrics
+from src.data.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# Shorter common prefixes/suffixes are coincidences (a repeated word), not chunk overlap
+MIN_OVERLAP_CHARS = 20
+CHARS_PER_TOKEN = 4
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """The gpt-3.5 / gpt-4 tokenizer, or None when tiktoken (installed with langchain-openai) is unavailable"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.info(f"tiktoken not available ({e}); estimating {CHARS_PER_TOKEN} characters per token")
+        return None
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, proportionally to its length"""
+    tokens = count_tokens(text)
+    return text if tokens <= max_tokens else text[:len(text) * max_tokens // tokens]
+
+def overlap_length(before: str, after: str, max_chars: int = CHUNK_OVERLAP) -> int:
+    """Length of the longest suffix of `before` that `after` starts with (the splitter's chunk overlap)"""
+    for length in range(min(len(before), len(after), max_chars), MIN_OVERLAP_CHARS - 1, -1):
+        if before.endswith(after[:length]):
+            return length
+    return 0
+
+class ContextBuilder:
+    """Selects and packs the retrieved chunks that go into the prompt
+
+    The search over-fetches candidates; they are re-ranked with maximal marginal relevance
+    (relevance from the search ranking, redundancy from the stored embeddings) so near-duplicate
+    chunks do not crowd out other passages. Text repeated by the chunk overlap is cut, and chunks
+    are packed until max_chunks or the token budget is reached.
+    """
+
+    def __init__(self, vector_store: VectorStore, max_chunks: int = CONTEXT_MAX_CHUNKS,
+                 token_budget: int = CONTEXT_TOKEN_BUDGET, mmr_lambda: float = MMR_LAMBDA):
+        self.vector_store = vector_store
+        self.max_chunks = max_chunks
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+
+    def mmr_order(self, results: List[dict]) -> List[int]:
+        """Positions of the results in MMR order: lambda * relevance - (1 - lambda) * max similarity to earlier picks"""
+        count = len(results)
+        if count <= 1 or self.mmr_lambda >= 1:
+            return list(range(count))
+        vectors = self.vector_store.get_vectors(np.array([result["id"] for result in results], dtype=np.int64))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        similarity = vectors @ vectors.T
+        # Search scores are not comparable across modes (distance, BM25, RRF), their spread is
+        scores = np.array([result["score"] for result in results], dtype=np.float32)
+        relevance = (scores - scores.min()) / (np.ptp(scores) or 1.0)
+
+        redundancy = np.zeros(count, dtype=np.float32)
+        available = np.ones(count, dtype=bool)
+        order = []
+        for _ in range(count):
+            mmr = np.where(available, self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy, -np.inf)
+            pick = int(np.argmax(mmr))
+            order.append(pick)
+            available[pick] = False
+            np.maximum(redundancy, similarity[pick], out=redundancy)
+        return order
+
+    @staticmethod
+    def _trim(result: dict, packed: List[Tuple[dict, str]]) -> str:
+        """The chunk's text without what it shares with packed chunks of the same document"""
+        text = result["chunk"]
+        for other, _ in packed:
+            if other["doc_id"] != result["doc_id"]:
+                continue
+            if text in other["chunk"]:
+                return ""
+            # other precedes this chunk in the document, or follows it
+            text = text[overlap_length(other["chunk"], text):]
+            cut = overlap_length(text, other["chunk"])
+            if cut:
+                text = text[:-cut]
+        return text.strip()
+
+    def build(self, results: List[dict], token_budget: Optional[int] = None) -> Tuple[List[dict], str]:
+        """Pick chunks from the search results; returns them and the context text for the prompt"""
+        budget = token_budget or self.token_budget
+        with metrics.span("context_build"):
+            packed: List[Tuple[dict, str]] = []
+            used = 0
+            removed = 0
+            for position in self.mmr_order(results):
+                if len(packed) >= self.max_chunks:
+                    break
+                result = results[position]
+                text = self._trim(result, packed)
+                removed += len(result["chunk"]) - len(text)
+                if not text:
+                    continue
+                tokens = count_tokens(text)
+                if used + tokens > budget:
+                    if packed:
+                        continue  # a shorter candidate further down may still fit
+                    text = truncate_to_tokens(text, budget)
+                    tokens = count_tokens(text)
+                packed.append((result, text))
+                used += tokens
+
+            # Chunks of one document together and in reading order, so trimmed continuations follow on
+            first_pick = {}
+            for rank, (result, _) in enumerate(packed):
+                first_pick.setdefault(result["doc_id"], rank)
+            packed.sort(key=lambda item: (first_pick[item[0]["doc_id"]], item[0]["id"]))
+
+        metrics.inc("context_tokens", used)
+        metrics.inc("context_chars_trimmed", removed)
+        logger.debug(f"Context: {len(packed)} of {len(results)} candidates, {used} tokens, {removed} chars trimmed")
+        return [result for result, _ in packed], "\n".join(text for _, text in packed)
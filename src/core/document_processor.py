@@ -1,10 +1,16 @@
 from pathlib import Path
 import uuid
-from dataclasses import dataclass
-from typing import List, Optional
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Union
 from pypdf import PdfReader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from src.utils.config import CHUNK_SIZE, CHUNK_OVERLAP
+from src.utils.config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, PARALLEL_PDF_MIN_PAGES, PDF_WORKERS, PDF_PAGES_PER_TASK
+)
+from src.utils.hashing import file_hash
 
 @dataclass
 class ProcessedDocument:
@@ -15,6 +21,29 @@ class ProcessedDocument:
     chunks: List[str]
     total_pages: int
     source_path: Path
+    content_hash: Optional[str] = None
+
+@dataclass
+class StreamingDocument:
+    """A document whose chunks are produced lazily while its pages are being extracted"""
+    id: str
+    title: str
+    total_pages: int
+    source_path: Path
+    chunks: Iterator[str] = field(default_factory=lambda: iter(()))
+    pages_done: int = 0
+    content_hash: Optional[str] = None
+    pages: List[str] = field(default_factory=list)  # page texts extracted so far, with keep_text
+
+    @property
+    def content(self) -> str:
+        """Text of the pages kept so far; empty unless opened with keep_text, so large PDFs are stored without it"""
+        return "".join(self.pages)
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end); module-level so it can run in a worker process"""
+    reader = PdfReader(file_path)
+    return [(reader.pages[i].extract_text() or "") + "\n" for i in range(start, end)]
 
 class DocumentProcessor:
     """Handles the processing of PDF documents for content extraction and chunking"""
@@ -26,13 +55,93 @@ class DocumentProcessor:
             length_function=len
         )
     
-    def process_pdf(self, file_path: Path) -> ProcessedDocument:
+    def iter_pages(self, file_path: Path, total_pages: Optional[int] = None, parallel: bool = True) -> Iterator[str]:
+        """Yield page texts in order; PDFs above PARALLEL_PDF_MIN_PAGES are extracted by a process pool"""
+        if total_pages is None:
+            total_pages = len(PdfReader(str(file_path)).pages)
+        
+        if not parallel or total_pages < PARALLEL_PDF_MIN_PAGES or PDF_WORKERS <= 1:
+            yield from _extract_page_range(str(file_path), 0, total_pages)
+            return
+        
+        ranges = [
+            (start, min(start + PDF_PAGES_PER_TASK, total_pages))
+            for start in range(0, total_pages, PDF_PAGES_PER_TASK)
+        ]
+        # Spawned, not forked: the caller may hold the FAISS index, the embedding model and threads
+        with ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # Keep a bounded window of ranges in flight so a slow consumer does not buffer the whole PDF
+            window = deque()
+            next_range = 0
+            while next_range < len(ranges) or window:
+                while next_range < len(ranges) and len(window) < 2 * PDF_WORKERS:
+                    window.append(pool.submit(_extract_page_range, str(file_path), *ranges[next_range]))
+                    next_range += 1
+                yield from window.popleft().result()
+    
+    def iter_chunks(self, pages: Iterable[str]) -> Iterator[str]:
+        """Chunk page texts incrementally, keeping only a few chunks of text buffered"""
+        buffer = []
+        buffered = 0
+        for page in pages:
+            buffer.append(page)
+            buffered += len(page)
+            if buffered < CHUNK_SIZE * 4:
+                continue
+            text = "".join(buffer)
+            chunks = self.text_splitter.split_text(text)
+            # The last chunk may continue on the next page, so it is re-split with the text that follows.
+            # The raw text from where it starts is carried, not the chunk: the splitter strips it, which
+            # would glue its last word to the first word of the next page
+            yield from chunks[:-1]
+            start = text.rfind(chunks[-1]) if chunks else len(text)
+            buffer = [text[start:]] if start >= 0 else [chunks[-1] + "\n"]
+            buffered = len(buffer[0])
+        if buffer:
+            yield from self.text_splitter.split_text("".join(buffer))
+    
+    def stream_pdf(self, file_path: Path, keep_text: bool = False) -> StreamingDocument:
+        """Open a PDF for streaming ingestion: pages are extracted and chunked as the chunks are consumed
+
+        With keep_text the page texts are kept in doc.pages. Off by default: it holds the whole text in
+        memory, which streaming exists to avoid.
+        """
+        try:
+            total_pages = len(PdfReader(str(file_path)).pages)
+        except Exception as e:
+            raise Exception(f"Error processing PDF {file_path}: {str(e)}")
+        
+        doc = StreamingDocument(
+            id=str(uuid.uuid4()),
+            title=file_path.stem,
+            total_pages=total_pages,
+            source_path=file_path,
+            content_hash=file_hash(file_path)
+        )
+        
+        def pages() -> Iterator[str]:
+            for text in self.iter_pages(file_path, total_pages):
+                doc.pages_done += 1
+                if keep_text:
+                    doc.pages.append(text)
+                yield text
+        
+        doc.chunks = self.iter_chunks(pages())
+        return doc
+    
+    def open_pdf(self, file_path: Path, keep_text: bool = False) -> Union[ProcessedDocument, StreamingDocument]:
+        """Stream PDFs of at least PARALLEL_PDF_MIN_PAGES pages; smaller ones are processed at once"""
+        doc = self.stream_pdf(file_path, keep_text)
+        if doc.total_pages >= PARALLEL_PDF_MIN_PAGES:
+            return doc
+        return self.process_pdf(file_path, parallel=False)
+    
+    def process_pdf(self, file_path: Path, parallel: bool = True) -> ProcessedDocument:
         try:
             reader = PdfReader(str(file_path))
+            total_pages = len(reader.pages)
             
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
+            text = "".join(self.iter_pages(file_path, total_pages, parallel))
             
             chunks = self.text_splitter.split_text(text)
             
@@ -41,8 +150,9 @@ class DocumentProcessor:
                 title=file_path.stem,
                 content=text,
                 chunks=chunks,
-                total_pages=len(reader.pages),
-                source_path=file_path
+                total_pages=total_pages,
+                source_path=file_path,
+                content_hash=file_hash(file_path)
             )
             
             return doc
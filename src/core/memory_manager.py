@@ -1,47 +1,150 @@
-from typing import Dict, List, Optional
-from langchain_core.memory import BaseMemory
-from langchain_community.memory import ConversationBufferMemory
-from dataclasses import dataclass
-from datetime import datetime
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional, Set, Tuple
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from src.core.context_builder import count_tokens, truncate_to_tokens
+from src.data.database import Database
+from src.utils.config import (
+    MEMORY_WINDOW_MESSAGES, MEMORY_TOKEN_BUDGET, MEMORY_SUMMARY_BATCH, MEMORY_SUMMARY_MAX_TOKENS
+)
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ROLE_LABELS = {"user": "Usuario", "assistant": "Asistente"}
+# Longest message text passed to the summarizer, so one huge answer cannot blow up its prompt
+SUMMARY_MESSAGE_CHARS = 2000
 
 @dataclass
-class Conversation:
-    """Represents a conversation with its metadata"""
-    id: str
-    title: str
-    created_at: datetime
-    context: str
+class ConversationHistory:
+    """What the prompt sees of a conversation: its rolling summary and latest messages"""
+    summary: str = ""
+    messages: List[Tuple[str, str]] = field(default_factory=list)  # (role, content), oldest first
+
+    def __bool__(self) -> bool:
+        return bool(self.summary or self.messages)
+
+    def last_question(self) -> Optional[str]:
+        return next((content for role, content in reversed(self.messages) if role == "user"), None)
+
+    def render(self) -> str:
+        lines = [f"Resumen: {self.summary}"] if self.summary else []
+        lines += [f"{ROLE_LABELS.get(role, role)}: {content}" for role, content in self.messages]
+        return "\n".join(lines)
 
 class MemoryManager:
-    """Manages conversation history and context"""
-    
-    def __init__(self):
-        self.memory = ConversationBufferMemory(return_messages=True)
-        self.current_conversation: Optional[Conversation] = None
-    
-    def start_new_conversation(self, context: str, title: str = "Nueva conversación") -> None:
-        self.memory.clear()
-        self.current_conversation = Conversation(
-            id=datetime.now().strftime("%Y%m%d_%H%M%S"),
-            title=title,
-            created_at=datetime.now(),
-            context=context
+    """Manages conversation history, persisted in the database per conversation id
+
+    The prompt gets the messages not yet in the summary within MEMORY_TOKEN_BUDGET (the last
+    MEMORY_WINDOW_MESSAGES, plus up to MEMORY_SUMMARY_BATCH that have left the window and wait to
+    be summarized), plus a summary of everything older. The LLM updates the summary in a background
+    thread once MEMORY_SUMMARY_BATCH messages have fallen out of the window, so neither the prompt
+    size nor the answer latency grows with the length of the conversation.
+    """
+
+    def __init__(self, database: Database, llm: BaseChatModel, window: int = MEMORY_WINDOW_MESSAGES,
+                 token_budget: int = MEMORY_TOKEN_BUDGET, summary_batch: int = MEMORY_SUMMARY_BATCH,
+                 summary_max_tokens: int = MEMORY_SUMMARY_MAX_TOKENS):
+        self.database = database
+        self.window = window
+        self.token_budget = token_budget
+        self.summary_batch = summary_batch
+        self.summary_max_tokens = summary_max_tokens
+        self.summary_chain = ChatPromptTemplate.from_template("""
+        Resume en español, en como máximo {max_words} palabras, la conversación entre un usuario y un
+        asistente técnico. Conserva los temas, documentos, nombres de funciones, comandos y conclusiones
+        que puedan hacer falta para entender preguntas posteriores. Devuelve solo el resumen.
+
+        Resumen anterior:
+        {summary}
+
+        Mensajes nuevos:
+        {messages}
+        """) | llm | StrOutputParser()
+        # One thread: summaries of a conversation are applied in order and never compete with answers
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+        self._summarizing: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def load(self, conversation_id: str) -> ConversationHistory:
+        """Summary and latest messages of a conversation (empty for an unknown id)"""
+        with metrics.span("memory_load"):
+            conversation = self.database.get_conversation(conversation_id)
+            if conversation is None:
+                return ConversationHistory()
+            # Messages that left the window stay in the prompt until they are in the summary; only these
+            # are read (by primary key), whatever the length of the conversation
+            recent = self.database.get_messages(conversation_id, after_id=conversation.summarized_through,
+                                                limit=self.window + self.summary_batch, latest=True)
+        messages = []
+        used = 0
+        for message in reversed(recent):
+            content = message.content
+            tokens = count_tokens(content)
+            if used + tokens > self.token_budget:
+                if messages:
+                    break
+                content = truncate_to_tokens(content, self.token_budget)
+                tokens = self.token_budget
+            messages.append((message.role, content))
+            used += tokens
+        return ConversationHistory(conversation.summary, messages[::-1])
+
+    def add_interaction(self, conversation_id: str, user_input: str, assistant_response: str) -> None:
+        self.database.add_messages(
+            conversation_id,
+            [("user", user_input), ("assistant", assistant_response)],
+            title=user_input[:80]
         )
-    
-    def add_interaction(self, user_input: str, assistant_response: str) -> None:
-        if not self.current_conversation:
-            raise ValueError("No hay una conversación activa")
-            
-        self.memory.chat_memory.add_user_message(user_input)
-        self.memory.chat_memory.add_ai_message(assistant_response)
-    
-    def get_conversation_history(self) -> str:
-        if not self.current_conversation:
-            return ""
-            
-        messages = self.memory.chat_memory.messages
-        return "\n".join([f"{msg.type}: {msg.content}" for msg in messages])
-    
-    def clear_memory(self) -> None:
-        self.memory.clear()
-        self.current_conversation = None
\ No newline at end of file
+        with self._lock:
+            if conversation_id in self._summarizing:
+                return
+            self._summarizing.add(conversation_id)
+        self._executor.submit(self._summarize, conversation_id)
+
+    def _summarize(self, conversation_id: str) -> None:
+        """Fold the messages that left the window into the summary, once there are enough of them"""
+        try:
+            conversation = self.database.get_conversation(conversation_id)
+            if conversation is None:
+                return
+            unsummarized = self.database.count_messages(conversation_id, after_id=conversation.summarized_through)
+            if unsummarized < self.window + self.summary_batch:
+                return
+            # After failed attempts the backlog is folded a few batches at a time, keeping the prompt bounded
+            folded = self.database.get_messages(conversation_id, after_id=conversation.summarized_through,
+                                                limit=min(unsummarized - self.window, 4 * self.summary_batch))
+            with metrics.span("memory_summarize"):
+                summary = self.summary_chain.invoke({
+                    "max_words": self.summary_max_tokens * 3 // 4,
+                    "summary": conversation.summary or "(ninguno)",
+                    "messages": "\n".join(f"{ROLE_LABELS.get(m.role, m.role)}: {m.content[:SUMMARY_MESSAGE_CHARS]}"
+                                          for m in folded)
+                })
+            summary = truncate_to_tokens(summary.strip(), self.summary_max_tokens)
+            # Another worker process may have summarized the same messages meanwhile
+            if self.database.update_summary(conversation_id, summary, folded[-1].id,
+                                            expected_through=conversation.summarized_through):
+                metrics.inc("memory_summaries")
+                logger.debug(f"Summarized {len(folded)} messages of conversation {conversation_id}")
+        except Exception as e:
+            # The messages stay unsummarized and are retried after the next interaction
+            logger.error(f"Error summarizing conversation {conversation_id}: {e}")
+        finally:
+            with self._lock:
+                self._summarizing.discard(conversation_id)
+
+    def wait_idle(self) -> None:
+        """Block until the summaries scheduled so far are done (tests and benchmarks)"""
+        self._executor.submit(lambda: None).result()
+
+    def get_messages(self, conversation_id: str) -> List[Tuple[str, str]]:
+        """Every (role, content) message of a conversation, to display it again"""
+        return [(message.role, message.content) for message in self.database.get_messages(conversation_id)]
+
+    def clear_memory(self, conversation_id: str) -> bool:
+        return self.database.delete_conversation(conversation_id)
@@ -1,10 +1,22 @@
+import time
+import asyncio
+import weakref
 import logging
-from typing import Dict
-from langchain_openai import ChatOpenAI
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from src.utils.config import OPENAI_API_KEY
+from src.utils.config import (
+    OPENAI_API_KEY, LLM_PROVIDER, LLM_MAX_CONCURRENCY, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL,
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE,
+    CONTEXT_CANDIDATES
+)
+from src.utils.cache import LRUCache
+from src.utils.metrics import metrics
+from src.core.context_builder import ContextBuilder
+from src.core.memory_manager import ConversationHistory, MemoryManager
+from src.core.semantic_cache import SemanticCache
+from src.core.stub_llm import StubChatModel
 from src.data.vector_store import VectorStore
 
 logger = logging.getLogger(__name__)
@@ -12,14 +24,19 @@ logger = logging.getLogger(__name__)
 class QAEngine:
     """Handles document-based question answering with conversation memory"""
     
-    def __init__(self, vector_store: VectorStore):
+    # Bump whenever the prompt changes so cached answers from the old prompt are not reused
+    PROMPT_VERSION = 3
+    
+    def __init__(self, vector_store: VectorStore, llm: Optional[BaseChatModel] = None,
+                 semantic_cache: Optional[SemanticCache] = None, memory: Optional[MemoryManager] = None):
         self.vector_store = vector_store
-        self.llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0.7,
-            openai_api_key=OPENAI_API_KEY,
-            request_timeout=60
-        )
+        self.context_builder = ContextBuilder(vector_store)
+        self.llm = llm or self._create_llm()
+        # Without it (or without a conversation id) every question is answered on its own
+        self.memory = memory
+        # One semaphore per event loop caps concurrent LLM calls from the async API
+        self._llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
         
         self.prompt = ChatPromptTemplate.from_template("""
         Eres un asistente técnico especializado en tecnología y desarrollo de software que SIEMPRE responde en español. 
@@ -48,6 +65,10 @@ class QAEngine:
         - Usa terminología técnica apropiadamente
         - Si es relevante, menciona qué parte de la documentación contiene la información
         - Sé amigable y cercano, pero mantén la profesionalidad
+        - Usa el historial de la conversación para entender preguntas de seguimiento
+
+        Historial de la conversación:
+        {history}
 
         Contexto:
         {context}
@@ -55,36 +76,290 @@ class QAEngine:
         Pregunta: {question}
         """)
         
-        self.qa_chain = (
-            {
-                "context": lambda x: self._get_context(x["question"]),
-                "question": RunnablePassthrough()
-            }
-            | self.prompt 
-            | self.llm 
-            | StrOutputParser()
+        # The prompt is formatted separately (see _build_prompt) so its cost and the LLM call are timed apart
+        self.answer_chain = self.llm | StrOutputParser()
+        
+        self.answer_cache = LRUCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+        self._cache_version = self.vector_store.version
+        # Engines rebuilt over a reloaded index can keep using the same semantic cache. Its dimension
+        # comes from the first question embedding, so the model is not loaded here
+        self.semantic_cache = semantic_cache
+        if semantic_cache is None and SEMANTIC_CACHE_ENABLED:
+            self.semantic_cache = SemanticCache(
+                SEMANTIC_CACHE_PATH,
+                threshold=SEMANTIC_CACHE_THRESHOLD,
+                max_size=SEMANTIC_CACHE_SIZE
+            )
+        self.last_latency: Dict[str, float] = {}
+        metrics.register_collector("qa_engine", self.collect_metrics)
+        
+    @staticmethod
+    def _create_llm() -> BaseChatModel:
+        """Create the chat model selected by LLM_PROVIDER"""
+        if LLM_PROVIDER == "stub":
+            logger.info("Using stub LLM (LLM_PROVIDER=stub)")
+            return StubChatModel()
+        # Imported here: the OpenAI client stack is slow to import and unused with the stub model
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            model="gpt-3.5-turbo",
+            temperature=0.7,
+            openai_api_key=OPENAI_API_KEY,
+            request_timeout=60
         )
+    
+    def _llm_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._llm_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+            self._llm_semaphores[loop] = semaphore
+        return semaphore
+    
+    def _retrieve(self, question: str) -> List[dict]:
+        """Get relevant chunks from vector store with error handling"""
+        try:
+            with metrics.span("retrieve"):
+                return self.vector_store.search(question, k=CONTEXT_CANDIDATES)
+        except Exception as e:
+            logger.error(f"Error getting context: {e}")
+            return []
+    
+    def _answer_cache_key(self, question: str, results: List[dict], history: str) -> Tuple:
+        """Key answers by normalized question, retrieved chunk ids, conversation history and prompt version"""
+        normalized = " ".join(question.lower().split())
+        return (normalized, tuple(chunk["id"] for chunk in results), history, self.PROMPT_VERSION)
+    
+    def _load_history(self, conversation_id: Optional[str]) -> ConversationHistory:
+        if conversation_id is None or self.memory is None:
+            return ConversationHistory()
+        try:
+            return self.memory.load(conversation_id)
+        except Exception as e:
+            logger.error(f"Error loading conversation {conversation_id}: {e}")
+            return ConversationHistory()
+    
+    @staticmethod
+    def _search_query(question: str, history: ConversationHistory) -> str:
+        # Follow-ups ("¿y un ejemplo?") usually name their subject only in the previous question
+        previous = history.last_question()
+        return f"{previous}\n{question}" if previous else question
+    
+    def _check_cache_version(self) -> None:
+        """Drop cached answers once the vector store content has changed"""
+        if self._cache_version != self.vector_store.version:
+            self.answer_cache.clear()
+            self._cache_version = self.vector_store.version
+    
+    def get_cache_stats(self) -> Dict[str, dict]:
+        """Hit/miss counters of the query-embedding and answer caches"""
+        stats = {
+            "query_embeddings": self.vector_store.query_cache.stats(),
+            "answers": self.answer_cache.stats()
+        }
+        if self.semantic_cache is not None:
+            stats["semantic_answers"] = self.semantic_cache.stats()
+        return stats
+    
+    def collect_metrics(self) -> Dict[str, float]:
+        """Answer cache counters for the metrics endpoint (query caches are reported by the vector store)"""
+        gauges = {}
+        for name, stats in self.get_cache_stats().items():
+            if name != "query_embeddings":
+                gauges[f'cache_hits{{cache="{name}"}}'] = stats["hits"]
+                gauges[f'cache_misses{{cache="{name}"}}'] = stats["misses"]
+        return gauges
+    
+    def _build_prompt(self, inputs: dict):
+        with metrics.span("prompt_build"):
+            return self.prompt.invoke(inputs)
+
+    def _use_context(self, question: str, prepared: dict, candidates: List[dict]) -> dict:
+        """Pick the context from the retrieved candidates, then look up an answer cached for it"""
+        results, context = self.context_builder.build(candidates)
+        history = prepared["history"].render()
+        prepared["cache_key"] = self._answer_cache_key(question, results, history)
+        prepared["answer"] = self.answer_cache.get(prepared["cache_key"])
+        if prepared["answer"] is not None:
+            logger.debug("Answer served from cache")
+        prepared["inputs"] = {"question": question, "context": context, "history": history}
+        return prepared
+    
+    def _prepare(self, question: str, conversation_id: Optional[str] = None) -> dict:
+        """Run the history, cache lookups and retrieval that precede the LLM call"""
+        self._check_cache_version()
+        prepared = {"question_vector": None, "cache_key": None, "answer": None,
+                    "conversation_id": conversation_id, "history": self._load_history(conversation_id)}
+        # An answer that depends on earlier messages cannot be reused for a similar question elsewhere
+        if self.semantic_cache is not None and self.vector_store.index is not None and not prepared["history"]:
+            prepared["question_vector"] = self.vector_store.embed_query(question)
+            prepared["answer"] = self.semantic_cache.get(prepared["question_vector"], self.vector_store.fingerprint)
+            if prepared["answer"] is not None:
+                return prepared
         
-    def _get_context(self, question: str) -> str:
-        """Get context from vector store with error handling"""
+        return self._use_context(question, prepared, self._retrieve(self._search_query(question, prepared["history"])))
+    
+    async def _aretrieve(self, question: str) -> List[dict]:
+        """Async version of _retrieve"""
         try:
-            results = self.vector_store.search(question)
-            return "\n".join([chunk["chunk"] for chunk in results])
+            with metrics.span("retrieve"):
+                return await self.vector_store.asearch(question, k=CONTEXT_CANDIDATES)
         except Exception as e:
             logger.error(f"Error getting context: {e}")
-            return ""
+            return []
+    
+    async def _aprepare(self, question: str, conversation_id: Optional[str] = None) -> dict:
+        """Async version of _prepare; the history read, embedding, search and context build run off the event loop"""
+        self._check_cache_version()
+        prepared = {"question_vector": None, "cache_key": None, "answer": None,
+                    "conversation_id": conversation_id,
+                    "history": await asyncio.to_thread(self._load_history, conversation_id)}
+        if self.semantic_cache is not None and self.vector_store.index is not None and not prepared["history"]:
+            prepared["question_vector"] = await self.vector_store.aembed_query(question)
+            prepared["answer"] = self.semantic_cache.get(prepared["question_vector"], self.vector_store.fingerprint)
+            if prepared["answer"] is not None:
+                return prepared
+        
+        candidates = await self._aretrieve(self._search_query(question, prepared["history"]))
+        # The context build reads the candidates' vectors under the store's read lock, which can wait behind an ingest
+        return await asyncio.to_thread(self._use_context, question, prepared, candidates)
+    
+    def _remember(self, question: str, prepared: dict, answer: str) -> None:
+        """Store a freshly generated answer in the exact and semantic caches"""
+        self.answer_cache.put(prepared["cache_key"], answer)
+        if prepared["question_vector"] is not None:
+            self.semantic_cache.put(prepared["question_vector"], question, answer, self.vector_store.fingerprint)
+    
+    def _add_to_memory(self, question: str, prepared: dict, answer: str) -> None:
+        """Append the turn to its conversation (cached answers included)"""
+        if prepared["conversation_id"] is None or self.memory is None:
+            return
+        try:
+            self.memory.add_interaction(prepared["conversation_id"], question, answer)
+        except Exception as e:
+            logger.error(f"Error saving conversation {prepared['conversation_id']}: {e}")
+    
+    def _record_latency(self, start: float, first_token: Optional[float]) -> None:
+        total = time.perf_counter() - start
+        self.last_latency = {
+            "time_to_first_token": (first_token - start) if first_token is not None else total,
+            "total": total
+        }
+        metrics.inc("answers")
+        metrics.observe("answer", total)
+        metrics.observe("time_to_first_token", self.last_latency["time_to_first_token"])
+        logger.debug(f"Answer latency: first token {self.last_latency['time_to_first_token']:.3f}s, "
+                    f"total {total:.3f}s")
 
-    def get_answer(self, question: str) -> Dict[str, str]:
-        """Get answer with error handling and logging"""
+    def get_answer(self, question: str, conversation_id: Optional[str] = None) -> Dict[str, str]:
+        """Get answer with error handling and logging; with a conversation id, earlier turns are taken into account"""
         try:
-            logger.info(f"Processing question: {question}")
-            answer = self.qa_chain.invoke({"question": question})
+            logger.debug(f"Processing question: {question}")
+            start = time.perf_counter()
+            prepared = self._prepare(question, conversation_id)
+            if prepared["answer"] is not None:
+                self._record_latency(start, None)
+                self._add_to_memory(question, prepared, prepared["answer"])
+                return {"answer": prepared["answer"]}
+            
+            prompt = self._build_prompt(prepared["inputs"])
+            with metrics.span("llm"):
+                answer = self.answer_chain.invoke(prompt)
+            self._record_latency(start, None)
+            self._remember(question, prepared, answer)
+            self._add_to_memory(question, prepared, answer)
             return {"answer": answer}
         except Exception as e:
+            metrics.inc("answer_errors")
             logger.error(f"Error getting answer: {e}")
             return {
                 "error": "Lo siento, hubo un error procesando tu pregunta. Por favor, intenta de nuevo."
             }
+    
+    async def aget_answer(self, question: str, conversation_id: Optional[str] = None) -> Dict[str, str]:
+        """Async version of get_answer; concurrent calls do not block each other"""
+        try:
+            logger.debug(f"Processing question: {question}")
+            start = time.perf_counter()
+            prepared = await self._aprepare(question, conversation_id)
+            if prepared["answer"] is not None:
+                self._record_latency(start, None)
+                await asyncio.to_thread(self._add_to_memory, question, prepared, prepared["answer"])
+                return {"answer": prepared["answer"]}
+            
+            prompt = self._build_prompt(prepared["inputs"])
+            async with self._llm_semaphore():
+                with metrics.span("llm"):
+                    answer = await self.answer_chain.ainvoke(prompt)
+            self._record_latency(start, None)
+            self._remember(question, prepared, answer)
+            await asyncio.to_thread(self._add_to_memory, question, prepared, answer)
+            return {"answer": answer}
+        except Exception as e:
+            metrics.inc("answer_errors")
+            logger.error(f"Error getting answer: {e}")
+            return {
+                "error": "Lo siento, hubo un error procesando tu pregunta. Por favor, intenta de nuevo."
+            }
+    
+    def stream_answer(self, question: str, conversation_id: Optional[str] = None) -> Iterator[str]:
+        """Yield the answer token by token as the LLM generates it (cached answers arrive in one piece)"""
+        logger.debug(f"Processing question (streaming): {question}")
+        start = time.perf_counter()
+        prepared = self._prepare(question, conversation_id)
+        if prepared["answer"] is not None:
+            self._record_latency(start, time.perf_counter())
+            self._add_to_memory(question, prepared, prepared["answer"])
+            yield prepared["answer"]
+            return
+        
+        first_token = None
+        parts = []
+        prompt = self._build_prompt(prepared["inputs"])
+        try:
+            with metrics.span("llm"):
+                for token in self.answer_chain.stream(prompt):
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    parts.append(token)
+                    yield token
+        except Exception as e:
+            metrics.inc("answer_errors")
+            logger.error(f"Error streaming answer: {e}")
+            raise
+        self._record_latency(start, first_token)
+        self._remember(question, prepared, "".join(parts))
+        self._add_to_memory(question, prepared, "".join(parts))
+    
+    async def astream_answer(self, question: str, conversation_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Async version of stream_answer"""
+        logger.debug(f"Processing question (streaming): {question}")
+        start = time.perf_counter()
+        prepared = await self._aprepare(question, conversation_id)
+        if prepared["answer"] is not None:
+            self._record_latency(start, time.perf_counter())
+            await asyncio.to_thread(self._add_to_memory, question, prepared, prepared["answer"])
+            yield prepared["answer"]
+            return
+        
+        first_token = None
+        parts = []
+        prompt = self._build_prompt(prepared["inputs"])
+        try:
+            async with self._llm_semaphore():
+                with metrics.span("llm"):
+                    async for token in self.answer_chain.astream(prompt):
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                        parts.append(token)
+                        yield token
+        except Exception as e:
+            metrics.inc("answer_errors")
+            logger.error(f"Error streaming answer: {e}")
+            raise
+        self._record_latency(start, first_token)
+        self._remember(question, prepared, "".join(parts))
+        await asyncio.to_thread(self._add_to_memory, question, prepared, "".join(parts))
 
     def get_initial_message(self) -> str:
         """Returns the initial greeting message"""
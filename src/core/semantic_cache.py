@@ -0,0 +1,193 @@
+import io
+import json
+import time
+import atexit
+import threading
+import logging
+import faiss
+import numpy as np
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+from src.utils.config import SEMANTIC_CACHE_SAVE_INTERVAL
+from src.utils.files import atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """Answer cache keyed by question-embedding similarity
+
+    Past question embeddings are kept L2-normalized in a small inner-product FAISS index, so a
+    search returns the cosine similarity to the closest cached question. Entries are evicted
+    in LRU order and the whole cache is dropped when the indexed documents change.
+
+    Changes are written to disk by a background thread at most every save_interval seconds
+    (and at exit), so answering never waits for the file to be rewritten.
+
+    Without a dimension, the index takes the one of the saved cache or of the first question
+    embedding, so creating the cache does not need the embedding model to be loaded.
+    """
+
+    def __init__(self, path: Path, dimension: Optional[int] = None, threshold: float = 0.92, max_size: int = 1000,
+                 save_interval: float = SEMANTIC_CACHE_SAVE_INTERVAL):
+        self.path = Path(path)
+        self.dimension = dimension
+        self.threshold = threshold
+        self.max_size = max_size
+        self.save_interval = save_interval
+        self.index: Optional[faiss.Index] = self._create_index(dimension) if dimension else None
+        # id -> {"question", "answer"}, ordered from least to most recently used
+        self.entries: "OrderedDict[int, dict]" = OrderedDict()
+        self.fingerprint: Optional[str] = None
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Serializes writes, so an older snapshot never overwrites a newer one
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._saver: Optional[threading.Thread] = None
+        self.load()
+
+    @staticmethod
+    def _create_index(dimension: int) -> faiss.Index:
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+    def _index_for(self, vector: np.ndarray) -> faiss.Index:
+        """The index, created for the dimension of this vector if it has none or another one (caller holds the lock)"""
+        if self.index is None or self.index.d != vector.shape[1]:
+            if self.entries:
+                logger.warning("Semantic cache does not match the embedding model; starting empty")
+                self.entries.clear()
+            self.dimension = vector.shape[1]
+            self.index = self._create_index(self.dimension)
+        return self.index
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.array(vector, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _check_fingerprint(self, fingerprint: str) -> None:
+        """Invalidate every entry when the set of source documents has changed"""
+        if self.fingerprint != fingerprint:
+            if self.entries:
+                logger.info("Source documents changed; clearing semantic cache")
+            if self.index is not None:
+                self.index.reset()
+            self.entries.clear()
+            self.fingerprint = fingerprint
+
+    def get(self, vector: np.ndarray, fingerprint: str) -> Optional[str]:
+        """Return the cached answer of the most similar past question above the threshold"""
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            vector = self._normalize(vector)
+            index = self._index_for(vector)
+            if index.ntotal == 0:
+                self.misses += 1
+                return None
+            similarities, ids = index.search(vector, 1)
+            entry_id = int(ids[0][0])
+            if entry_id < 0 or similarities[0][0] < self.threshold:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(entry_id)
+            self.hits += 1
+            logger.debug(f"Semantic cache hit (similarity {similarities[0][0]:.3f})")
+            return self.entries[entry_id]["answer"]
+
+    def put(self, vector: np.ndarray, question: str, answer: str, fingerprint: str) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            vector = self._normalize(vector)
+            index = self._index_for(vector)
+            entry_id = self.next_id
+            self.next_id += 1
+            index.add_with_ids(vector, np.array([entry_id], dtype=np.int64))
+            self.entries[entry_id] = {"question": question, "answer": answer}
+            while len(self.entries) > self.max_size:
+                evicted_id, _ = self.entries.popitem(last=False)
+                index.remove_ids(np.array([evicted_id], dtype=np.int64))
+            self._schedule_save()
+
+    def clear(self) -> None:
+        with self._lock:
+            if self.index is not None:
+                self.index.reset()
+            self.entries.clear()
+            self._schedule_save()
+
+    def _schedule_save(self) -> None:
+        """Mark the cache as changed and start the background saver on first use (caller holds the lock)"""
+        self._dirty = True
+        if self._saver is None:
+            self._saver = threading.Thread(target=self._save_loop, daemon=True, name="semantic-cache-save")
+            self._saver.start()
+            atexit.register(self.flush)
+
+    def _save_loop(self) -> None:
+        while True:
+            time.sleep(self.save_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Persist entries (in LRU order) with their vectors in a single file written atomically, if they changed"""
+        with self._save_lock:
+            # Only the snapshot is taken under the lock; lookups and puts go on while it is written
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                ids = list(self.entries.keys())
+                vectors = np.vstack([self.index.reconstruct(i) for i in ids]) if ids \
+                    else np.empty((0, self.dimension or 0), dtype=np.float32)
+                metadata = json.dumps({
+                    "fingerprint": self.fingerprint,
+                    "entries": [self.entries[i] for i in ids]
+                }, ensure_ascii=False)
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                buffer = io.BytesIO()
+                np.savez(buffer, vectors=vectors, metadata=np.array(metadata))
+                atomic_write_bytes(self.path, buffer.getvalue())
+            except Exception as e:
+                logger.error(f"Error saving semantic cache: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path) as data:
+                vectors = data["vectors"]
+                metadata = json.loads(str(data["metadata"]))
+            if (self.dimension and vectors.shape[1] != self.dimension) or len(vectors) != len(metadata["entries"]):
+                logger.warning("Semantic cache on disk does not match the embedding model; starting empty")
+                return
+            self.fingerprint = metadata["fingerprint"]
+            if len(vectors):
+                self._index_for(vectors)
+            for vector, entry in zip(vectors, metadata["entries"]):
+                self.index.add_with_ids(vector.reshape(1, -1), np.array([self.next_id], dtype=np.int64))
+                self.entries[self.next_id] = entry
+                self.next_id += 1
+            logger.info(f"Semantic cache loaded with {len(self.entries)} entries")
+        except Exception as e:
+            logger.error(f"Error loading semantic cache: {e}")
+            self.index = self._create_index(self.dimension) if self.dimension else None
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
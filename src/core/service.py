@@ -0,0 +1,153 @@
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Optional
+from src.utils.hashing import bytes_hash
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+logger = logging.getLogger(__name__)
+
+PROCESSED_PATH = Path("data/processed")
+
+@dataclass
+class IngestResult:
+    """Outcome of adding an uploaded PDF"""
+    doc_id: str
+    title: str
+    duplicate: bool = False
+    replaced: int = 0
+
+class DocumentMentorService:
+    """Embedding model, index, database and QA engine shared by every session of the process
+
+    Searches and answers from any number of sessions run concurrently; the vector store's
+    read/write lock keeps them consistent with ingestion and deletion. Uploads are serialized,
+    so two sessions sending the same file cannot both ingest it.
+    """
+
+    def __init__(self, llm: Optional["BaseChatModel"] = None):
+        # Imported here so that importing this module (e.g. from the UI script) stays cheap:
+        # torch, sentence_transformers, faiss and langchain are only loaded when the service is built
+        from src.core.document_processor import DocumentProcessor
+        from src.core.memory_manager import MemoryManager
+        from src.core.qa_engine import QAEngine
+        from src.data.database import Database
+        from src.data.local_embeddings import LocalEmbeddings
+        from src.data.vector_store import VectorStore
+        from src.utils.config import MEMORY_ENABLED
+
+        # The model loads in parallel with the index, database and LLM client
+        embeddings = LocalEmbeddings()
+        model_loader = threading.Thread(target=embeddings.load, daemon=True, name="model-load")
+        model_loader.start()
+        self.database = Database()
+        self.processor = DocumentProcessor()
+        self.vector_store = VectorStore(embeddings=embeddings)
+        llm = llm or QAEngine._create_llm()
+        # Conversations are kept in the same database as the documents
+        memory = MemoryManager(self.database, llm) if MEMORY_ENABLED else None
+        self.qa_engine = QAEngine(self.vector_store, llm=llm, memory=memory)
+        model_loader.join()
+        embeddings.load()  # no-op once loaded; loads again (and raises) if the thread failed
+        self._ingest_lock = threading.Lock()
+
+    def add_pdf(self, filename: str, data: bytes,
+                progress_callback: Optional[Callable[[int, int], None]] = None,
+                replace: bool = False) -> IngestResult:
+        """Process and index an uploaded PDF
+
+        With replace, it replaces the documents previously uploaded with the same filename;
+        otherwise they are kept and this one is stored next to them under a name of its own.
+        """
+        from src.core.document_processor import StreamingDocument
+
+        with self._ingest_lock:
+            content_hash = bytes_hash(data)
+            existing = self.database.get_document_by_hash(content_hash)
+            if existing is not None:
+                return IngestResult(existing.id, existing.title, duplicate=True)
+
+            PROCESSED_PATH.mkdir(parents=True, exist_ok=True)
+            path = PROCESSED_PATH / Path(filename).name
+            previous = self.database.get_documents_by_path(str(path))
+            if previous and not replace:
+                # Unrelated PDFs often share a name ("manual.pdf"), so only an explicit replace overwrites
+                path = path.with_name(f"{path.stem}-{content_hash[:12]}{path.suffix}")
+                previous = []
+            path.write_bytes(data)
+            # Large PDFs are streamed: their chunks are embedded while later pages are still being extracted,
+            # and their text is not kept, so their row is saved without content
+            doc = self.processor.open_pdf(path)
+            doc.title = Path(filename).stem
+            # The row (and its content hash) is saved only once the chunks are indexed, so a failed
+            # upload is not reported as a duplicate when it is sent again
+            try:
+                if isinstance(doc, StreamingDocument):
+                    self.vector_store.add_document_stream(doc, progress_callback=progress_callback,
+                                                          persist=not previous)
+                else:
+                    self.vector_store.add_document(doc, progress_callback=progress_callback, persist=not previous)
+                self.database.save_document(
+                    doc_id=doc.id,
+                    title=doc.title,
+                    content=doc.content,
+                    file_path=str(doc.source_path),
+                    content_hash=doc.content_hash
+                )
+            except Exception:
+                # Without a row the chunks could never be deleted, so whatever was indexed goes too
+                self.vector_store.delete_document(doc.id, persist=not previous)
+                raise
+            for old in previous:
+                self.delete_document(old.id)
+            return IngestResult(doc.id, doc.title, replaced=len(previous))
+
+    def delete_document(self, doc_id: str) -> None:
+        """Remove a document from the index first, so a failure never leaves chunks without a row"""
+        self.vector_store.delete_document(doc_id)
+        self.database.delete_document(doc_id)
+
+_service: Optional[DocumentMentorService] = None
+_service_lock = threading.Lock()
+_warm_up_thread: Optional[threading.Thread] = None
+
+def get_service() -> DocumentMentorService:
+    """The process-wide service, created on first use
+
+    Streamlit re-executes the app script on every interaction but keeps imported modules,
+    so every rerun and every browser session gets this same instance. While warm_up() is
+    still loading it, this waits for it to finish.
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                logger.info("Loading the embedding model and index")
+                start = time.perf_counter()
+                _service = DocumentMentorService()
+                logger.info(f"Service ready in {time.perf_counter() - start:.1f}s")
+    return _service
+
+def _warm_up() -> None:
+    try:
+        get_service()
+    except Exception as e:
+        # get_service() raises it again for the first caller that needs the service
+        logger.error(f"Error loading the service in the background: {e}")
+
+def warm_up() -> None:
+    """Start building the service in a background thread, so the UI can render meanwhile"""
+    global _warm_up_thread
+    with _service_lock:
+        if _service is not None or _warm_up_thread is not None:
+            return
+        _warm_up_thread = threading.Thread(target=_warm_up, daemon=True, name="service-warm-up")
+        _warm_up_thread.start()
+
+def is_ready() -> bool:
+    """Whether the service is loaded, i.e. get_service() returns without waiting"""
+    return _service is not None
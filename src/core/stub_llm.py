@@ -0,0 +1,52 @@
+import time
+import asyncio
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+class StubChatModel(BaseChatModel):
+    """Offline stand-in for ChatOpenAI used in load tests, benchmarks and local runs
+
+    Replies with a fixed-length answer after simulating LLM latency: `latency` seconds before the
+    first token and `token_latency` seconds per token after it. No network access is needed.
+    """
+
+    latency: float = 0.5
+    token_latency: float = 0.01
+    answer_tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt_chars = sum(len(str(message.content)) for message in messages)
+        words = [f"respuesta({prompt_chars})"] + ["lorem"] * (self.answer_tokens - 1)
+        return [word + " " for word in words]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for token in self._tokens(messages):
+            time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for token in self._tokens(messages):
+            await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
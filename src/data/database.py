@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Text
+from sqlalchemy import create_engine, inspect, text, func, update, delete, Column, Integer, String, DateTime, Text
 from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
-from typing import List, Optional
+from pathlib import Path
+from typing import List, Optional, Tuple
 from src.utils.config import DATABASE_URL
 
 Base = declarative_base()
@@ -15,23 +16,62 @@ class Document(Base):
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     file_path = Column(String, nullable=False)
+    # SHA-256 of the source file, used to skip re-uploads of unchanged files
+    content_hash = Column(String, index=True)
+
+class Conversation(Base):
+    """Database model for a chat conversation and its rolling summary"""
+    __tablename__ = 'conversations'
+
+    id = Column(String, primary_key=True)
+    title = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    summary = Column(Text, nullable=False, default="")
+    # Id of the last message folded into the summary (0 while there is none)
+    summarized_through = Column(Integer, nullable=False, default=0)
+
+class Message(Base):
+    """Database model for one message of a conversation"""
+    __tablename__ = 'messages'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversation_id = Column(String, nullable=False, index=True)
+    role = Column(String, nullable=False)  # user or assistant
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class Database:
-    """Handles database operations for document storage"""
+    """Handles database operations for document and conversation storage"""
     
     def __init__(self):
         self.engine = create_engine(DATABASE_URL)
+        if self.engine.url.get_backend_name() == "sqlite" and self.engine.url.database not in (None, "", ":memory:"):
+            Path(self.engine.url.database).parent.mkdir(parents=True, exist_ok=True)
         Base.metadata.create_all(self.engine)
+        self._migrate()
         self.Session = sessionmaker(bind=self.engine)
     
-    def save_document(self, doc_id: str, title: str, content: str, file_path: str) -> None:
+    def _migrate(self) -> None:
+        """Add columns introduced after a database was created (create_all only creates missing tables)"""
+        columns = {column["name"] for column in inspect(self.engine).get_columns(Document.__tablename__)}
+        if "content_hash" not in columns:
+            with self.engine.begin() as connection:
+                connection.execute(text("ALTER TABLE documents ADD COLUMN content_hash VARCHAR"))
+                connection.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash)"
+                ))
+    
+    def save_document(self, doc_id: str, title: str, content: str, file_path: str,
+                      content_hash: Optional[str] = None) -> None:
         session = self.Session()
         try:
             document = Document(
                 id=doc_id,
                 title=title,
                 content=content,
-                file_path=file_path
+                file_path=file_path,
+                content_hash=content_hash
             )
             session.add(document)
             session.commit()
@@ -45,6 +85,20 @@ class Database:
         finally:
             session.close()
     
+    def get_document_by_hash(self, content_hash: str) -> Optional[Document]:
+        session = self.Session()
+        try:
+            return session.query(Document).filter(Document.content_hash == content_hash).first()
+        finally:
+            session.close()
+    
+    def get_documents_by_path(self, file_path: str) -> List[Document]:
+        session = self.Session()
+        try:
+            return session.query(Document).filter(Document.file_path == file_path).all()
+        finally:
+            session.close()
+    
     def get_all_documents(self) -> List[Document]:
         session = self.Session()
         try:
@@ -62,4 +116,81 @@ class Database:
                 return True
             return False
         finally:
-            session.close()
\ No newline at end of file
+            session.close()
+    
+    def add_messages(self, conversation_id: str, messages: List[Tuple[str, str]], title: str = "") -> None:
+        """Append (role, content) messages, creating the conversation on its first message"""
+        session = self.Session()
+        try:
+            conversation = session.get(Conversation, conversation_id)
+            if conversation is None:
+                conversation = Conversation(id=conversation_id, title=title or "Nueva conversación")
+                session.add(conversation)
+            conversation.updated_at = datetime.utcnow()
+            session.add_all(Message(conversation_id=conversation_id, role=role, content=content)
+                            for role, content in messages)
+            session.commit()
+        finally:
+            session.close()
+    
+    def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
+        session = self.Session()
+        try:
+            return session.get(Conversation, conversation_id)
+        finally:
+            session.close()
+    
+    def get_recent_conversations(self, limit: int = 20) -> List[Conversation]:
+        session = self.Session()
+        try:
+            return session.query(Conversation).order_by(Conversation.updated_at.desc()).limit(limit).all()
+        finally:
+            session.close()
+    
+    def get_messages(self, conversation_id: str, after_id: int = 0, limit: Optional[int] = None,
+                     latest: bool = False) -> List[Message]:
+        """Messages after `after_id` in order; with `latest`, the last `limit` of them instead of the first"""
+        session = self.Session()
+        try:
+            query = session.query(Message).filter(Message.conversation_id == conversation_id, Message.id > after_id)
+            query = query.order_by(Message.id.desc() if latest else Message.id)
+            if limit is not None:
+                query = query.limit(limit)
+            messages = query.all()
+            return messages[::-1] if latest else messages
+        finally:
+            session.close()
+    
+    def count_messages(self, conversation_id: str, after_id: int = 0) -> int:
+        session = self.Session()
+        try:
+            return session.query(func.count(Message.id)).filter(
+                Message.conversation_id == conversation_id, Message.id > after_id
+            ).scalar()
+        finally:
+            session.close()
+    
+    def update_summary(self, conversation_id: str, summary: str, summarized_through: int,
+                       expected_through: int) -> bool:
+        """Store a new summary unless another process already moved it past `expected_through`"""
+        session = self.Session()
+        try:
+            result = session.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id, Conversation.summarized_through == expected_through)
+                .values(summary=summary, summarized_through=summarized_through)
+            )
+            session.commit()
+            return result.rowcount == 1
+        finally:
+            session.close()
+    
+    def delete_conversation(self, conversation_id: str) -> bool:
+        session = self.Session()
+        try:
+            session.execute(delete(Message).where(Message.conversation_id == conversation_id))
+            deleted = session.execute(delete(Conversation).where(Conversation.id == conversation_id)).rowcount
+            session.commit()
+            return deleted == 1
+        finally:
+            session.close()
@@ -0,0 +1,230 @@
+import json
+import os
+import re
+import threading
+import logging
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from src.utils.files import atomic_write_bytes, file_lock, fsync_dir
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (model name, chunk-text hash)
+
+    Each model has its own directory with an append-only float32 matrix (vectors.<gen>.f32, read
+    through a memory map), the chunk hash of every row (keys.<gen>.i64) and meta.json, which holds
+    the committed row count and is replaced atomically, so a crash mid-append only leaves a tail
+    that the next append truncates. Compaction writes a new generation and switches meta.json to it.
+
+    Appends and compactions hold a lock file across processes and start by re-reading meta.json,
+    so the app and `manage_cache.py compact` can share the cache: a process that still maps an
+    older generation switches to the current one before it writes.
+
+    The hash -> row index is a sorted copy of the keys searched with np.searchsorted plus a dict
+    for rows added since it was built, about 16 bytes per row instead of a Python dict entry.
+    """
+
+    def __init__(self, path: Path, model_name: str, dimension: Optional[int] = None, max_bytes: int = 0):
+        self.path = Path(path) / re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._warned_size = False
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock_path = self.path / "lock"
+        with file_lock(self._lock_path):
+            self.meta = self._read_meta(dimension)
+        self._open()
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return self.meta["dimension"]
+
+    @property
+    def row_bytes(self) -> int:
+        return (self.dimension or 0) * 4 + 8
+
+    @property
+    def size_bytes(self) -> int:
+        return self.meta["rows"] * self.row_bytes
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def _vectors_path(self, generation: int) -> Path:
+        return self.path / f"vectors.{generation}.f32"
+
+    def _keys_path(self, generation: int) -> Path:
+        return self.path / f"keys.{generation}.i64"
+
+    def _read_meta(self, dimension: Optional[int]) -> dict:
+        meta_path = self.path / "meta.json"
+        if meta_path.exists():
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if dimension is None or meta["dimension"] == dimension:
+                return meta
+            logger.warning(f"Embedding cache dimension {meta['dimension']} does not match the model ({dimension}); "
+                           f"starting a new cache")
+            self._vectors_path(meta["generation"]).unlink(missing_ok=True)
+            self._keys_path(meta["generation"]).unlink(missing_ok=True)
+            return {"model": self.model_name, "dimension": dimension, "generation": meta["generation"] + 1, "rows": 0}
+        return {"model": self.model_name, "dimension": dimension, "generation": 0, "rows": 0}
+
+    def _write_meta(self, meta: dict) -> None:
+        atomic_write_bytes(self.path / "meta.json", json.dumps(meta).encode('utf-8'))
+        self.meta = meta
+
+    def _refresh(self) -> None:
+        """Reopen the cache if another process appended to it or compacted it (caller holds the file lock)"""
+        meta_path = self.path / "meta.json"
+        if not meta_path.exists():
+            return
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if (meta["generation"], meta["rows"]) != (self.meta["generation"], self.meta["rows"]):
+            self.meta = meta
+            self._open()
+
+    def _open(self) -> None:
+        """Map the committed rows and rebuild the sorted key index"""
+        rows = self.meta["rows"]
+        generation = self.meta["generation"]
+        if rows:
+            self._vectors = np.memmap(self._vectors_path(generation), dtype=np.float32, mode='r',
+                                      shape=(rows, self.dimension))
+        else:
+            self._vectors = np.empty((0, self.dimension or 0), dtype=np.float32)
+        keys = self._read_keys()
+        self._order = np.argsort(keys, kind='stable')
+        self._sorted_keys = keys[self._order]
+        self._overlay: Dict[int, int] = {}
+
+    def _read_keys(self) -> np.ndarray:
+        rows = self.meta["rows"]
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        return np.fromfile(self._keys_path(self.meta["generation"]), dtype=np.int64, count=rows)
+
+    def _lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """Row of each hash, or -1 when it is not cached"""
+        rows = np.full(len(hashes), -1, dtype=np.int64)
+        if len(self._sorted_keys):
+            positions = np.minimum(np.searchsorted(self._sorted_keys, hashes), len(self._sorted_keys) - 1)
+            found = self._sorted_keys[positions] == hashes
+            rows[found] = self._order[positions[found]]
+        if self._overlay:
+            for i in np.flatnonzero(rows < 0):
+                rows[i] = self._overlay.get(int(hashes[i]), -1)
+        return rows
+
+    def get(self, hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return an (n, dim) matrix with the cached vectors filled in, and the indexes of the misses"""
+        hashes = np.asarray(hashes, dtype=np.int64)
+        with self._lock:
+            rows = self._lookup(hashes)
+            vectors = np.zeros((len(hashes), self.dimension or 0), dtype=np.float32)
+            found = rows >= 0
+            if found.any():
+                vectors[found] = self._vectors[rows[found]]
+        missing = np.flatnonzero(~found)
+        self.hits += len(hashes) - len(missing)
+        self.misses += len(missing)
+        return vectors, missing
+
+    def put(self, hashes: np.ndarray, vectors: np.ndarray) -> None:
+        """Append vectors for hashes that are not cached yet"""
+        hashes = np.asarray(hashes, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            if self.meta["dimension"] is None:
+                self.meta["dimension"] = int(vectors.shape[1])
+            new = self._lookup(hashes) < 0
+            # Keep the first occurrence of hashes repeated within the batch
+            _, first = np.unique(hashes, return_index=True)
+            new &= np.isin(np.arange(len(hashes)), first)
+            if not new.any():
+                return
+            hashes, vectors = hashes[new], vectors[new]
+
+            meta = dict(self.meta)
+            start = meta["rows"]
+            generation = meta["generation"]
+            for file_path, data, row_size in ((self._vectors_path(generation), vectors, self.dimension * 4),
+                                              (self._keys_path(generation), hashes, 8)):
+                with open(file_path, 'ab') as f:
+                    # Drop any tail left behind by a previous crash before appending
+                    if f.seek(0, os.SEEK_END) != start * row_size:
+                        f.truncate(start * row_size)
+                    f.write(data.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            meta["rows"] = start + len(hashes)
+            self._write_meta(meta)
+
+            self._vectors = np.memmap(self._vectors_path(generation), dtype=np.float32, mode='r',
+                                      shape=(meta["rows"], self.dimension))
+            for i, key in enumerate(hashes.tolist()):
+                self._overlay[key] = start + i
+
+        if self.max_bytes and self.size_bytes > self.max_bytes and not self._warned_size:
+            self._warned_size = True
+            logger.warning(f"Embedding cache is {self.size_bytes / 2**20:.0f} MB, above its "
+                           f"{self.max_bytes / 2**20:.0f} MB limit; run `python manage_cache.py compact`")
+
+    def compact(self, keep: Optional[np.ndarray] = None, max_bytes: Optional[int] = None) -> int:
+        """Rewrite the cache without evicted rows and return how many were evicted
+
+        keep: chunk hashes to retain; any other row is evicted.
+        max_bytes: evict the oldest rows until the cache fits (defaults to the configured limit).
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock, file_lock(self._lock_path):
+            self._refresh()
+            keys = self._read_keys()
+            kept = np.arange(len(keys))
+            if keep is not None:
+                kept = kept[np.isin(keys, np.asarray(keep, dtype=np.int64))]
+            if max_bytes and self.row_bytes and len(kept) * self.row_bytes > max_bytes:
+                kept = kept[len(kept) - max_bytes // self.row_bytes:]
+            evicted = len(keys) - len(kept)
+            if not evicted:
+                return 0
+
+            old_generation = self.meta["generation"]
+            generation = old_generation + 1
+            with open(self._vectors_path(generation), 'wb') as f:
+                for start in range(0, len(kept), 65536):
+                    f.write(np.ascontiguousarray(self._vectors[kept[start:start + 65536]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._keys_path(generation), 'wb') as f:
+                f.write(keys[kept].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            fsync_dir(self.path)
+            self._write_meta({**self.meta, "generation": generation, "rows": len(kept)})
+            self._open()
+            self._warned_size = False
+
+        self._vectors_path(old_generation).unlink(missing_ok=True)
+        self._keys_path(old_generation).unlink(missing_ok=True)
+        logger.info(f"Embedding cache compacted: {evicted} rows evicted, {len(kept)} kept")
+        return evicted
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "rows": len(self),
+            "size_mb": self.size_bytes / 2**20,
+            "max_mb": self.max_bytes / 2**20,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,154 @@
+import faiss
+import logging
+import numpy as np
+from typing import Optional
+from src.utils.config import (
+    FAISS_INDEX_TYPE, FAISS_NLIST, FAISS_PQ_M, FAISS_PQ_NBITS,
+    FAISS_HNSW_M, FAISS_NPROBE, FAISS_EF_SEARCH, VECTOR_PRECISION
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# Storage of the vectors held by flat, ivf_flat and hnsw indexes (ivf_pq always stores PQ codes)
+PRECISIONS = ("float32", "float16", "int8")
+SQ_TYPES = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+# int8 ranges learned from fewer vectors than this are relearned each time the index doubles
+SQ_RETRAIN_MAX_VECTORS = 65536
+
+# FAISS recommends at least ~39 training points per centroid
+TRAINING_POINTS_PER_CENTROID = 39
+
+def requires_training(index_type: str = FAISS_INDEX_TYPE) -> bool:
+    return index_type in ("ivf_flat", "ivf_pq")
+
+def training_threshold(index_type: str = FAISS_INDEX_TYPE) -> int:
+    """Minimum number of vectors before an index of this type is trained"""
+    if index_type == "ivf_flat":
+        return TRAINING_POINTS_PER_CENTROID * FAISS_NLIST
+    if index_type == "ivf_pq":
+        return TRAINING_POINTS_PER_CENTROID * max(FAISS_NLIST, 2 ** FAISS_PQ_NBITS)
+    return 0
+
+def create_index(dimension: int, index_type: str = FAISS_INDEX_TYPE, nlist: Optional[int] = None,
+                 pq_m: Optional[int] = None, hnsw_m: Optional[int] = None,
+                 precision: str = VECTOR_PRECISION) -> faiss.Index:
+    """Create an empty (untrained) FAISS index of the given type; unset parameters come from config
+
+    With precision float16 or int8, flat, ivf_flat and hnsw store scalar-quantized vectors
+    (2 or 1 bytes per dimension instead of 4); int8 learns per-dimension ranges when trained.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type '{index_type}'. Expected one of {INDEX_TYPES}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown vector precision '{precision}'. Expected one of {PRECISIONS}")
+    nlist = nlist or FAISS_NLIST
+    pq_m = pq_m or FAISS_PQ_M
+    sq_type = SQ_TYPES.get(precision)
+
+    if index_type == "flat":
+        if sq_type is not None:
+            return faiss.IndexScalarQuantizer(dimension, sq_type, faiss.METRIC_L2)
+        return faiss.IndexFlatL2(dimension)
+    if index_type == "hnsw":
+        if sq_type is not None:
+            return faiss.IndexHNSWSQ(dimension, sq_type, hnsw_m or FAISS_HNSW_M)
+        return faiss.IndexHNSWFlat(dimension, hnsw_m or FAISS_HNSW_M)
+
+    quantizer = faiss.IndexFlatL2(dimension)
+    if index_type == "ivf_flat":
+        if sq_type is not None:
+            return faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, sq_type, faiss.METRIC_L2)
+        return faiss.IndexIVFFlat(quantizer, dimension, nlist)
+    if dimension % pq_m != 0:
+        raise ValueError(f"FAISS_PQ_M={pq_m} must divide the embedding dimension {dimension}")
+    return faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, FAISS_PQ_NBITS)
+
+def build_index(vectors: np.ndarray, index_type: str = FAISS_INDEX_TYPE,
+                trained_index: Optional[faiss.Index] = None, ids: Optional[np.ndarray] = None,
+                precision: str = VECTOR_PRECISION) -> faiss.Index:
+    """Build an index over vectors, training it when possible and falling back to flat otherwise
+
+    The index is wrapped in an IndexIDMap so search results are chunk ids (default 0..n-1) even
+    after deleted vectors have been purged.
+    """
+    dimension = vectors.shape[1]
+    if precision == "int8" and len(vectors) == 0:
+        # int8 learns each dimension's range from the vectors; float16 until a rebuild has some
+        precision = "float16"
+
+    if requires_training(index_type):
+        if trained_index is not None:
+            index = trained_index
+        elif len(vectors) >= training_threshold(index_type):
+            logger.info(f"Training {index_type} index on {len(vectors)} vectors...")
+            index = create_index(dimension, index_type, precision=precision)
+            index.train(vectors)
+        else:
+            logger.info(f"{len(vectors)} vectors is below the {index_type} training threshold "
+                        f"({training_threshold(index_type)}); using a flat index for now")
+            index = create_index(dimension, "flat", precision=precision)
+    else:
+        index = create_index(dimension, index_type, precision=precision)
+    if not index.is_trained:
+        # int8 scalar quantizers only need the value range of each dimension
+        index.train(vectors)
+
+    configure_search(index)
+    id_map = faiss.IndexIDMap(index)
+    id_map.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64) if ids is None else ids)
+    return id_map
+
+def inner_index(index: faiss.Index) -> faiss.Index:
+    """Return the index wrapped by an IndexIDMap (or the index itself)"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+def ids_of(index: faiss.IndexIDMap) -> np.ndarray:
+    """Chunk ids of the vectors in an IndexIDMap, in storage order"""
+    return faiss.vector_to_array(index.id_map)
+
+def index_type_of(index: faiss.Index) -> str:
+    """Return the INDEX_TYPES name of an existing index"""
+    index = inner_index(index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, (faiss.IndexIVFFlat, faiss.IndexIVFScalarQuantizer)):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+def precision_of(index: faiss.Index) -> str:
+    """Return the PRECISIONS name of the vectors stored by an existing index (float32 for ivf_pq)"""
+    index = inner_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        for precision, sq_type in SQ_TYPES.items():
+            if index.sq.qtype == sq_type:
+                return precision
+    return "float32"
+
+def is_lossy(index: faiss.Index) -> bool:
+    """Whether search distances are approximate because the index stores compressed vectors"""
+    return index_type_of(index) == "ivf_pq" or precision_of(index) != "float32"
+
+def configure_search(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """Apply the nprobe (IVF) / efSearch (HNSW) search-time knobs to an index"""
+    index = inner_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe or FAISS_NPROBE
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or FAISS_EF_SEARCH
+
+def search_params(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """Search parameters restricting results to `selector`, keeping the index's nprobe / efSearch"""
+    inner = inner_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
@@ -0,0 +1,246 @@
+import io
+import json
+import re
+import time
+import logging
+import numpy as np
+from pathlib import Path
+from typing import Container, Dict, Iterable, List, Optional, Tuple
+from src.utils.files import atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+# Identifiers such as os.path.join, get_answer or ERR-404 are kept whole and also split into parts
+TOKEN_PATTERN = re.compile(r"\w+(?:[.\-:/]\w+)*")
+PART_PATTERN = re.compile(r"[^\W_]+")
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+class BM25Index:
+    """In-process inverted index over chunk texts, ranked with Okapi BM25
+
+    Postings live in CSR arrays (term id -> slice of chunk ids and term frequencies), plus
+    per-term lists for chunks added since the arrays were built. The lists are merged into
+    the arrays once they hold more than MERGE_RATIO of the postings, so adds stay cheap.
+
+    A query scores its terms rarest first and stops before a term whose posting list would not
+    fit in what is left of `budget_ms`, estimated from the measured cost per posting (the rarest
+    term is always scored). Identifiers and error codes are rare, so they are never skipped;
+    only the most common, lowest-weight terms are.
+
+    Deleted chunks are filtered at query time until remove() drops them from the postings, which
+    the vector store does when it purges its tombstones.
+    """
+
+    MERGE_RATIO = 0.1
+    # Chunks added since the last snapshot are re-tokenized from the log on startup; bound them
+    SNAPSHOT_RATIO = 0.1
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.empty(0, dtype=np.int32)
+        self.tfs = np.empty(0, dtype=np.float32)
+        self.doc_len = np.zeros(1024, dtype=np.float32)
+        self.next_id = 0
+        self.total_len = 0.0
+        # Chunks dropped from the postings by remove(); they no longer count for BM25 statistics
+        self.removed = 0
+        self._removed_unsaved = False
+        self._delta: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._delta_postings = 0
+        # Number of chunks covered by the last snapshot written with save()
+        self.saved_id = 0
+        self._seconds_per_posting = 2e-8
+
+    def __len__(self) -> int:
+        return self.next_id
+
+    @property
+    def live(self) -> int:
+        return self.next_id - self.removed
+
+    def needs_snapshot(self) -> bool:
+        unsaved = self.next_id - self.saved_id
+        return self._removed_unsaved or (unsaved > 0 and unsaved >= self.SNAPSHOT_RATIO * self.saved_id)
+
+    def add(self, chunk_id: int, text: str) -> None:
+        """Index a chunk; ids must be added in increasing order"""
+        tokens = tokenize(text)
+        if chunk_id >= len(self.doc_len):
+            doc_len = np.zeros(max(2 * len(self.doc_len), chunk_id + 1, 1024), dtype=np.float32)
+            doc_len[:self.next_id] = self.doc_len[:self.next_id]
+            self.doc_len = doc_len
+        self.doc_len[chunk_id] = len(tokens)
+        self.total_len += len(tokens)
+        self.next_id = chunk_id + 1
+
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            ids, tfs = self._delta.setdefault(token, ([], []))
+            ids.append(chunk_id)
+            tfs.append(count)
+        self._delta_postings += len(counts)
+        if self._delta_postings > self.MERGE_RATIO * len(self.doc_ids) + 10000:
+            self._merge()
+
+    def _merge(self) -> None:
+        """Fold the per-term lists into the CSR arrays"""
+        if not self._delta:
+            return
+        for token in self._delta:
+            if token not in self.vocab:
+                self.vocab[token] = len(self.vocab)
+        base_terms = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+        delta_terms = np.concatenate([
+            np.full(len(ids), self.vocab[token], dtype=np.int64) for token, (ids, _) in self._delta.items()
+        ])
+        delta_ids = np.concatenate([np.array(ids, dtype=np.int32) for ids, _ in self._delta.values()])
+        delta_tfs = np.concatenate([np.array(tfs, dtype=np.float32) for _, tfs in self._delta.values()])
+
+        terms = np.concatenate([base_terms, delta_terms])
+        # Existing postings come first and hold smaller ids, so a stable sort keeps each list in id order
+        order = np.argsort(terms, kind='stable')
+        self.doc_ids = np.concatenate([self.doc_ids, delta_ids])[order]
+        self.tfs = np.concatenate([self.tfs, delta_tfs])[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=len(self.vocab)))])
+        self._delta = {}
+        self._delta_postings = 0
+
+    def remove(self, chunk_ids: Iterable[int]) -> int:
+        """Drop chunks from the postings; returns how many were still indexed"""
+        ids = np.fromiter(chunk_ids, dtype=np.int64)
+        self._merge()
+        if not len(ids) or not len(self.doc_ids):
+            return 0
+        drop = np.isin(self.doc_ids, ids)
+        if not drop.any():
+            return 0
+        removed = np.unique(self.doc_ids[drop])
+        terms = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))[~drop]
+        self.doc_ids = self.doc_ids[~drop]
+        self.tfs = self.tfs[~drop]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=len(self.vocab)))])
+        self.total_len -= float(self.doc_len[removed].sum())
+        self.doc_len[removed] = 0
+        self.removed += len(removed)
+        self._removed_unsaved = True
+        return len(removed)
+
+    def _postings(self, token: str) -> Tuple[np.ndarray, np.ndarray]:
+        ids = np.empty(0, dtype=np.int32)
+        tfs = np.empty(0, dtype=np.float32)
+        term_id = self.vocab.get(token)
+        if term_id is not None:
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            ids, tfs = self.doc_ids[start:end], self.tfs[start:end]
+        delta = self._delta.get(token)
+        if delta is not None:
+            ids = np.concatenate([ids, np.array(delta[0], dtype=np.int32)])
+            tfs = np.concatenate([tfs, np.array(delta[1], dtype=np.float32)])
+        return ids, tfs
+
+    def _document_frequency(self, token: str) -> int:
+        term_id = self.vocab.get(token)
+        base = int(self.indptr[term_id + 1] - self.indptr[term_id]) if term_id is not None else 0
+        delta = self._delta.get(token)
+        return base + (len(delta[0]) if delta is not None else 0)
+
+    def search(self, query: str, k: int, exclude: Container[int] = frozenset(),
+               budget_ms: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Top-k (chunk id, BM25 score) pairs; chunk ids in `exclude` are never returned"""
+        start = time.perf_counter()
+        if not self.next_id:
+            return []
+        frequencies = {token: self._document_frequency(token) for token in set(tokenize(query))}
+        terms = sorted((df, token) for token, df in frequencies.items() if df)
+        if not terms:
+            return []
+
+        average_len = self.total_len / max(self.live, 1) or 1.0
+        matched_ids = []
+        matched_scores = []
+        for df, token in terms:
+            term_start = time.perf_counter()
+            if matched_ids and budget_ms is not None \
+                    and term_start - start + df * self._seconds_per_posting > budget_ms / 1000:
+                logger.debug(f"Keyword search budget reached; skipped {len(terms) - len(matched_ids)} common terms")
+                break
+            ids, tfs = self._postings(token)
+            idf = np.log(1 + (self.live - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[ids] / average_len)
+            matched_ids.append(ids)
+            matched_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+            if df >= 1000:
+                # Running estimate of the scoring cost, used to predict whether the next term fits
+                self._seconds_per_posting = 0.8 * self._seconds_per_posting \
+                    + 0.2 * (time.perf_counter() - term_start) / df
+
+        if len(matched_ids) == 1:
+            # Posting lists hold each chunk once, so a single term needs no accumulation
+            ids, scores = matched_ids[0], matched_scores[0]
+        else:
+            ids = np.concatenate(matched_ids)
+            scores = np.concatenate(matched_scores)
+            if len(ids) > self.next_id // 4:
+                totals = np.bincount(ids, weights=scores, minlength=self.next_id)
+                ids = np.flatnonzero(totals)
+                scores = totals[ids]
+            else:
+                ids, inverse = np.unique(ids, return_inverse=True)
+                scores = np.bincount(inverse, weights=scores)
+        # Rank a few more than k so excluded (deleted) chunks can be dropped without a full sort
+        limit = min(len(ids), k + 32)
+        while True:
+            top = np.argpartition(-scores, limit - 1)[:limit] if limit < len(ids) else np.arange(len(ids))
+            top = top[np.argsort(-scores[top], kind='stable')]
+            results = [(int(ids[i]), float(scores[i])) for i in top if int(ids[i]) not in exclude][:k]
+            if len(results) == k or limit == len(ids):
+                return results
+            limit = min(len(ids), limit * 4)
+
+    def save(self, path: Path) -> None:
+        """Write a snapshot of the whole index atomically"""
+        self._merge()
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            terms=np.frombuffer("\n".join(self.vocab).encode('utf-8'), dtype=np.uint8),
+            indptr=self.indptr,
+            doc_ids=self.doc_ids,
+            tfs=self.tfs,
+            doc_len=self.doc_len[:self.next_id],
+            meta=np.array(json.dumps({"next_id": self.next_id, "total_len": self.total_len, "removed": self.removed,
+                                      "k1": self.k1, "b": self.b}))
+        )
+        atomic_write_bytes(path, buffer.getvalue())
+        self.saved_id = self.next_id
+        self._removed_unsaved = False
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            index = cls(meta["k1"], meta["b"])
+            terms = data["terms"].tobytes().decode('utf-8')
+            index.vocab = {term: i for i, term in enumerate(terms.split("\n"))} if terms else {}
+            index.indptr = data["indptr"]
+            index.doc_ids = data["doc_ids"]
+            index.tfs = data["tfs"]
+            index.doc_len = np.array(data["doc_len"], dtype=np.float32)
+        index.next_id = meta["next_id"]
+        index.total_len = meta["total_len"]
+        index.removed = meta.get("removed", 0)
+        index.saved_id = index.next_id
+        return index
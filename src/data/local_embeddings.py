@@ -1,16 +1,77 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
+from typing import List, Optional
+import threading
+import numpy as np
 import logging
+from src.utils.config import EMBEDDING_BATCH_SIZE, EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE, EMBEDDING_THREADS
 
 logger = logging.getLogger(__name__)
 
 class LocalEmbeddings:
-    """Local embeddings using Sentence-Transformers"""
+    """Local embeddings using Sentence-Transformers
     
-    def __init__(self):
-        logger.info("Initializing Sentence-Transformers model...")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        logger.info("Model loaded successfully")
+    The model (and torch) is loaded on first use, or ahead of it by calling load() from a
+    background thread, so creating the object is instant. EMBEDDING_BACKEND selects how it
+    runs on CPU: torch (float32), torch-int8 (dynamically quantized linear layers) or onnx
+    (ONNX Runtime, needs optimum[onnxruntime]).
+    """
+    
+    def __init__(self, backend: str = EMBEDDING_BACKEND):
+        self.model_name = 'all-MiniLM-L6-v2'
+        self.backend = backend
+        self._model = None
+        self._load_lock = threading.Lock()
+    
+    @property
+    def variant(self) -> str:
+        """Model name plus the backend when its vectors differ slightly from float32 torch ones"""
+        if self.backend == 'torch':
+            return self.model_name
+        if self.backend == 'onnx' and EMBEDDING_ONNX_FILE:
+            return f"{self.model_name}-{EMBEDDING_ONNX_FILE.rsplit('/', 1)[-1].removesuffix('.onnx')}"
+        return f"{self.model_name}-{self.backend}"
+    
+    def load(self) -> None:
+        """Load the model now; safe to call from several threads, only the first one loads it"""
+        if self._model is not None:
+            return
+        with self._load_lock:
+            if self._model is None:
+                logger.info(f"Initializing Sentence-Transformers model ({self.backend})...")
+                if EMBEDDING_THREADS > 0:
+                    import torch
+                    torch.set_num_threads(EMBEDDING_THREADS)
+                try:
+                    self._model = self._load_model(self.backend)
+                except Exception as e:
+                    if self.backend == 'torch':
+                        raise
+                    logger.warning(f"Could not load the {self.backend} backend, using torch: {e}")
+                    self.backend = 'torch'
+                    self._model = self._load_model('torch')
+                logger.info("Model loaded successfully")
+    
+    def _load_model(self, backend: str):
+        from sentence_transformers import SentenceTransformer
+        if backend == 'onnx':
+            model_kwargs = {"file_name": EMBEDDING_ONNX_FILE} if EMBEDDING_ONNX_FILE else None
+            return SentenceTransformer(self.model_name, backend='onnx', model_kwargs=model_kwargs)
+        model = SentenceTransformer(self.model_name)
+        if backend == 'torch-int8':
+            import torch
+            # int8 weights for the linear layers; activations are quantized on the fly per batch
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend != 'torch':
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        return model
+    
+    @property
+    def model(self):
+        self.load()
+        return self._model
+    
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
     
     def embed_query(self, text: str) -> List[float]:
         """Create embedding for a single text"""
@@ -18,4 +79,14 @@ class LocalEmbeddings:
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Create embeddings for multiple texts at once"""
-        return self.model.encode(texts).tolist() 
\ No newline at end of file
+        return self.embed_documents_array(texts).tolist()
+    
+    def embed_documents_array(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """Create a float32 (n, dim) embedding matrix for multiple texts in batched forward passes"""
+        vectors = self.model.encode(
+            texts,
+            batch_size=batch_size or EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
@@ -0,0 +1,95 @@
+import time
+import queue
+import asyncio
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Coalesces concurrent single-item requests into batched calls
+
+    A worker thread takes the first pending item together with any others already queued. Only
+    while concurrent requests are arriving (more than one item was queued now or in the previous
+    batch) does it keep collecting for up to `max_wait_ms` or until `max_batch_size` items are
+    queued, so an isolated request is dispatched straight away. It calls `process_batch` once with
+    the whole list and resolves each caller's future with its own result. `process_batch` must
+    return one result per input, in order.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0, name: str = "micro-batcher"):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.items = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=name)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        """Submit an item and block until its batch has been processed"""
+        return self.submit(item).result()
+
+    async def asubmit(self, item: Any) -> Any:
+        """Submit an item and await its result without occupying a thread"""
+        return await asyncio.wrap_future(self.submit(item))
+
+    def close(self) -> None:
+        """Stop the worker thread once the items already submitted are processed"""
+        self._queue.put(None)
+
+    def _run(self) -> None:
+        concurrent = False
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                concurrent = concurrent or len(batch) > 1
+                timeout = deadline - time.monotonic() if concurrent else 0
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            # The next batch waits for stragglers only if this one coalesced several requests
+            concurrent = len(batch) > 1
+            self._process(batch)
+            if stopping:
+                return
+
+    def _process(self, batch: list) -> None:
+        items = [item for item, _ in batch]
+        try:
+            results = self.process_batch(items)
+        except Exception as e:
+            logger.error(f"Error processing batch of {len(items)}: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(items)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "average_batch_size": self.items / self.batches if self.batches else 0.0
+        }
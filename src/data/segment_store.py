@@ -0,0 +1,470 @@
+import json
+import os
+import threading
+import logging
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from pathlib import Path
+from src.utils.files import atomic_write_bytes, fsync_dir
+from src.utils.hashing import chunk_hash
+
+logger = logging.getLogger(__name__)
+
+class SegmentStore:
+    """Append-only on-disk storage of chunk vectors (numpy segments) and chunk metadata (JSONL log)
+
+    Only data referenced by manifest.json is considered committed. The manifest is replaced
+    atomically after each append, so a crash mid-write leaves at most orphaned segment files
+    or an uncommitted log tail, both of which are discarded on the next open.
+
+    chunks.offsets is a memory-mapped int64 array with the byte offset of every log record, so
+    metadata is read by id with a single positioned read instead of being loaded into the heap.
+    chunks.hashes holds a 64-bit hash of every chunk's text, used to find duplicate chunks.
+    chunk_refs.jsonl records the documents of chunks that are shared or deleted (an empty list).
+    A read_only store (a search replica) never writes: offsets or hashes missing from disk are
+    rebuilt in memory and left for the writer to persist.
+
+    Once there are compact_threshold segments, runs of adjacent segments of similar size are merged
+    in the background. No segment of a merge is more than COMPACT_SIZE_RATIO times the others
+    together, so a merge makes the segment a vector is in at least 1.5 times larger and each vector
+    is rewritten O(log n) times in total.
+    """
+
+    MANIFEST_VERSION = 1
+    COMPACT_SIZE_RATIO = 2
+
+    def __init__(self, path: Path, compact_threshold: int = 8, read_only: bool = False):
+        self.path = Path(path)
+        self.read_only = read_only
+        self.segments_path = self.path / "segments"
+        self.log_path = self.path / "chunks.log"
+        self.manifest_path = self.path / "manifest.json"
+        self.offsets_path = self.path / "chunks.offsets"
+        self.hashes_path = self.path / "chunks.hashes"
+        self.refs_path = self.path / "chunk_refs.jsonl"
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._log_file = None
+        self._read_lock = threading.Lock()
+        self._offsets: Optional[np.ndarray] = None
+        self._hashes: Optional[np.ndarray] = None
+        # Sorted view of the hashes present at load time, plus a dict for chunks appended since
+        self._sorted_hashes: Optional[np.ndarray] = None
+        self._sorted_ids: Optional[np.ndarray] = None
+        self._hash_overlay: Dict[int, List[int]] = {}
+        # Segment name -> memory map, for reading individual vectors (exact re-ranking)
+        self._segment_maps: Dict[str, np.ndarray] = {}
+        if not read_only:
+            self.segments_path.mkdir(parents=True, exist_ok=True)
+        self.manifest = self._read_manifest()
+        self._sync_offsets()
+        self._open_readers()
+        self._sync_hashes()
+
+    @property
+    def exists(self) -> bool:
+        return self.manifest_path.exists()
+
+    @property
+    def next_id(self) -> int:
+        return self.manifest["next_id"]
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return self.manifest["dimension"]
+
+    def _read_manifest(self) -> dict:
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {
+            "version": self.MANIFEST_VERSION,
+            "dimension": None,
+            "next_id": 0,
+            "log_size": 0,
+            "segments": []
+        }
+
+    def _write_manifest(self, manifest: dict) -> None:
+        atomic_write_bytes(self.manifest_path, json.dumps(manifest).encode('utf-8'))
+        self.manifest = manifest
+
+    def _sync_offsets(self) -> None:
+        """Rebuild chunks.offsets from the log if it is missing or behind the manifest"""
+        count = self.manifest["next_id"]
+        existing = self.offsets_path.stat().st_size // 8 if self.offsets_path.exists() else 0
+        if existing >= count + 1:
+            return
+
+        logger.info("Rebuilding chunk offsets from metadata log...")
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        position = 0
+        if self.log_path.exists():
+            with open(self.log_path, 'rb') as f:
+                for i in range(count):
+                    position += len(f.readline())
+                    offsets[i + 1] = position
+        if self.read_only:
+            self._offsets = offsets
+            return
+        atomic_write_bytes(self.offsets_path, offsets.tobytes())
+
+    def _sync_hashes(self) -> None:
+        """Rebuild chunks.hashes from the log if it is missing or behind the manifest"""
+        count = self.manifest["next_id"]
+        existing = self.hashes_path.stat().st_size // 8 if self.hashes_path.exists() else 0
+        if self.hashes_path.exists() and existing >= count:
+            return
+
+        logger.info("Rebuilding chunk hashes from metadata log...")
+        hashes = np.fromiter(
+            (chunk_hash(record['chunk']) for record in self.iter_records()), dtype=np.int64, count=count
+        )
+        if self.read_only:
+            self._hashes = hashes
+            return
+        atomic_write_bytes(self.hashes_path, hashes.tobytes())
+        self._open_readers()
+
+    def _open_readers(self) -> None:
+        """(Re)map the committed offsets and hashes; O(1) regardless of corpus size"""
+        count = self.manifest["next_id"]
+        if self._log_file is None and self.log_path.exists():
+            self._log_file = open(self.log_path, 'rb')
+        # A read-only store keeps the offsets it rebuilt in memory when the file is behind
+        if self.offsets_path.exists() and self.offsets_path.stat().st_size >= (count + 1) * 8:
+            self._offsets = np.memmap(self.offsets_path, dtype=np.int64, mode='r', shape=(count + 1,))
+        if count and self.hashes_path.exists() and self.hashes_path.stat().st_size >= count * 8:
+            self._hashes = np.memmap(self.hashes_path, dtype=np.int64, mode='r', shape=(count,))
+        else:
+            self._hashes = np.empty(0, dtype=np.int64)
+
+    def chunk_hashes(self) -> np.ndarray:
+        """Hashes of all committed chunks, indexed by chunk id"""
+        return np.array(self._hashes[:self.next_id])
+
+    def find_chunk(self, text: str, text_hash: Optional[int] = None, skip: Iterable[int] = ()) -> Optional[int]:
+        """Return the id of a committed chunk with exactly this text, if any, ignoring ids in `skip`"""
+        text_hash = chunk_hash(text) if text_hash is None else text_hash
+        if self._sorted_hashes is None:
+            loaded = self._hashes[:len(self._hashes)]
+            self._sorted_ids = np.argsort(loaded, kind='stable')
+            self._sorted_hashes = np.asarray(loaded)[self._sorted_ids]
+
+        left = int(np.searchsorted(self._sorted_hashes, text_hash, side='left'))
+        right = int(np.searchsorted(self._sorted_hashes, text_hash, side='right'))
+        candidates = [int(i) for i in self._sorted_ids[left:right]] + self._hash_overlay.get(text_hash, [])
+        for chunk_id in candidates:
+            if chunk_id in skip:
+                continue
+            # Confirm on the text itself so a 64-bit hash collision can never merge different chunks
+            if self.get_record(chunk_id)['chunk'] == text:
+                return chunk_id
+        return None
+
+    def _read_range(self, start: int, end: int) -> bytes:
+        if hasattr(os, 'pread'):
+            return os.pread(self._log_file.fileno(), end - start, start)
+        with self._read_lock:
+            self._log_file.seek(start)
+            return self._log_file.read(end - start)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def get_record(self, chunk_id: int) -> dict:
+        """Read a single metadata record by chunk id"""
+        offsets = self._offsets
+        if chunk_id < 0 or chunk_id >= len(offsets) - 1:
+            raise KeyError(chunk_id)
+        record = json.loads(self._read_range(int(offsets[chunk_id]), int(offsets[chunk_id + 1])))
+        record.pop('id', None)
+        return record
+
+    def _write_segment(self, name: str, vectors: np.ndarray) -> None:
+        segment_path = self.segments_path / name
+        tmp_path = segment_path.with_name(name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, vectors)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, segment_path)
+        fsync_dir(self.segments_path)
+
+    def append(self, vectors: np.ndarray, records: List[dict]) -> Tuple[int, int]:
+        """Persist a batch of vectors and their metadata records; returns the assigned id range"""
+        if len(vectors) != len(records):
+            raise ValueError("Vectors and records must have the same length")
+        if not records:
+            return self.next_id, self.next_id
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            manifest = json.loads(json.dumps(self.manifest))
+            if manifest["dimension"] is None:
+                manifest["dimension"] = int(vectors.shape[1])
+            elif manifest["dimension"] != vectors.shape[1]:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match store dimension {manifest['dimension']}")
+
+            start_id = manifest["next_id"]
+            name = f"seg_{start_id:012d}_{len(records)}.npy"
+            self._write_segment(name, vectors)
+
+            encoded = [
+                (json.dumps({"id": start_id + i, **record}, ensure_ascii=False) + "\n").encode('utf-8')
+                for i, record in enumerate(records)
+            ]
+            lines = b"".join(encoded)
+            with open(self.log_path, 'ab') as f:
+                # Drop any tail left behind by a previous crash before appending
+                if f.seek(0, os.SEEK_END) != manifest["log_size"]:
+                    f.truncate(manifest["log_size"])
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+            hashes = np.array([chunk_hash(record['chunk']) for record in records], dtype=np.int64)
+            with open(self.hashes_path, 'ab') as f:
+                if f.seek(0, os.SEEK_END) != start_id * 8:
+                    f.truncate(start_id * 8)
+                f.write(hashes.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            ends = manifest["log_size"] + np.cumsum([len(line) for line in encoded], dtype=np.int64)
+            with open(self.offsets_path, 'r+b') as f:
+                if f.seek(0, os.SEEK_END) != (start_id + 1) * 8:
+                    f.truncate((start_id + 1) * 8)
+                f.seek((start_id + 1) * 8)
+                f.write(ends.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            manifest["segments"].append({"name": name, "start_id": start_id, "count": len(records)})
+            manifest["log_size"] += len(lines)
+            manifest["next_id"] = start_id + len(records)
+            self._write_manifest(manifest)
+            self._open_readers()
+            if self._sorted_hashes is not None:
+                for i, text_hash in enumerate(hashes.tolist()):
+                    self._hash_overlay.setdefault(text_hash, []).append(start_id + i)
+
+        if len(self.manifest["segments"]) >= self.compact_threshold:
+            self.compact_async()
+        return start_id, start_id + len(records)
+
+    def append_refs(self, refs: List[dict]) -> None:
+        """Record the current documents of chunks ({"id", "docs": [{"doc_id", "title"}]} per line)"""
+        if not refs:
+            return
+        lines = "".join(json.dumps(ref, ensure_ascii=False) + "\n" for ref in refs).encode('utf-8')
+        with self._lock, open(self.refs_path, 'a+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    # Drop a torn line left by a crash so it does not swallow the next one
+                    f.seek(0)
+                    f.truncate(f.read().rfind(b"\n") + 1)
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def load_refs(self) -> Dict[int, List[dict]]:
+        """Chunk id -> documents of that chunk, for chunks whose documents changed after they were stored"""
+        refs: Dict[int, List[dict]] = {}
+        if not self.refs_path.exists():
+            return refs
+        with open(self.refs_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    ref = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash; that change was never acknowledged
+                    continue
+                # Later lines replace earlier ones
+                if ref["id"] < self.next_id:
+                    refs[ref["id"]] = ref["docs"]
+        return refs
+
+    def load_vectors(self) -> Optional[np.ndarray]:
+        """Concatenate all committed segments into a single (n, dim) float32 matrix"""
+        segments = list(self.manifest["segments"])
+        if not segments:
+            return None
+        total = sum(segment["count"] for segment in segments)
+        vectors = np.empty((total, self.dimension), dtype=np.float32)
+        offset = 0
+        for segment in segments:
+            data = np.load(self.segments_path / segment["name"], mmap_mode='r')
+            vectors[offset:offset + segment["count"]] = data
+            offset += segment["count"]
+        return vectors
+
+    def _segment_map(self, name: str) -> np.ndarray:
+        segment = self._segment_maps.get(name)
+        if segment is None:
+            segment = self._segment_maps[name] = np.load(self.segments_path / name, mmap_mode='r')
+        return segment
+
+    def get_vectors(self, ids: np.ndarray) -> np.ndarray:
+        """Read the vectors of committed chunks by id through memory maps; only the touched pages are loaded"""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.empty((len(ids), self.dimension), dtype=np.float32)
+        for attempt in range(2):
+            segments = list(self.manifest["segments"])
+            starts = np.array([segment["start_id"] for segment in segments], dtype=np.int64)
+            positions = np.searchsorted(starts, ids, side='right') - 1
+            try:
+                for position in np.unique(positions):
+                    segment = segments[position]
+                    rows = positions == position
+                    vectors[rows] = self._segment_map(segment["name"])[ids[rows] - segment["start_id"]]
+                break
+            except FileNotFoundError:
+                if attempt:
+                    raise
+                # Compacted away (by this store or, for a read-only replica, by the writer process)
+                self._segment_maps.clear()
+                with self._lock:
+                    self.manifest = {**self.manifest, "segments": self._read_manifest()["segments"]}
+        if len(self._segment_maps) > len(segments):
+            live = {segment["name"] for segment in segments}
+            self._segment_maps = {name: data for name, data in self._segment_maps.items() if name in live}
+        return vectors
+
+    def iter_records(self, start: int = 0) -> Iterator[dict]:
+        """Yield committed metadata records (including their id) in id order, from chunk `start` on"""
+        if not self.log_path.exists() or start >= self.next_id:
+            return
+        offset = int(self._offsets[start])
+        remaining = self.manifest["log_size"] - offset
+        with open(self.log_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if remaining <= 0:
+                    break
+                remaining -= len(line)
+                yield json.loads(line)
+
+    def cleanup(self) -> None:
+        """Remove segment files and temp files not referenced by the manifest"""
+        referenced = {segment["name"] for segment in self.manifest["segments"]}
+        for file in self.segments_path.iterdir():
+            if file.name not in referenced:
+                logger.info(f"Removing orphaned segment file {file.name}")
+                file.unlink(missing_ok=True)
+
+    def _merge_run(self, segments: List[dict]) -> Tuple[int, int]:
+        """Run [first, last) of adjacent segments to merge next, or an empty run if none qualifies
+
+        A run qualifies if none of its segments is more than COMPACT_SIZE_RATIO times the size of
+        the others together, so a merge never rewrites a large segment to absorb a small one. The
+        cheapest run per segment removed wins.
+        """
+        best = (0, 0)
+        best_cost = float("inf")
+        for first in range(len(segments)):
+            largest = total = segments[first]["count"]
+            for last in range(first + 1, len(segments)):
+                count = segments[last]["count"]
+                largest, total = max(largest, count), total + count
+                cost = total / (last - first)
+                if largest <= self.COMPACT_SIZE_RATIO * (total - largest) and cost < best_cost:
+                    best, best_cost = (first, last + 1), cost
+        return best
+
+    def compact(self) -> None:
+        """Merge runs of adjacent segments of similar size until below the threshold or none qualifies
+
+        Appends made meanwhile are preserved.
+        """
+        with self._compact_lock:
+            while len(self.manifest["segments"]) >= self.compact_threshold:
+                segments = list(self.manifest["segments"])
+                first, last = self._merge_run(segments)
+                if last - first < 2:
+                    return
+                run = segments[first:last]
+
+                logger.info(f"Compacting {len(run)} of {len(segments)} segments")
+                count = sum(segment["count"] for segment in run)
+                merged = np.concatenate([
+                    np.load(self.segments_path / segment["name"], mmap_mode='r') for segment in run
+                ])
+                start_id = run[0]["start_id"]
+                name = f"seg_{start_id:012d}_{count}_c.npy"
+                self._write_segment(name, merged)
+
+                with self._lock:
+                    # Only appends can have happened meanwhile, and they only add segments at the end
+                    manifest = json.loads(json.dumps(self.manifest))
+                    manifest["segments"][first:last] = [{"name": name, "start_id": start_id, "count": count}]
+                    self._write_manifest(manifest)
+
+                for segment in run:
+                    (self.segments_path / segment["name"]).unlink(missing_ok=True)
+                logger.info(f"Compaction finished: {count} vectors in {name}")
+
+    def compact_async(self) -> None:
+        """Run compaction in a background thread unless one is already running"""
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self._compact_safely, daemon=True)
+        self._compaction_thread.start()
+
+    def _compact_safely(self) -> None:
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"Error compacting segments: {e}")
+
+    def wait_for_compaction(self) -> None:
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+
+class ChunkMetadataMap:
+    """Dict-like view of chunk metadata keyed by chunk id
+
+    Committed chunks are read lazily from the SegmentStore, so a lookup only touches the rows
+    it returns. Chunks added but not yet saved are kept in a small in-memory overlay.
+    """
+
+    def __init__(self, store: SegmentStore):
+        self.store = store
+        self._pending: Dict[int, dict] = {}
+
+    def __getitem__(self, key) -> dict:
+        chunk_id = int(key)
+        if chunk_id in self._pending:
+            return self._pending[chunk_id]
+        return self.store.get_record(chunk_id)
+
+    def __setitem__(self, key, record: dict) -> None:
+        self._pending[int(key)] = record
+
+    def __contains__(self, key) -> bool:
+        chunk_id = int(key)
+        return chunk_id in self._pending or 0 <= chunk_id < len(self.store)
+
+    def __len__(self) -> int:
+        return len(self.store) + len(self._pending)
+
+    def get(self, key, default=None) -> Optional[dict]:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self) -> Iterator[Tuple[int, dict]]:
+        """Iterate over all chunks; streams the log rather than loading it"""
+        for record in self.store.iter_records():
+            yield record.pop('id'), record
+        yield from sorted(self._pending.items())
+
+    def commit(self) -> None:
+        """Drop overlay entries that the store has persisted"""
+        committed = len(self.store)
+        self._pending = {k: v for k, v in self._pending.items() if k >= committed}
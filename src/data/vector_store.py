@@ -1,118 +1,940 @@
+import os
 import json
+import asyncio
+import threading
 import faiss
 import numpy as np
 import logging
-from typing import List, Dict
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from src.data.local_embeddings import LocalEmbeddings
-from src.utils.config import VECTOR_STORE_PATH
-from src.core.document_processor import ProcessedDocument
+from src.data.segment_store import SegmentStore, ChunkMetadataMap
+from src.data.micro_batcher import MicroBatcher
+from src.data.embedding_cache import EmbeddingCache
+from src.data.keyword_index import BM25Index
+from src.data import index_factory
+from src.utils.config import (
+    VECTOR_STORE_PATH, EMBEDDING_BATCH_SIZE, SEGMENT_COMPACT_THRESHOLD, TOMBSTONE_PURGE_RATIO, FAISS_INDEX_TYPE,
+    QUERY_CACHE_SIZE, QUERY_CACHE_TTL, SEARCH_WORKERS, MICRO_BATCH_ENABLED, MICRO_BATCH_SIZE,
+    MICRO_BATCH_MAX_WAIT_MS, EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB,
+    SEARCH_MODE, HYBRID_CANDIDATES, RRF_K, KEYWORD_SEARCH_BUDGET_MS, VECTOR_PRECISION, RERANK_FACTOR
+)
+from src.utils.cache import LRUCache
+from src.utils.files import atomic_write_bytes
+from src.utils.hashing import chunk_hash
+from src.utils.metrics import metrics
+from src.utils.rwlock import RWLock
+from src.core.document_processor import ProcessedDocument, StreamingDocument
 
 logger = logging.getLogger(__name__)
 
+PUBLISHED_PATH = VECTOR_STORE_PATH / "published.json"
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def read_published() -> Optional[dict]:
+    """The latest index snapshot written by publish_index ({"version", "index", "next_id"}), if any"""
+    try:
+        with open(PUBLISHED_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
 class VectorStore:
-    """Manages document embeddings and semantic search using FAISS"""
+    """Manages document embeddings and semantic search using FAISS
+    
+    Safe to share between threads: searches hold the read lock of `self.lock`, changes to the
+    index hold its write lock. New chunks are embedded before the write lock is taken, so
+    searches keep running while a document is being ingested.
     
-    def __init__(self):
-        self.embeddings = LocalEmbeddings()
+    A read_only store is a search replica for another process: it memory-maps the index last
+    written by publish_index() instead of rebuilding it, and never writes to the store directory.
+    An already loaded `embeddings` model can be passed in so replicas do not load it again.
+    """
+    
+    def __init__(self, read_only: bool = False, embeddings: Optional[LocalEmbeddings] = None):
+        self.lock = RWLock()
+        self.read_only = read_only
+        self.embeddings = embeddings or LocalEmbeddings()
         self.index = None
-        self.document_map: Dict[int, str] = {}
+        self.index_type = FAISS_INDEX_TYPE
+        self.precision = VECTOR_PRECISION
+        self.nprobe: Optional[int] = None
+        self.ef_search: Optional[int] = None
+        suffix = "" if self.precision == "float32" else f"_{self.precision}"
+        self.trained_index_path = VECTOR_STORE_PATH / f"trained_{self.index_type}{suffix}.index"
         self.current_id = 0
+        # Incremented whenever the indexed content changes, so callers can invalidate derived caches
+        self.version = 0
+        # Version of the snapshot written by (or, for a replica, loaded from) publish_index
+        self.published_version = 0
+        self.query_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        # Embedding and FAISS search release the GIL, so async callers run them on this bounded pool
+        self.executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="vector-search")
+        # Concurrent queries are coalesced into single model.encode / index.search calls
+        self.query_batcher: Optional[MicroBatcher] = None
+        self.search_batcher: Optional[MicroBatcher] = None
+        if MICRO_BATCH_ENABLED:
+            self.query_batcher = MicroBatcher(
+                self._embed_query_batch, MICRO_BATCH_SIZE, MICRO_BATCH_MAX_WAIT_MS, name="query-embedder"
+            )
+            self.search_batcher = MicroBatcher(
+                self._search_index_batch, MICRO_BATCH_SIZE, MICRO_BATCH_MAX_WAIT_MS, name="index-search"
+            )
+        self.store = SegmentStore(VECTOR_STORE_PATH, compact_threshold=SEGMENT_COMPACT_THRESHOLD, read_only=read_only)
+        self.document_map = ChunkMetadataMap(self.store)
+        # Vectors of every chunk ever embedded, so rebuilding the store does not re-run the model
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if EMBEDDING_CACHE_ENABLED and not read_only:
+            # Never the model's dimension, which would load it: an empty store leaves the cache to take
+            # the one of the first vectors it is given
+            self.embedding_cache = EmbeddingCache(
+                EMBEDDING_CACHE_PATH, self.embeddings.variant, self.store.dimension, EMBEDDING_CACHE_MAX_MB * 2**20
+            )
+        self._pending_vectors: List[np.ndarray] = []
+        self._pending_records: List[dict] = []
+        # Chunk hash -> pending chunk ids, so duplicates within unsaved documents are found too
+        self._pending_hashes: Dict[int, List[int]] = {}
+        # BM25 inverted index over chunk texts, snapshotted next to the segments
+        self.keyword_index = BM25Index()
+        self.keyword_index_path = VECTOR_STORE_PATH / "keyword_index.npz"
+        # Chunk id -> documents of chunks that are shared or deleted ([{"doc_id", "title"}], empty when deleted)
+        self.chunk_refs: Dict[int, List[dict]] = {}
+        self._pending_refs: List[dict] = []
+        # Deleted chunk ids, and those still in the FAISS index (filtered out at search time until purged)
+        self.deleted: Set[int] = set()
+        self._tombstones: Set[int] = set()
+        # Selector excluding the tombstones; immutable once built, so concurrent searches can share it
+        self._search_selectors = None
+        # Vectors the current index was built from, i.e. that its int8 ranges were learned on
+        self._quantizer_samples = 0
+        # Concurrent searches may build the tombstone filter at the same time
+        self._search_filter_lock = threading.Lock()
+        # doc_id -> chunk ids, only built once a document is deleted
+        self._document_chunks: Optional[Dict[str, List[int]]] = None
+        # Legacy full-rewrite format, migrated into segments on first load
         self.index_path = VECTOR_STORE_PATH / "faiss.index"
         self.document_map_path = VECTOR_STORE_PATH / "document_map.json"
         self.load_index()
+        metrics.register_collector("vector_store", self.collect_metrics)
+    
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("This vector store is a read-only replica")
     
     def save_index(self):
-        """Save FAISS index and document map to disk"""
-        if self.index is not None:
-            faiss.write_index(self.index, str(self.index_path))
-            with open(self.document_map_path, 'w', encoding='utf-8') as f:
-                json.dump(self.document_map, f, ensure_ascii=False, indent=2)
-            logger.info(f"Index and document map saved to {VECTOR_STORE_PATH}")
+        """Append chunks added since the last save as a new segment (cost is O(new chunks))"""
+        self._check_writable()
+        with self.lock.write():
+            self._save_pending()
+    
+    def publish_index(self) -> int:
+        """Save pending chunks and snapshot the FAISS index for read-only replicas; returns its version
+        
+        The snapshot is written under a new name and published.json is then replaced atomically,
+        so a replica never opens a partial file. Cost is O(index size), so callers publish once
+        per burst of changes rather than per document.
+        """
+        self._check_writable()
+        with self.lock.write():
+            self._save_pending()
+            version = (read_published() or {}).get("version", 0) + 1
+            name = None
+            if self.index is not None:
+                name = f"index.{version}.faiss"
+                tmp_path = VECTOR_STORE_PATH / (name + ".tmp")
+                with metrics.span("publish_index"):
+                    faiss.write_index(self.index, str(tmp_path))
+                os.replace(tmp_path, VECTOR_STORE_PATH / name)
+            published = {"version": version, "index": name, "next_id": self.current_id,
+                         "quantizer_samples": self._quantizer_samples}
+            atomic_write_bytes(PUBLISHED_PATH, json.dumps(published).encode('utf-8'))
+            self.published_version = version
+        
+        # Replicas still mapping an older snapshot keep reading it until they reload
+        for path in VECTOR_STORE_PATH.glob("index.*.faiss"):
+            if path.name != name:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+        logger.info(f"Published index version {version} ({self.current_id} chunks)")
+        return version
+    
+    def _save_pending(self):
+        if self._pending_records:
+            with metrics.span("save_index"):
+                vectors = np.concatenate(self._pending_vectors)
+                self.store.append(vectors, self._pending_records)
+                self.document_map.commit()
+            logger.info(f"Appended {len(self._pending_records)} chunks to {VECTOR_STORE_PATH}")
+            self._pending_vectors = []
+            self._pending_records = []
+            self._pending_hashes = {}
+        # Shared-chunk references go after the chunks they point to
+        self.store.append_refs(self._pending_refs)
+        self._pending_refs = []
+        # After the chunks it covers, and after a purge removed deleted chunks from it
+        if self.keyword_index.needs_snapshot():
+            self.keyword_index.save(self.keyword_index_path)
     
     def load_index(self):
-        """Load FAISS index and document map if they exist"""
+        """Load the last published FAISS index plus the chunks saved after it, or rebuild it from the segments"""
         try:
-            if self.index_path.exists() and self.document_map_path.exists():
-                self.index = faiss.read_index(str(self.index_path))
-                with open(self.document_map_path, 'r', encoding='utf-8') as f:
-                    self.document_map = json.load(f)
-                self.current_id = max(map(int, self.document_map.keys())) + 1 if self.document_map else 0
+            if self.read_only:
+                self._load_replica()
+                return
+            
+            if not self.store.exists and self.index_path.exists() and self.document_map_path.exists():
+                self._migrate_legacy_index()
+            
+            if self.store.exists:
+                self.store.cleanup()
+                self.chunk_refs = self.store.load_refs()
+                self.deleted = {chunk_id for chunk_id, docs in self.chunk_refs.items() if not docs}
+                if not self._load_published_index():
+                    vectors = self.store.load_vectors()
+                    if vectors is not None:
+                        ids = np.arange(len(vectors), dtype=np.int64)
+                        if self.deleted:
+                            live = np.ones(len(vectors), dtype=bool)
+                            live[list(self.deleted)] = False
+                            vectors, ids = vectors[live], ids[live]
+                        self.index = self._build_index(vectors, ids)
+                self.current_id = self.store.next_id
+                self._load_keyword_index()
+                self._purge_tombstones()
                 logger.info("FAISS index and document map loaded successfully")
             else:
                 logger.info("No previous index found. Will create a new one.")
         except Exception as e:
             logger.error(f"Error loading index: {e}")
             self.index = None
-            self.document_map = {}
     
-    def add_document(self, document: ProcessedDocument) -> None:
-        """Add a processed document to the vector store"""
+    def _load_published_index(self) -> bool:
+        """Start from the last published index and add the chunks saved after it, instead of rebuilding
+
+        Returns False when there is no usable snapshot: none was published, it does not match the
+        configured index type, precision or dimension, or it is ahead of the segments.
+        """
+        published = read_published()
+        if published is None or not published["index"] or published["next_id"] > self.store.next_id:
+            return False
+        path = VECTOR_STORE_PATH / published["index"]
+        try:
+            index = faiss.read_index(str(path))
+        except RuntimeError as e:
+            logger.warning(f"Could not read {path.name} ({e}); rebuilding the index")
+            return False
+        index_type = index_factory.index_type_of(index)
+        # A flat index stands in for an IVF one until there are enough vectors to train it
+        interim = index_type == "flat" and index_factory.requires_training(self.index_type)
+        if index.d != self.store.dimension or (index_type != self.index_type and not interim) \
+                or (index_type == "ivf_flat" and index_factory.precision_of(index) != self.precision):
+            logger.info(f"{path.name} does not match the current configuration; rebuilding the index")
+            return False
+        
+        # Chunks deleted after (or still tombstoned at) publication are filtered until purged
+        if self.deleted:
+            ids = index_factory.ids_of(index)
+            self._tombstones = set(np.intersect1d(ids, np.fromiter(self.deleted, dtype=np.int64)).tolist())
+        ids = np.arange(published["next_id"], self.store.next_id, dtype=np.int64)
+        if self.deleted:
+            ids = ids[~np.isin(ids, np.fromiter(self.deleted, dtype=np.int64))]
+        if len(ids):
+            index.add_with_ids(self.store.get_vectors(ids), ids)
+        index_factory.configure_search(index, self.nprobe, self.ef_search)
+        self.index = index
+        self._quantizer_samples = published.get("quantizer_samples", index.ntotal)
+        # Also rebuilds the index if its int8 ranges are due to be learned again, or it is due to be trained
+        self._maybe_upgrade_index()
+        logger.info(f"Loaded {path.name} and added the {len(ids)} chunks saved after it")
+        return True
+    
+    def _load_replica(self):
+        """Memory-map the published index and open the metadata committed with it"""
+        published = read_published()
+        while published is not None and published["index"] and not (VECTOR_STORE_PATH / published["index"]).exists():
+            # Superseded (and pruned) while it was being read
+            published = read_published()
+        if published is not None and published["next_id"] > self.store.next_id:
+            # Published after this store was opened: reopen it so every indexed chunk resolves
+            self.store = SegmentStore(VECTOR_STORE_PATH, compact_threshold=SEGMENT_COMPACT_THRESHOLD,
+                                      read_only=True)
+            self.document_map = ChunkMetadataMap(self.store)
+        if published is not None:
+            self.published_version = published["version"]
+        if not self.store.exists:
+            logger.info("No index has been published yet")
+            return
+        
+        self.chunk_refs = self.store.load_refs()
+        self.deleted = {chunk_id for chunk_id, docs in self.chunk_refs.items() if not docs}
+        if published is not None and published["index"]:
+            self.index = self._map_index(VECTOR_STORE_PATH / published["index"])
+            # Chunks deleted after (or still tombstoned at) publication are filtered at search time
+            if self.deleted:
+                ids = index_factory.ids_of(self.index)
+                self._tombstones = set(np.intersect1d(ids, np.fromiter(self.deleted, dtype=np.int64)).tolist())
+        elif published is None:
+            logger.warning("No published index found; building one in memory from the segments")
+            vectors = self.store.load_vectors()
+            if vectors is not None:
+                ids = np.arange(len(vectors), dtype=np.int64)
+                live = ~np.isin(ids, np.fromiter(self.deleted, dtype=np.int64))
+                self.index = self._build_index(vectors[live], ids[live])
+        self.current_id = self.store.next_id
+        self._load_keyword_index()
+        logger.info(f"Read-only index loaded (published version {self.published_version})")
+    
+    def _map_index(self, path: Path) -> faiss.Index:
+        """Read an index memory-mapped, so every process serving it shares one copy in the page cache"""
+        # IO_FLAG_MMAP_IFC also maps flat and HNSW vector storage; older FAISS versions only map IVF lists
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            index = faiss.read_index(str(path), flags)
+        except RuntimeError as e:
+            logger.warning(f"Could not memory-map {path.name} ({e}); reading it into memory")
+            index = faiss.read_index(str(path))
+        index_factory.configure_search(index, self.nprobe, self.ef_search)
+        return index
+    
+    def close(self):
+        """Stop the micro-batcher threads and search pool of a store that is no longer used"""
+        for batcher in (self.query_batcher, self.search_batcher):
+            if batcher is not None:
+                batcher.close()
+        self.executor.shutdown(wait=False)
+    
+    def _load_keyword_index(self):
+        """Load the BM25 snapshot and index the chunks committed after it was written"""
+        index = None
+        if self.keyword_index_path.exists():
+            try:
+                index = BM25Index.load(self.keyword_index_path)
+            except Exception as e:
+                logger.error(f"Error loading keyword index: {e}")
+            if index is not None and len(index) > self.store.next_id:
+                logger.warning("Keyword index is ahead of the segment store; rebuilding it")
+                index = None
+        index = index or BM25Index()
+        
+        missing = self.store.next_id - len(index)
+        if missing:
+            logger.info(f"Indexing {missing} chunks for keyword search...")
+            for record in self.store.iter_records(start=len(index)):
+                index.add(record['id'], record['chunk'])
+            if index.needs_snapshot() and not self.read_only:
+                index.save(self.keyword_index_path)
+        self.keyword_index = index
+    
+    def _load_trained_index(self, dimension: int) -> Optional[faiss.Index]:
+        """Load the persisted (empty) trained index so restarts skip IVF/PQ training"""
+        if not index_factory.requires_training(self.index_type) or not self.trained_index_path.exists():
+            return None
+        index = faiss.read_index(str(self.trained_index_path))
+        if index.d != dimension or index_factory.index_type_of(index) != self.index_type \
+                or index_factory.precision_of(index) != self.precision:
+            logger.warning("Persisted trained index does not match the current configuration; retraining")
+            return None
+        return index
+    
+    def _save_trained_index(self, index: faiss.Index):
+        """Persist an empty copy of a freshly trained index"""
+        empty = faiss.clone_index(index)
+        empty.reset()
+        tmp_path = self.trained_index_path.with_name(self.trained_index_path.name + ".tmp")
+        faiss.write_index(empty, str(tmp_path))
+        os.replace(tmp_path, self.trained_index_path)
+    
+    def _build_index(self, vectors: np.ndarray, ids: Optional[np.ndarray] = None) -> faiss.Index:
+        """Build the configured index type over vectors, training and persisting it when needed"""
+        trained_index = self._load_trained_index(vectors.shape[1])
+        index = index_factory.build_index(vectors, self.index_type, trained_index, ids, self.precision)
+        if trained_index is None and index.is_trained and index_factory.requires_training(self.index_type) \
+                and index_factory.index_type_of(index) == self.index_type and not self.read_only:
+            self._save_trained_index(index_factory.inner_index(index))
+        index_factory.configure_search(index, self.nprobe, self.ef_search)
+        self._quantizer_samples = len(vectors)
+        return index
+    
+    def _needs_requantizing(self) -> bool:
+        """Whether the scalar quantizer should learn its ranges again from the vectors indexed since"""
+        if index_factory.index_type_of(self.index) not in ("flat", "hnsw") or self.index.ntotal == 0:
+            return False  # IVF indexes keep the quantizer trained with their centroids
+        precision = index_factory.precision_of(self.index)
+        if precision != self.precision:
+            return True  # float16 stand-in built while there was nothing to learn int8 ranges from
+        # int8 ranges from the first document(s) clip later vectors; doubling keeps rebuilds O(n) overall
+        return precision == "int8" and self._quantizer_samples < index_factory.SQ_RETRAIN_MAX_VECTORS \
+            and self.index.ntotal >= 2 * self._quantizer_samples
+    
+    def _maybe_upgrade_index(self):
+        """Migrate from the interim flat index to the configured type once enough vectors exist,
+        and relearn int8 ranges while the index is still small"""
+        if self._needs_requantizing():
+            logger.info(f"Retraining the {self.precision} quantizer on {self.index.ntotal} vectors")
+            self.index = self._build_index(*self._live_index_vectors())
+            return
+        if not index_factory.requires_training(self.index_type):
+            return
+        if index_factory.index_type_of(self.index) != "flat":
+            return
+        if self.index.ntotal < index_factory.training_threshold(self.index_type):
+            return
+        logger.info(f"Migrating flat index with {self.index.ntotal} vectors to {self.index_type}")
+        vectors, ids = self._live_index_vectors()
+        self.index = self._build_index(vectors, ids)
+    
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Tune the recall/latency trade-off: nprobe for IVF indexes, efSearch for HNSW"""
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        with self.lock.write():
+            if self.index is not None:
+                index_factory.configure_search(self.index, nprobe, ef_search)
+            self._search_selectors = None
+    
+    def _live_index_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectors and chunk ids in the current index, without tombstoned ones"""
+        ids = index_factory.ids_of(self.index)
+        live = None
+        if self._tombstones:
+            live = ~np.isin(ids, np.fromiter(self._tombstones, dtype=np.int64))
+            ids = ids[live]
+            self._tombstones.clear()
+            self._search_selectors = None
+        if index_factory.is_lossy(self.index):
+            # Decoding compressed vectors and quantizing them again would compound the error
+            return self._exact_vectors(ids), ids
+        inner = index_factory.inner_index(self.index)
+        vectors = inner.reconstruct_n(0, inner.ntotal)
+        return (vectors if live is None else vectors[live]), ids
+    
+    def _exact_vectors(self, ids: np.ndarray) -> np.ndarray:
+        """float32 vectors of indexed chunks, from the segments on disk or the batch not saved yet"""
+        committed = self.store.next_id
+        saved = ids < committed
+        if saved.all():
+            return self.store.get_vectors(ids)
+        sizes = np.array([len(batch) for batch in self._pending_vectors])
+        ends = np.cumsum(sizes)
+        rows = ids[~saved] - committed
+        batches = np.searchsorted(ends, rows, side='right')
+        vectors = np.empty((len(ids), self._pending_vectors[0].shape[1]), dtype=np.float32)
+        vectors[~saved] = [self._pending_vectors[b][row - ends[b] + sizes[b]] for b, row in zip(batches, rows)]
+        if saved.any():
+            vectors[saved] = self.store.get_vectors(ids[saved])
+        return vectors
+    
+    def _migrate_legacy_index(self):
+        """Convert a faiss.index + document_map.json pair into the segment format"""
+        logger.info("Migrating legacy index to segment store...")
+        index = faiss.read_index(str(self.index_path))
+        with open(self.document_map_path, 'r', encoding='utf-8') as f:
+            document_map = json.load(f)
+        vectors = index.reconstruct_n(0, index.ntotal)
+        records = [document_map[str(i)] for i in range(index.ntotal)]
+        self.store.append(vectors, records)
+        logger.info(f"Migrated {len(records)} chunks from legacy index")
+    
+    def _embed_texts(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """Embed chunk texts, taking the vectors of previously embedded texts from the embedding cache"""
+        metrics.inc("chunks_embedded", len(texts))
+        if self.embedding_cache is None:
+            with metrics.span("embed_chunks"):
+                return self.embeddings.embed_documents_array(texts, batch_size)
+        hashes = np.fromiter((chunk_hash(text) for text in texts), dtype=np.int64, count=len(texts))
+        vectors, missing = self.embedding_cache.get(hashes)
+        if len(missing):
+            with metrics.span("embed_chunks"):
+                computed = self.embeddings.embed_documents_array([texts[i] for i in missing], batch_size)
+            # All missing also covers a new cache, which does not know the dimension until its first put
+            if len(missing) == len(texts):
+                vectors = computed
+            else:
+                vectors[missing] = computed
+            self.embedding_cache.put(hashes[missing], computed)
+        return vectors
+    
+    def _embed_chunks(self, chunks: List[str], batch_size: Optional[int] = None,
+                      progress_callback: Optional[Callable[[int, int], None]] = None) -> np.ndarray:
+        """Embed chunks in batches into a preallocated float32 matrix, reporting progress per batch"""
+        batch_size = batch_size or EMBEDDING_BATCH_SIZE
+        total = len(chunks)
+        vectors = None
+        
+        for start in range(0, total, batch_size):
+            batch = self._embed_texts(chunks[start:start + batch_size], batch_size)
+            if vectors is None:
+                vectors = np.empty((total, batch.shape[1]), dtype=np.float32)
+            vectors[start:start + len(batch)] = batch
+            
+            done = start + len(batch)
+            logger.info(f"Processing chunk {done}/{total}")
+            if progress_callback:
+                progress_callback(done, total)
+        
+        return vectors
+    
+    def add_document(self, document: ProcessedDocument, batch_size: Optional[int] = None,
+                     progress_callback: Optional[Callable[[int, int], None]] = None,
+                     persist: bool = True) -> None:
+        """Add a processed document to the vector store; with persist=False call save_index() later"""
         logger.info(f"Processing document: {document.title}")
         logger.info(f"Number of chunks to process: {len(document.chunks)}")
         
-        embeddings = []
-        for i, chunk in enumerate(document.chunks, 1):
-            if i % 5 == 0:  # Log every 5 chunks
-                logger.info(f"Processing chunk {i}/{len(document.chunks)}")
-            
-            vector = self.embeddings.embed_query(chunk)
-            embeddings.append(vector)
-            self.document_map[str(self.current_id)] = {
-                'doc_id': document.id,
+        if not document.chunks:
+            logger.warning(f"Document {document.title} has no chunks to index")
+            return
+        
+        new_chunks = self._index_chunks(
+            document.id, document.title, document.chunks,
+            lambda chunks: self._embed_chunks(chunks, batch_size, progress_callback)
+        )
+        logger.info(f"Reused {len(document.chunks) - len(new_chunks)} already indexed chunks")
+        
+        if persist:
+            self.save_index()
+        logger.info("Document processed and saved successfully")
+    
+    def add_document_stream(self, document: StreamingDocument, batch_size: Optional[int] = None,
+                            progress_callback: Optional[Callable[[int, int], None]] = None,
+                            persist: bool = True) -> int:
+        """Embed and index chunks as the document produces them; progress is reported in pages.
+        
+        Returns the number of chunks indexed.
+        """
+        logger.info(f"Streaming document: {document.title} ({document.total_pages} pages)")
+        batch_size = batch_size or EMBEDDING_BATCH_SIZE
+        total_chunks = 0
+        reused = 0
+        
+        for batch in _batched(document.chunks, batch_size):
+            new_chunks = self._index_chunks(
+                document.id, document.title, batch, lambda chunks: self._embed_texts(chunks, batch_size)
+            )
+            total_chunks += len(batch)
+            reused += len(batch) - len(new_chunks)
+            logger.info(f"Indexed {total_chunks} chunks ({document.pages_done}/{document.total_pages} pages)")
+            if progress_callback:
+                progress_callback(document.pages_done, document.total_pages)
+        
+        if total_chunks == 0:
+            logger.warning(f"Document {document.title} has no chunks to index")
+            return 0
+        logger.info(f"Reused {reused} already indexed chunks")
+        
+        if persist:
+            self.save_index()
+        logger.info("Document processed and saved successfully")
+        return total_chunks
+    
+    def _find_chunk(self, chunk: str, text_hash: int) -> Optional[int]:
+        """Id of an indexed (saved or pending) chunk with exactly this text"""
+        for chunk_id in self._pending_hashes.get(text_hash, []):
+            if chunk_id not in self.deleted and self.document_map[chunk_id]['chunk'] == chunk:
+                return chunk_id
+        return self.store.find_chunk(chunk, text_hash, skip=self.deleted)
+    
+    def _chunk_docs(self, chunk_id: int) -> List[dict]:
+        """Documents a chunk belongs to"""
+        docs = self.chunk_refs.get(chunk_id)
+        if docs is None:
+            record = self.document_map[chunk_id]
+            docs = [{'doc_id': record['doc_id'], 'title': record['title']}]
+        return docs
+    
+    def _set_chunk_docs(self, chunk_id: int, docs: List[dict]) -> None:
+        self.chunk_refs[chunk_id] = docs
+        self._pending_refs.append({'id': chunk_id, 'docs': docs})
+    
+    def _dedup_chunks(self, doc_id: str, title: str, chunks: List[str]) -> List[str]:
+        """Link chunks that are already indexed to this document; returns the ones still to embed"""
+        new_chunks = []
+        seen = set()
+        for chunk in chunks:
+            if chunk in seen:
+                continue
+            seen.add(chunk)
+            chunk_id = self._find_chunk(chunk, chunk_hash(chunk))
+            if chunk_id is None:
+                new_chunks.append(chunk)
+                continue
+            docs = self._chunk_docs(chunk_id)
+            if all(doc['doc_id'] != doc_id for doc in docs):
+                self._set_chunk_docs(chunk_id, docs + [{'doc_id': doc_id, 'title': title}])
+                if self._document_chunks is not None:
+                    self._document_chunks.setdefault(doc_id, []).append(chunk_id)
+        return new_chunks
+    
+    def _index_chunks(self, doc_id: str, title: str, chunks: List[str],
+                      embed: Callable[[List[str]], np.ndarray]) -> List[str]:
+        """Embed the chunks that are not indexed yet, then link and add them under the write lock
+        
+        Returns the chunks that were added (the others were already indexed, possibly by a
+        concurrent ingest that finished while these were being embedded).
+        """
+        self._check_writable()
+        with self.lock.read():
+            candidates = [chunk for chunk in dict.fromkeys(chunks) if self._find_chunk(chunk, chunk_hash(chunk)) is None]
+        vectors = embed(candidates) if candidates else None
+        
+        with self.lock.write():
+            new_chunks = self._dedup_chunks(doc_id, title, chunks)
+            if new_chunks:
+                if new_chunks != candidates:
+                    rows = {chunk: i for i, chunk in enumerate(candidates)}
+                    # A chunk deleted in the meantime has to be indexed again, with a vector of its own
+                    missing = [chunk for chunk in new_chunks if chunk not in rows]
+                    extra = dict(zip(missing, self._embed_texts(missing))) if missing else {}
+                    vectors = np.stack([vectors[rows[chunk]] if chunk in rows else extra[chunk] for chunk in new_chunks])
+                self._add_embedded_chunks(doc_id, title, new_chunks, vectors)
+            self.version += 1
+        return new_chunks
+    
+    def _add_embedded_chunks(self, doc_id: str, title: str, chunks: List[str], embeddings_array: np.ndarray) -> None:
+        """Register already-embedded chunks in the document map, the pending segment and the index"""
+        ids = np.arange(self.current_id, self.current_id + len(chunks), dtype=np.int64)
+        if self._document_chunks is not None:
+            self._document_chunks.setdefault(doc_id, []).extend(ids.tolist())
+        for chunk in chunks:
+            record = {
+                'doc_id': doc_id,
                 'chunk': chunk,
-                'title': document.title
+                'title': title
             }
+            self.document_map[self.current_id] = record
+            self._pending_records.append(record)
+            self._pending_hashes.setdefault(chunk_hash(chunk), []).append(self.current_id)
+            self.keyword_index.add(self.current_id, chunk)
             self.current_id += 1
-        
-        logger.info("Creating/updating FAISS index...")
-        embeddings_array = np.array(embeddings, dtype='float32')
+        self._pending_vectors.append(embeddings_array)
         
         if self.index is None:
-            self.index = faiss.IndexFlatL2(embeddings_array.shape[1])
+            self.index = self._build_index(embeddings_array, ids)
+        else:
+            self.index.add_with_ids(embeddings_array, ids)
+            self._maybe_upgrade_index()
+    
+    def _documents_index(self) -> Dict[str, List[int]]:
+        """doc_id -> chunk ids; built from the metadata log on first use and kept up to date after
         
-        self.index.add(embeddings_array)
-        self.save_index()
-        logger.info("Document processed and saved successfully")
+        Building it parses the whole log, so it is done under the read lock: searches go on meanwhile,
+        and writers, which update it in place once it exists, wait.
+        """
+        if self._document_chunks is None:
+            with self.lock.read():
+                if self._document_chunks is None:
+                    document_chunks: Dict[str, List[int]] = {}
+                    for chunk_id, record in self.document_map.items():
+                        if chunk_id not in self.chunk_refs:
+                            document_chunks.setdefault(record['doc_id'], []).append(chunk_id)
+                    for chunk_id, docs in self.chunk_refs.items():
+                        for doc in docs:
+                            document_chunks.setdefault(doc['doc_id'], []).append(chunk_id)
+                    self._document_chunks = document_chunks
+        return self._document_chunks
+    
+    def delete_document(self, doc_id: str, persist: bool = True) -> int:
+        """Remove a document from the index; chunks it shares with other documents are kept for them.
+        
+        Deleted chunks are tombstoned and filtered out of searches until they reach
+        TOMBSTONE_PURGE_RATIO of the index, at which point they are removed from it.
+        Returns the number of chunks deleted.
+        """
+        self._check_writable()
+        documents = self._documents_index()
+        with self.lock.write():
+            chunk_ids = documents.pop(doc_id, [])
+            if not chunk_ids:
+                logger.warning(f"Document {doc_id} has no indexed chunks")
+                return 0
+        
+            deleted = 0
+            for chunk_id in chunk_ids:
+                docs = [doc for doc in self._chunk_docs(chunk_id) if doc['doc_id'] != doc_id]
+                self._set_chunk_docs(chunk_id, docs)
+                if not docs:
+                    self.deleted.add(chunk_id)
+                    self._tombstones.add(chunk_id)
+                    deleted += 1
+            self._search_selectors = None
+            self._purge_tombstones()
+        
+            self.version += 1
+            if persist:
+                self.save_index()
+        logger.info(f"Deleted document {doc_id}: {deleted} chunks removed, {len(chunk_ids) - deleted} still shared")
+        return deleted
+    
+    def replace_document(self, old_doc_id: str, document: ProcessedDocument, batch_size: Optional[int] = None,
+                         progress_callback: Optional[Callable[[int, int], None]] = None,
+                         persist: bool = True) -> None:
+        """Index a new version of a document and delete the old one; unchanged chunks are not re-embedded"""
+        self.add_document(document, batch_size, progress_callback, persist=False)
+        self.delete_document(old_doc_id, persist=False)
+        if persist:
+            self.save_index()
     
-    def search(self, query: str, k: int = 3) -> List[dict]:
-        """Search for similar documents using semantic similarity"""
+    def _purge_tombstones(self) -> None:
+        """Remove tombstoned vectors from the index once they are TOMBSTONE_PURGE_RATIO of it"""
+        if self.index is None or len(self._tombstones) <= TOMBSTONE_PURGE_RATIO * self.index.ntotal:
+            return
+        count = len(self._tombstones)
+        if index_factory.index_type_of(self.index) == "hnsw":
+            # HNSW graphs do not support removal, so the index is rebuilt from the remaining vectors
+            self.index = self._build_index(*self._live_index_vectors())
+        else:
+            self.index.remove_ids(np.fromiter(self._tombstones, dtype=np.int64))
+            self._tombstones.clear()
+            self._search_selectors = None
+        # The keyword index drops them at the same point, so its postings do not grow with deletes
+        removed = self.keyword_index.remove(self.deleted)
+        logger.info(f"Purged {count} deleted chunks from the index ({self.index.ntotal} remaining) "
+                    f"and {removed} from the keyword index")
+    
+    def _search_filter(self) -> Optional[faiss.SearchParameters]:
+        """Search parameters excluding tombstoned chunks, or None when there are none"""
+        if not self._tombstones:
+            return None
+        with self._search_filter_lock:
+            if self._search_selectors is None:
+                tombstones = faiss.IDSelectorBatch(np.fromiter(self._tombstones, dtype=np.int64))
+                self._search_selectors = (tombstones, faiss.IDSelectorNot(tombstones))
+            selectors = self._search_selectors
+        # One parameters object per search: IndexIDMap.search swaps params.sel while it runs, so a
+        # shared one is corrupted by concurrent searches
+        params = index_factory.search_params(self.index, selectors[1])
+        # It only holds a raw pointer to the selector; keep the selectors alive as long as it is in use
+        params.selectors = selectors
+        return params
+    
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the current set of indexed chunks; persisted caches compare it across restarts"""
+        return f"{self.current_id}-{len(self.deleted)}"
+    
+    def collect_metrics(self) -> Dict[str, float]:
+        """Index size and cache counters, read by the metrics endpoint and stats dump"""
+        gauges = {
+            "index_vectors": self.index.ntotal if self.index is not None else 0,
+            "chunks": self.current_id,
+            "deleted_chunks": len(self.deleted),
+            "keyword_index_terms": len(self.keyword_index.vocab),
+        }
+        caches = {"query_embeddings": self.query_cache.stats()}
+        if self.embedding_cache is not None:
+            caches["chunk_embeddings"] = self.embedding_cache.stats()
+        for name, stats in caches.items():
+            gauges[f'cache_hits{{cache="{name}"}}'] = stats["hits"]
+            gauges[f'cache_misses{{cache="{name}"}}'] = stats["misses"]
+        return gauges
+    
+    def _embed_query_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """Micro-batcher callback: one model.encode call for all pending queries"""
+        return list(self.embeddings.embed_documents_array(texts, len(texts)).reshape(len(texts), 1, -1))
+    
+    def _search_index_batch(self, requests: List[Tuple[np.ndarray, int]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Micro-batcher callback: one index.search call for all pending (vector, k) requests"""
+        max_k = max(k for _, k in requests)
+        with self.lock.read():
+            distances, indices = self.index.search(
+                np.vstack([vector for vector, _ in requests]), max_k, params=self._search_filter()
+            )
+        return [(distances[i:i + 1, :k], indices[i:i + 1, :k]) for i, (_, k) in enumerate(requests)]
+    
+    def get_vectors(self, ids: np.ndarray) -> np.ndarray:
+        """float32 embeddings of indexed chunks by id, e.g. to compare retrieved chunks with each other"""
+        with self.lock.read():
+            return self._exact_vectors(np.asarray(ids, dtype=np.int64))
+    
+    def _reranks(self) -> bool:
+        """Whether dense candidates are re-ranked on exact vectors (the index stores compressed ones)"""
+        return RERANK_FACTOR > 0 and self.index is not None and index_factory.is_lossy(self.index)
+    
+    def _rerank(self, query_vector: np.ndarray, indices: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact float32 squared L2 distances of the candidates, keeping the k closest (caller holds the read lock)"""
+        ids = indices[0][indices[0] >= 0]
+        with metrics.span("rerank"):
+            distances = ((self._exact_vectors(ids) - query_vector) ** 2).sum(axis=1)
+            order = np.argsort(distances, kind='stable')[:k]
+        return distances[order][None, :], ids[order][None, :]
+    
+    def _search_index(self, vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        with metrics.span("index_search"):
+            if self.search_batcher is not None:
+                # Not under the caller's read lock: the batcher thread takes it for the whole batch
+                return self.search_batcher((vector, k))
+            with self.lock.read():
+                return self.index.search(vector, k, params=self._search_filter())
+    
+    def _query_cache_key(self, query: str) -> str:
+        # The tokenizer ignores whitespace differences, so they should not cause cache misses
+        return " ".join(query.split())
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a query as a (1, dim) float32 array, reusing cached embeddings of repeated queries"""
+        key = self._query_cache_key(query)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            with metrics.span("embed_query"):
+                if self.query_batcher is not None:
+                    vector = self.query_batcher(key)
+                else:
+                    vector = np.array([self.embeddings.embed_query(key)], dtype='float32')
+            self.query_cache.put(key, vector)
+        return vector
+    
+    def _result(self, chunk_id: int, score: float) -> Optional[dict]:
+        """Resolve a chunk id to its metadata, or None if it was deleted"""
+        if chunk_id < 0 or chunk_id in self.deleted:
+            return None
+        try:
+            doc_info = self.document_map[chunk_id]
+        except KeyError:
+            logger.error(f"Index {chunk_id} not found in document_map")
+            return None
+        # Shared chunks are attributed to the first document that still contains them
+        source = self.chunk_refs.get(chunk_id) or [doc_info]
+        return {
+            'id': chunk_id,
+            'doc_id': source[0]['doc_id'],
+            'title': source[0]['title'],
+            'chunk': doc_info['chunk'],
+            'score': score
+        }
+    
+    def _collect_results(self, distances: np.ndarray, indices: np.ndarray) -> List[dict]:
+        """Resolve FAISS hits to chunk metadata"""
+        results = []
+        with metrics.span("metadata_lookup"):
+            for idx, distance in zip(indices[0], distances[0]):
+                result = self._result(int(idx), float(1 / (1 + distance)))
+                if result is not None:
+                    results.append(result)
+        
+        logger.debug(f"Found {len(results)} relevant results")
+        return results
+    
+    def _keyword_hits(self, query: str, k: int) -> List[Tuple[int, float]]:
+        with metrics.span("keyword_search"):
+            return self.keyword_index.search(query, k, exclude=self.deleted, budget_ms=KEYWORD_SEARCH_BUDGET_MS)
+    
+    def _fuse(self, indices: np.ndarray, keyword_hits: List[Tuple[int, float]], k: int) -> List[dict]:
+        """Reciprocal-rank fusion of the dense and keyword rankings: score = sum of 1 / (RRF_K + rank)"""
+        scores: Dict[int, float] = {}
+        dense_ids = [int(idx) for idx in indices[0] if idx >= 0]
+        keyword_ids = [chunk_id for chunk_id, _ in keyword_hits]
+        for ranking in (dense_ids, keyword_ids):
+            for rank, chunk_id in enumerate(ranking, 1):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank)
+        
+        results = []
+        with metrics.span("metadata_lookup"):
+            for chunk_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+                result = self._result(chunk_id, score)
+                if result is not None:
+                    results.append(result)
+                    if len(results) == k:
+                        break
+        logger.debug(f"Found {len(results)} relevant results ({len(dense_ids)} dense, {len(keyword_ids)} keyword candidates)")
+        return results
+    
+    def _keyword_results(self, query: str, k: int) -> List[dict]:
+        hits = self._keyword_hits(query, k)
+        with metrics.span("metadata_lookup"):
+            results = [self._result(chunk_id, score) for chunk_id, score in hits]
+        return [result for result in results if result is not None]
+    
+    def search(self, query: str, k: int = 3, mode: Optional[str] = None) -> List[dict]:
+        """Search for relevant chunks
+        
+        mode: "dense" (semantic similarity), "keyword" (BM25) or "hybrid" (both, fused by rank);
+        defaults to SEARCH_MODE.
+        """
+        mode = mode or SEARCH_MODE
+        metrics.inc("searches")
+        if mode == "keyword":
+            return self._keyword_search(query, k)
         if self.index is None:
             raise ValueError("No documents have been indexed")
         
         try:
-            logger.info(f"Searching for: {query}")
-            query_vector = self.embeddings.embed_query(query)
-            query_vector_array = np.array([query_vector], dtype='float32')
-            
-            logger.info(f"Index size: {self.index.ntotal}")
-            logger.info(f"Document map size: {len(self.document_map)}")
+            logger.debug(f"Searching for: {query} ({mode}, {self.index.ntotal} vectors)")
+            query_vector_array = self.embed_query(query)
             
-            distances, indices = self.index.search(query_vector_array, k)
-            
-            results = []
-            for idx, distance in zip(indices[0], distances[0]):
-                if idx < 0:
-                    continue
-                try:
-                    doc_info = self.document_map[str(int(idx))]
-                    results.append({
-                        'doc_id': doc_info['doc_id'],
-                        'title': doc_info['title'],
-                        'chunk': doc_info['chunk'],
-                        'score': float(1 / (1 + distance))
-                    })
-                except KeyError as e:
-                    logger.error(f"Index {idx} not found in document_map")
-                    continue
-            
-            logger.info(f"Found {len(results)} relevant results")
-            return results
+            # Chunk ids stay valid if a document is added or deleted between the two locked steps
+            candidates = max(k, HYBRID_CANDIDATES) if mode == "hybrid" else k
+            rerank = self._reranks()
+            distances, indices = self._search_index(query_vector_array, candidates * RERANK_FACTOR if rerank else candidates)
+            return self._search_results(query, query_vector_array, distances, indices, k, mode, rerank)
         except Exception as e:
             logger.error(f"Error in vector search: {e}")
             logger.error(f"Current indices: {indices if 'indices' in locals() else 'not calculated'}")
             raise
+    
+    def _keyword_search(self, query: str, k: int) -> List[dict]:
+        with self.lock.read():
+            return self._keyword_results(query, k)
+    
+    def _search_results(self, query: str, query_vector: np.ndarray, distances: np.ndarray, indices: np.ndarray,
+                        k: int, mode: str, rerank: bool) -> List[dict]:
+        """Re-rank and fuse the index hits and look up their chunks, under the read lock"""
+        candidates = max(k, HYBRID_CANDIDATES) if mode == "hybrid" else k
+        with self.lock.read():
+            if rerank:
+                distances, indices = self._rerank(query_vector, indices, candidates)
+            if mode == "hybrid":
+                return self._fuse(indices, self._keyword_hits(query, candidates), k)
+            return self._collect_results(distances, indices)
 
-    async def asearch(self, query: str, k: int = 3) -> List[dict]:
-        """Async version of search method"""
-        return self.search(query, k)
\ No newline at end of file
+    async def aembed_query(self, query: str) -> np.ndarray:
+        """Async version of embed_query; waits on the micro-batcher or runs on the search thread pool"""
+        if self.query_batcher is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.embed_query, query)
+        
+        key = self._query_cache_key(query)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            with metrics.span("embed_query"):
+                vector = await self.query_batcher.asubmit(key)
+            self.query_cache.put(key, vector)
+        return vector
+
+    async def asearch(self, query: str, k: int = 3, mode: Optional[str] = None) -> List[dict]:
+        """Async version of search method; embedding and FAISS search never block the event loop"""
+        mode = mode or SEARCH_MODE
+        loop = asyncio.get_running_loop()
+        if self.query_batcher is None or self.search_batcher is None:
+            return await loop.run_in_executor(self.executor, self.search, query, k, mode)
+        metrics.inc("searches")
+        if mode == "keyword":
+            return await loop.run_in_executor(self.executor, self._keyword_search, query, k)
+        
+        if self.index is None:
+            raise ValueError("No documents have been indexed")
+        try:
+            logger.debug(f"Searching for: {query} ({mode}, {self.index.ntotal} vectors)")
+            query_vector_array = await self.aembed_query(query)
+            # The read lock is never held across an await: _search_index_batch takes it on the batcher thread
+            candidates = max(k, HYBRID_CANDIDATES) if mode == "hybrid" else k
+            rerank = self._reranks()
+            with metrics.span("index_search"):
+                distances, indices = await self.search_batcher.asubmit(
+                    (query_vector_array, candidates * RERANK_FACTOR if rerank else candidates)
+                )
+            # The read lock can wait behind an ingest and re-ranking reads the memory-mapped vectors,
+            # so the rest runs on the search thread pool, never on the loop
+            return await loop.run_in_executor(
+                self.executor, self._search_results, query, query_vector_array, distances, indices, k, mode, rerank
+            )
+        except Exception as e:
+            logger.error(f"Error in vector search: {e}")
+            raise
@@ -1,29 +1,48 @@
+import uuid
 import streamlit as st
-from pathlib import Path
-from src.core.document_processor import DocumentProcessor
-from src.data.vector_store import VectorStore
-from src.core.qa_engine import QAEngine
-from src.data.database import Database
+from src.core.service import get_service, is_ready, warm_up
+from src.utils import config, metrics
+from src.utils.config import METRICS_PORT, METRICS_DUMP_INTERVAL
 
 class DocumentMentorUI:
     """Streamlit interface for DocumentMentor"""
     
-    def __init__(self):
-        self.database = Database()
-        self.processor = DocumentProcessor()
-        self.vector_store = VectorStore()
-        self.qa_engine = QAEngine(self.vector_store)
+    def load(self):
+        """Wait for the shared service, showing a loading indicator the first time it is built"""
+        # El modelo, el índice y la base de datos se cargan una vez por proceso y se comparten entre sesiones
+        if is_ready():
+            self.service = get_service()
+        else:
+            with st.spinner("Cargando el modelo y el índice..."):
+                self.service = get_service()
+        self.database = self.service.database
+        self.qa_engine = self.service.qa_engine
         
-        # Inicializar el estado de los mensajes con el saludo inicial
+        # ?conversation=<id> en la URL retoma una conversación guardada; si no, empieza una nueva
+        if "conversation_id" not in st.session_state:
+            self.open_conversation(st.query_params.get("conversation") or uuid.uuid4().hex)
+        
+        # Inicializar el estado de los mensajes con el saludo inicial y el historial guardado
         if "messages" not in st.session_state:
+            memory = self.qa_engine.memory
+            saved = memory.get_messages(st.session_state.conversation_id) if memory else []
             st.session_state.messages = [{
                 "role": "assistant",
                 "content": self.qa_engine.get_initial_message()
-            }]
+            }] + [{"role": role, "content": content} for role, content in saved]
+    
+    @staticmethod
+    def open_conversation(conversation_id: str):
+        """Switch the session to a conversation; its messages are loaded on the next load()"""
+        st.session_state.conversation_id = conversation_id
+        st.session_state.pop("messages", None)
+        st.query_params["conversation"] = conversation_id
 
     def display_chat(self):
         """Main chat display interface"""
+        # El título se muestra antes de cargar el modelo, así la página aparece de inmediato
         st.title("DocumentMentor")
+        self.load()
         
         with st.sidebar:
             # Initialize upload state
@@ -34,6 +53,11 @@ class DocumentMentorUI:
                 if st.session_state.uploaded_file is not None:
                     st.session_state.upload_state = True
             
+            replace = st.checkbox(
+                "Reemplazar el documento con el mismo nombre",
+                key="replace_upload",
+                help="Sin marcar, un PDF con el nombre de otro ya cargado se añade junto a él"
+            )
             uploaded_file = st.file_uploader(
                 "Cargar documento PDF",
                 type=['pdf'],
@@ -45,24 +69,45 @@ class DocumentMentorUI:
             if uploaded_file and st.session_state.upload_state:
                 with st.spinner("Procesando..."):
                     try:
-                        temp_path = Path("data/processed") / uploaded_file.name
-                        temp_path.write_bytes(uploaded_file.getvalue())
-                        doc = self.processor.process_pdf(temp_path)
-                        
-                        self.database.save_document(
-                            doc_id=doc.id,
-                            title=doc.title,
-                            content=doc.content,
-                            file_path=str(doc.source_path)
+                        # Solo se reemplaza un documento con el mismo nombre si el usuario lo ha pedido
+                        progress = st.progress(0.0)
+                        result = self.service.add_pdf(
+                            uploaded_file.name,
+                            uploaded_file.getvalue(),
+                            progress_callback=lambda done, total: progress.progress(done / total),
+                            replace=replace
                         )
-                        
-                        self.vector_store.add_document(doc)
-                        st.success("Documento procesado correctamente")
+                        progress.empty()
+                        if result.duplicate:
+                            st.info(f"El documento ya estaba procesado como \"{result.title}\"")
+                        elif result.replaced:
+                            st.success("Documento procesado; ha reemplazado a la versión anterior")
+                        else:
+                            st.success("Documento procesado correctamente")
                         st.session_state.upload_state = False
                     except Exception as e:
                         st.error(f"Error: {e}")
                         st.session_state.upload_state = False
         
+            if self.qa_engine.memory is not None:
+                if st.button("Nueva conversación"):
+                    self.open_conversation(uuid.uuid4().hex)
+                    st.rerun()
+                with st.expander("Conversaciones"):
+                    for conversation in self.database.get_recent_conversations():
+                        if st.button(conversation.title, key=f"conversation_{conversation.id}",
+                                     disabled=conversation.id == st.session_state.conversation_id):
+                            self.open_conversation(conversation.id)
+                            st.rerun()
+            
+            with st.expander("Documentos"):
+                for document in self.database.get_all_documents():
+                    title_col, delete_col = st.columns([5, 1])
+                    title_col.write(document.title)
+                    if delete_col.button("🗑️", key=f"delete_{document.id}", help="Eliminar documento"):
+                        self.service.delete_document(document.id)
+                        st.rerun()
+        
         # Chat interface
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
@@ -74,20 +119,21 @@ class DocumentMentorUI:
             st.session_state.messages.append({"role": "user", "content": question})
 
             with st.chat_message("assistant"):
-                with st.spinner("Procesando respuesta..."):
-                    try:
-                        response = self.qa_engine.get_answer(question)
-                        if "error" in response:
-                            st.error(response["error"])
-                        else:
-                            st.markdown(response["answer"])
-                            st.session_state.messages.append({
-                                "role": "assistant", 
-                                "content": response["answer"]
-                            })
-                    except Exception as e:
-                        st.error(f"Error: {e}")
+                try:
+                    answer = st.write_stream(
+                        self.qa_engine.stream_answer(question, st.session_state.conversation_id)
+                    )
+                    st.session_state.messages.append({
+                        "role": "assistant", 
+                        "content": answer
+                    })
+                except Exception as e:
+                    st.error(f"Error: {e}")
 
 if __name__ == "__main__":
+    config.setup()
+    # Empieza a cargar el modelo y el índice en segundo plano mientras se dibuja la página
+    warm_up()
+    metrics.start(METRICS_PORT, METRICS_DUMP_INTERVAL)
     app = DocumentMentorUI()
     app.display_chat()
\ No newline at end of file
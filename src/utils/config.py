@@ -7,27 +7,108 @@ from dotenv import load_dotenv
 import os
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file
 load_dotenv()
 
+# LLM Configuration ('openai', or 'stub' for an offline model used in load tests)
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'openai').lower()
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-if not OPENAI_API_KEY:
+if not OPENAI_API_KEY and LLM_PROVIDER == 'openai':
     raise ValueError("OPENAI_API_KEY must be set in environment variables")
 
 # Application Settings
 CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', 1000))
 CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', 200))
 
+# PDF Extraction Settings (PDFs with at least PARALLEL_PDF_MIN_PAGES pages are streamed, their pages
+# extracted by a process pool and chunked and embedded as they arrive)
+PARALLEL_PDF_MIN_PAGES = int(os.getenv('PARALLEL_PDF_MIN_PAGES', 50))
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', os.cpu_count() or 1))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 16))
+INGEST_JOURNAL_PATH = Path(os.getenv('INGEST_JOURNAL_PATH', 'data/ingest_journal.jsonl'))
+
+# Embedding Settings
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 64))
+# CPU inference backend: torch, torch-int8 (dynamically quantized linear layers) or onnx (needs optimum[onnxruntime])
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch').lower()
+EMBEDDING_ONNX_FILE = os.getenv('EMBEDDING_ONNX_FILE', '')  # e.g. onnx/model_qint8_avx2.onnx; empty uses onnx/model.onnx
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', 0))  # torch intra-op threads, 0 keeps the default
+
+# Cache Settings (TTL in seconds, 0 disables expiry)
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', 1024))
+QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', 3600))
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', 512))
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', 3600))
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'True').lower() == 'true'
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.92))  # cosine similarity
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', 1000))
+SEMANTIC_CACHE_SAVE_INTERVAL = float(os.getenv('SEMANTIC_CACHE_SAVE_INTERVAL', 5))  # seconds between writes to disk
+
 # Database Settings
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///data/documentmentor.db')
 
 # Vector Store Settings
 VECTOR_STORE_PATH = Path(os.getenv('VECTOR_STORE_PATH', 'data/vector_store'))
+SEMANTIC_CACHE_PATH = VECTOR_STORE_PATH / "semantic_cache.npz"
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'True').lower() == 'true'
+EMBEDDING_CACHE_PATH = Path(os.getenv('EMBEDDING_CACHE_PATH', 'data/embedding_cache'))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv('EMBEDDING_CACHE_MAX_MB', 4096))
+SEGMENT_COMPACT_THRESHOLD = int(os.getenv('SEGMENT_COMPACT_THRESHOLD', 8))
+TOMBSTONE_PURGE_RATIO = float(os.getenv('TOMBSTONE_PURGE_RATIO', 0.1))  # deleted share of the index before purging
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', 4))  # threads for async embedding/search
+MICRO_BATCH_ENABLED = os.getenv('MICRO_BATCH_ENABLED', 'True').lower() == 'true'
+MICRO_BATCH_SIZE = int(os.getenv('MICRO_BATCH_SIZE', 32))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', 2))
+
+# Retrieval Settings
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'hybrid').lower()  # dense, keyword, hybrid
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', 20))  # per ranking, before fusion
+RRF_K = int(os.getenv('RRF_K', 60))
+KEYWORD_SEARCH_BUDGET_MS = float(os.getenv('KEYWORD_SEARCH_BUDGET_MS', 1.0))
+
+# Context Settings: candidates fetched per question, re-ranked by MMR (1.0 = relevance only, lower
+# favours diversity) and packed, without the chunk overlap, up to the chunk and token limits
+CONTEXT_CANDIDATES = int(os.getenv('CONTEXT_CANDIDATES', 20))
+CONTEXT_MAX_CHUNKS = int(os.getenv('CONTEXT_MAX_CHUNKS', 5))
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 750))
+MMR_LAMBDA = float(os.getenv('MMR_LAMBDA', 0.7))
+
+# Conversation Memory: the messages not yet summarized go into the prompt verbatim (the window plus
+# those waiting for the next summary, up to the token budget); older ones are folded into a rolling
+# summary every MEMORY_SUMMARY_BATCH messages
+MEMORY_ENABLED = os.getenv('MEMORY_ENABLED', 'True').lower() == 'true'
+MEMORY_WINDOW_MESSAGES = int(os.getenv('MEMORY_WINDOW_MESSAGES', 6))
+MEMORY_TOKEN_BUDGET = int(os.getenv('MEMORY_TOKEN_BUDGET', 600))
+MEMORY_SUMMARY_BATCH = int(os.getenv('MEMORY_SUMMARY_BATCH', 4))
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv('MEMORY_SUMMARY_MAX_TOKENS', 200))
+
+# FAISS Index Settings
+FAISS_INDEX_TYPE = os.getenv('FAISS_INDEX_TYPE', 'flat').lower()  # flat, ivf_flat, ivf_pq, hnsw
+FAISS_NLIST = int(os.getenv('FAISS_NLIST', 1024))
+FAISS_NPROBE = int(os.getenv('FAISS_NPROBE', 16))
+FAISS_PQ_M = int(os.getenv('FAISS_PQ_M', 48))
+FAISS_PQ_NBITS = int(os.getenv('FAISS_PQ_NBITS', 8))
+FAISS_HNSW_M = int(os.getenv('FAISS_HNSW_M', 32))
+FAISS_EF_SEARCH = int(os.getenv('FAISS_EF_SEARCH', 64))
+# Compact mode: float16 or int8 vectors in the in-memory index, with the top RERANK_FACTOR * k candidates
+# re-ranked on the exact float32 vectors kept on disk (also applies to ivf_pq; 0 disables re-ranking)
+VECTOR_PRECISION = os.getenv('VECTOR_PRECISION', 'float32').lower()  # float32, float16, int8
+RERANK_FACTOR = int(os.getenv('RERANK_FACTOR', 4))
+
+# Metrics Settings (0 disables: Prometheus text endpoint port, seconds between stats log lines)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_DUMP_INTERVAL = float(os.getenv('METRICS_DUMP_INTERVAL', 0))
+
+# API Server Settings (0 workers serves everything from a single process; reload interval in seconds)
+API_HOST = os.getenv('API_HOST', '127.0.0.1')
+API_PORT = int(os.getenv('API_PORT', 8000))
+API_WORKERS = int(os.getenv('API_WORKERS', 2))
+API_RELOAD_INTERVAL = float(os.getenv('API_RELOAD_INTERVAL', 2))
 
 # Debug Mode
 DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
@@ -51,10 +132,21 @@ def create_directories():
         logger.error(f"Error creating directories: {e}")
         raise
 
-# Create directories on module import
-create_directories()
+_setup_done = False
 
-# Log configuration details
-logger.info(f"Database URL: {DATABASE_URL}")
-logger.info(f"Vector Store Path: {VECTOR_STORE_PATH}")
-logger.info(f"Debug Mode: {DEBUG}")
\ No newline at end of file
+def setup(level: int = logging.INFO):
+    """Configure logging, create the data directories and log the configuration
+    
+    Called once by each entry point (UI, CLI scripts, API workers) rather than on import, so
+    importing this module stays free of side effects. Later calls do nothing.
+    """
+    global _setup_done
+    if _setup_done:
+        return
+    _setup_done = True
+    logging.basicConfig(level=level)
+    create_directories()
+    logger.info(f"Database URL: {DATABASE_URL}")
+    logger.info(f"Vector Store Path: {VECTOR_STORE_PATH}")
+    logger.info(f"FAISS Index Type: {FAISS_INDEX_TYPE}")
+    logger.info(f"Debug Mode: {DEBUG}")
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+files.py
+Crash-safe file writing helpers
+"""
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+def fsync_dir(path: Path) -> None:
+    """Flush directory entries so renames survive a crash (no-op where unsupported)"""
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Write a file via temp file + fsync + rename so readers never see a partial write"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(path.parent)
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Exclusive lock on a lock file, held across processes until the block exits"""
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after about 10 seconds; keep waiting like flock does
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,22 @@
+"""
+hashing.py
+Content hashes used for de-duplication
+"""
+import hashlib
+from pathlib import Path
+
+def file_hash(path: Path, block_size: int = 1 << 20) -> str:
+    """SHA-256 hex digest of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+def bytes_hash(data: bytes) -> str:
+    """SHA-256 hex digest of in-memory bytes, matching file_hash"""
+    return hashlib.sha256(data).hexdigest()
+
+def chunk_hash(text: str) -> int:
+    """64-bit hash of a chunk's text, stored compactly as int64; callers confirm hits by comparing text"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
@@ -0,0 +1,208 @@
+"""
+metrics.py
+Process-wide timing spans and counters, exposed as Prometheus text or a periodic log line
+"""
+import bisect
+import threading
+import time
+import logging
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "documentmentor"
+# Histogram bucket upper bounds in seconds, from sub-millisecond lookups to slow LLM calls
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class _Histogram:
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the last finite bound if it overflowed)"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+class _Span:
+    __slots__ = ("registry", "name", "start")
+
+    def __init__(self, registry: "Metrics", name: str):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+
+class Metrics:
+    """Thread-safe registry of span durations (histograms), counters and gauge collectors
+
+    Spans cost two perf_counter calls and a bucket increment, so they can wrap every step of a
+    query. Gauges such as index size or cache hit counts are read from their owners through
+    collectors when the metrics are rendered, instead of being pushed on every request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, _Histogram] = {}
+        self._counters: Dict[str, float] = {}
+        self._collectors: Dict[str, Callable[[], Optional[Dict[str, float]]]] = {}
+
+    def span(self, name: str) -> _Span:
+        """Context manager recording the duration of its block under `name`"""
+        return _Span(self, name)
+
+    def observe(self, name: str, seconds: float) -> None:
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = _Histogram()
+            histogram.counts[index] += 1
+            histogram.count += 1
+            histogram.total += seconds
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def register_collector(self, name: str, collector: Callable[[], Dict[str, float]]) -> None:
+        """Register a callable returning {sample: value} gauges, replacing any previous one with this name
+
+        Bound methods are held weakly, so registering does not keep a discarded VectorStore alive.
+        """
+        if hasattr(collector, "__self__"):
+            method = weakref.WeakMethod(collector)
+            collector = lambda: method()() if method() is not None else None
+        with self._lock:
+            self._collectors[name] = collector
+
+    def _collect(self) -> Dict[str, float]:
+        with self._lock:
+            collectors = list(self._collectors.items())
+        gauges = {}
+        for name, collector in collectors:
+            try:
+                values = collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector {name} failed: {e}")
+                continue
+            if values is None:
+                with self._lock:
+                    if self._collectors.get(name) is collector:
+                        del self._collectors[name]
+                continue
+            gauges.update(values)
+        return gauges
+
+    def snapshot(self) -> dict:
+        """Span statistics (count, mean/p50/p95 ms), counters and gauges as plain data"""
+        with self._lock:
+            spans = {
+                name: {
+                    "count": h.count,
+                    "mean_ms": h.total / h.count * 1000 if h.count else 0.0,
+                    "p50_ms": h.quantile(0.5) * 1000,
+                    "p95_ms": h.quantile(0.95) * 1000,
+                }
+                for name, h in self._histograms.items()
+            }
+            counters = dict(self._counters)
+        return {"spans": spans, "counters": counters, "gauges": self._collect()}
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            histograms = [(name, list(h.counts), h.count, h.total) for name, h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+        if histograms:
+            lines.append(f"# TYPE {PREFIX}_span_seconds histogram")
+        for name, counts, count, total in histograms:
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, counts):
+                cumulative += bucket
+                lines.append(f'{PREFIX}_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{PREFIX}_span_seconds_bucket{{span="{name}",le="+Inf"}} {count}')
+            lines.append(f'{PREFIX}_span_seconds_sum{{span="{name}"}} {total}')
+            lines.append(f'{PREFIX}_span_seconds_count{{span="{name}"}} {count}')
+        for name, value in counters:
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            lines.append(f"{PREFIX}_{name}_total {value}")
+        typed = set()
+        for sample, value in sorted(self._collect().items()):
+            metric = sample.split("{", 1)[0]
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {PREFIX}_{metric} gauge")
+            lines.append(f"{PREFIX}_{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """One-line digest of the spans, for the periodic stats dump"""
+        spans = self.snapshot()["spans"]
+        return ", ".join(
+            f"{name} n={s['count']} mean={s['mean_ms']:.2f}ms p95<={s['p95_ms']:.1f}ms"
+            for name, s in sorted(spans.items())
+        ) or "no spans recorded"
+
+metrics = Metrics()
+
+_started: Dict[str, object] = {}
+_start_lock = threading.Lock()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would otherwise flood stderr
+        pass
+
+def _dump_loop(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        logger.info(f"Stats: {metrics.summary()}")
+
+def start(port: int = 0, dump_interval: float = 0) -> None:
+    """Start the /metrics HTTP endpoint (port > 0) and the periodic stats dump (interval > 0)
+
+    Safe to call repeatedly (Streamlit reruns its script on every interaction); only the first
+    call for each feature starts anything.
+    """
+    with _start_lock:
+        if port > 0 and "server" not in _started:
+            try:
+                server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                logger.warning(f"Could not start the metrics endpoint on port {port}: {e}")
+                _started["server"] = None
+            else:
+                threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+                _started["server"] = server
+                logger.info(f"Metrics available at http://0.0.0.0:{port}/metrics")
+        if dump_interval > 0 and "dump" not in _started:
+            threading.Thread(target=_dump_loop, args=(dump_interval,), daemon=True, name="metrics-dump").start()
+            _started["dump"] = True
@@ -0,0 +1,60 @@
+"""
+rwlock.py
+Readers-writer lock for state shared by concurrent searches and ingestion
+"""
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+class RWLock:
+    """Many concurrent readers or one writer, with writers preferred
+
+    Once a writer is waiting, new readers wait behind it, so a steady stream of searches cannot
+    starve ingestion. The write lock is reentrant for its owner thread, which may also read.
+    Readers must not nest: a thread holding the read lock must neither take it again nor wait on
+    another thread that needs it, or it can deadlock behind a waiting writer.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writers_waiting = 0
+        self._writer = None
+        self._writer_depth = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        if self._writer == threading.get_ident():
+            yield
+            return
+        with self._cond:
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                self._writers_waiting += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._writers_waiting -= 1
+                self._writer = me
+            self._writer_depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._cond.notify_all()